@@ -0,0 +1,90 @@
+import os
+import random
+import argparse
+
+# Synthetic .m5r files for benchmarking. Every block prints one line so runs
+# can be checked, and is padded with comments up to the requested size.
+# Files are written block by block, so multi-hundred-MB corpora never have
+# to fit in memory.
+
+LANGS = ["py", "js", "php", "css", "sh", "cs", "cpp"]
+
+BODIES = {
+    "py": ('print("py block {n}")', "# "),
+    "js": ('console.log("js block {n}");', "// "),
+    "php": ('echo "php block {n}\\n";', "// "),
+    "css": (".block-{n} {{ color: #ffe257; }}", "/* */ "),
+    "sh": ('echo "sh block {n}"', "# "),
+    "cs": ('Console.WriteLine("cs block {n}");', "// "),
+    "cpp": ('cout << "cpp block {n}" << endl;', "// "),
+}
+
+def block_text(lang, n, size):
+    statement, comment = BODIES[lang]
+    body = statement.format(n=n) + "\n"
+    filler = comment + "x" * 72 + "\n"
+    if len(body) < size:
+        repeats, rest = divmod(size - len(body), len(filler))
+        body += filler * repeats + (comment + "x" * max(rest - len(comment) - 1, 0) + "\n" if rest else "")
+    return f"<?{lang}\n{body}?>\n"
+
+def plan_blocks(counts, order="mixed", seed=0):
+    """Languages of the blocks in file order: "grouped" keeps each language
+    together, "interleaved" goes round-robin, "mixed" shuffles"""
+    if order == "interleaved":
+        left = {lang: counts.get(lang, 0) for lang in LANGS}
+        langs = []
+        while any(left.values()):
+            for lang in LANGS:
+                if left[lang]:
+                    langs.append(lang)
+                    left[lang] -= 1
+        return langs
+    langs = [lang for lang in LANGS for _ in range(counts.get(lang, 0))]
+    if order == "mixed":
+        random.Random(seed).shuffle(langs)
+    return langs
+
+def generate(path, counts, block_size=256, total_size=None, order="mixed", seed=0):
+    """Write a synthetic .m5r file and return (blocks, bytes) written.
+    With total_size, block_size is stretched so the file reaches it."""
+    langs = plan_blocks(counts, order, seed)
+    if total_size and langs:
+        block_size = max(block_size, total_size // len(langs))
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for n, lang in enumerate(langs):
+            text = block_text(lang, n, block_size)
+            f.write(text)
+            written += len(text)
+    return len(langs), written
+
+def parse_size(text):
+    units = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+    text = text.strip().lower().rstrip("b")
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic .m5r corpus file")
+    parser.add_argument("output")
+    for lang in LANGS:
+        parser.add_argument(f"--{lang}", type=int, default=0, help=f"number of <?{lang} blocks")
+    parser.add_argument("--block-size", default="256", help="bytes per block, e.g. 4k")
+    parser.add_argument("--total-size", default=None, help="stretch blocks to reach this file size, e.g. 300M")
+    parser.add_argument("--order", choices=["mixed", "grouped", "interleaved"], default="mixed")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    counts = {lang: getattr(args, lang) for lang in LANGS}
+    blocks, size = generate(
+        args.output, counts,
+        block_size=parse_size(args.block_size),
+        total_size=parse_size(args.total_size) if args.total_size else None,
+        order=args.order, seed=args.seed,
+    )
+    print(f"Wrote {blocks} blocks ({size} bytes) to {os.path.abspath(args.output)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import sys
+import math
+import time
+import argparse
+import tempfile
+
+from utils import donut
+
+# Frames per second of the start-up donut: the renderer the shell used to
+# have (legacy_frame, kept here as the reference), the table-driven pure
+# Python one, the NumPy one, and replaying frames from the disk cache.
+# Rendering only, nothing is printed. Every renderer is also checked to
+# draw exactly the reference picture.
+#
+#   python -m bench.donut [--frames 36] [--width 74] [--height 28]
+
+def legacy_frame(A, B, width, height):
+    output = [' '] * (width * height)
+    zbuffer = [0] * (width * height)
+    for j in range(0, 628, 6):
+        for i in range(0, 628, 2):
+            c = math.sin(i / 100)
+            d = math.cos(j / 100)
+            e = math.sin(A)
+            f = math.sin(j / 100)
+            g = math.cos(A)
+            h = d + 2
+            D = 1 / (c * h * e + f * g + 5)
+            l = math.cos(i / 100)
+            m = math.cos(B)
+            n = math.sin(B)
+            t = c * h * g - f * e
+            x = int(width / 2 + width / 3 * D * (l * h * m - t * n))
+            y = int(height / 2 + height / 3.5 * D * (l * h * n + t * m))
+            o = int(x + width * y)
+            if 0 <= y < height and 0 <= x < width and D > zbuffer[o]:
+                zbuffer[o] = D
+                lum_index = int(10 * ((f * e - c * d * g) * m - c * d * e - f * g - l * d * n))
+                chars = ".,-~:;=!*#$@"
+                output[o] = chars[lum_index % len(chars)]
+    return [''.join(output[y * width:(y + 1) * width]) for y in range(height)]
+
+def legacy_render(count, width, height):
+    result, A, B = [], 0, 0
+    for _ in range(count):
+        result.append(legacy_frame(A, B, width, height))
+        A += 0.08
+        B += 0.03
+    return result
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Donut renderer frames per second")
+    parser.add_argument("--frames", type=int, default=36)
+    parser.add_argument("--width", type=int, default=74)
+    parser.add_argument("--height", type=int, default=28)
+    args = parser.parse_args(argv)
+    size = (args.frames, args.width, args.height)
+
+    reference, seconds = timed(legacy_render, *size)
+    rows = [("legacy (before)", seconds, True)]
+    result, seconds = timed(donut.render, *size, False)
+    rows.append(("tables, pure Python", seconds, result == reference))
+    if donut._NUMPY_AVAILABLE:
+        donut.grids()  # built once per process, like the tables
+        result, seconds = timed(donut.render, *size, True)
+        rows.append(("NumPy", seconds, result == reference))
+    else:
+        print("(NumPy not installed, skipping its renderer)")
+    with tempfile.TemporaryDirectory() as cache:
+        donut._cache_file = lambda count, width, height: f"{cache}/donut-{count}-{width}x{height}.json"
+        donut.frames(*size)
+        result, seconds = timed(donut.frames, *size)
+        rows.append(("disk cache replay", seconds, result == reference))
+
+    base = rows[0][1]
+    print(f"{args.frames} frames of {args.width}x{args.height}")
+    for name, seconds, same in rows:
+        print(f"  {name:<22}{args.frames / seconds:>12.1f} fps{base / seconds:>9.1f}x"
+              f"{'' if same else '   DIFFERS from legacy'}")
+    return 0 if all(same for _, _, same in rows) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
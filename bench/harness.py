@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+from contextlib import contextmanager
+from pathlib import Path
+
+from bench.corpus import LANGS, generate, parse_size
+
+# Times the interpreter phase by phase on stub runtimes, so it runs on a
+# bare Linux box with none of the real toolchains installed:
+#   parse    - tokenizing the corpus into blocks
+#   spawn    - starting and reaping one trivial process (per-block floor)
+#   compile  - time spent in g++/csc invocations
+#   execute  - time spent running block processes
+#   assemble - joining the buffered output into the final string
+# Results are written as JSON; --compare prints the change against an
+# earlier result file.
+
+COMPILERS = ("g++", "csc")
+PHASES = ("parse", "compile", "execute", "assemble")
+
+STUB_SCRIPT = """#!/bin/sh
+# m5rcode benchmark stub for {name}
+case "$1" in
+  --version|/version) echo "{name} benchmark stub 1.0"; exit 0;;
+esac
+# The script is the last argument, options such as php's -d X come first
+script=""
+for arg; do script="$arg"; done
+if [ -n "$script" ] && [ -r "$script" ] && [ "$script" != "-" ]; then cat "$script" > /dev/null; else cat > /dev/null; fi
+echo "{name} ok"
+"""
+
+COMPILER_STUB = """#!/bin/sh
+# m5rcode benchmark stub for {name}: "builds" a binary that just prints
+case "$1" in
+  --version|/version) echo "{name} benchmark stub 1.0"; exit 0;;
+esac
+out=""
+while [ $# -gt 0 ]; do
+  case "$1" in
+    -o) out="$2"; shift;;
+    /out:*) out="${{1#/out:}}";;
+  esac
+  shift
+done
+[ -n "$out" ] || exit 0
+printf '#!/bin/sh\\necho "binary ok"\\n' > "$out"
+chmod +x "$out"
+"""
+
+def make_stubs(directory):
+    for name in ("python", "node", "php", "bash"):
+        path = os.path.join(directory, name)
+        with open(path, "w") as f:
+            f.write(STUB_SCRIPT.format(name=name))
+        os.chmod(path, 0o755)
+    for name in COMPILERS:
+        path = os.path.join(directory, name)
+        with open(path, "w") as f:
+            f.write(COMPILER_STUB.format(name=name))
+        os.chmod(path, 0o755)
+
+class PhaseTimer:
+    def __init__(self):
+        self.totals = {}
+        self.counts = {}
+
+    def add(self, phase, seconds):
+        self.totals[phase] = self.totals.get(phase, 0.0) + seconds
+        self.counts[phase] = self.counts.get(phase, 0) + 1
+
+    @contextmanager
+    def time(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start)
+
+@contextmanager
+def patched(module, name, replacement):
+    original = getattr(module, name)
+    setattr(module, name, replacement)
+    try:
+        yield original
+    finally:
+        setattr(module, name, original)
+
+def timed_process_calls(interp, timer):
+    """Wrap the interpreter's process helpers so each call is booked as
+    compile or execute time"""
+    original_safe_run = interp.safe_run
+    original_stream_run = interp.stream_run
+
+    def phase_of(cmd):
+        return "compile" if os.path.basename(cmd[0]) in COMPILERS else "execute"
+
+    def detached(kwargs):
+        # A stub reading stdin must not wait on the terminal (or whatever
+        # the harness was started with)
+        if "input" not in kwargs and "popen" not in kwargs:
+            kwargs.setdefault("stdin", subprocess.DEVNULL)
+        return kwargs
+
+    def safe_run(cmd, *args, **kwargs):
+        with timer.time(phase_of(cmd)):
+            return original_safe_run(cmd, *args, **detached(kwargs))
+
+    def stream_run(cmd, *args, **kwargs):
+        with timer.time(phase_of(cmd)):
+            return original_stream_run(cmd, *args, **detached(kwargs))
+
+    return safe_run, stream_run
+
+def measure_spawn(stub_dir, samples=20):
+    stub = os.path.join(stub_dir, "bash")
+    start = time.perf_counter()
+    for _ in range(samples):
+        subprocess.run([stub, "--version"], capture_output=True)
+    return (time.perf_counter() - start) / samples
+
+def bench_file(interp, path, repeat):
+    from utils.block_plan import tokenize
+
+    data = Path(path).read_bytes()
+    runs = []
+    for _ in range(repeat):
+        timer = PhaseTimer()
+        with timer.time("parse"):
+            blocks = tokenize(data)
+        safe_run, stream_run = timed_process_calls(interp, timer)
+        sink = interp.BufferSink()
+        start = time.perf_counter()
+        with patched(interp, "safe_run", safe_run), patched(interp, "stream_run", stream_run):
+            interp.run_blocks(data, blocks, sink)
+        with timer.time("assemble"):
+            output = sink.getvalue()
+        wall = time.perf_counter() - start + timer.totals["parse"]
+        runs.append((wall, timer, len(output)))
+
+    def summary(run):
+        wall, timer, out_bytes = run
+        return {
+            "wall": wall,
+            "output_bytes": out_bytes,
+            "phases": {phase: timer.totals.get(phase, 0.0) for phase in PHASES},
+            "calls": dict(timer.counts),
+        }
+
+    by_lang = {}
+    for block in blocks:
+        by_lang[block.lang] = by_lang.get(block.lang, 0) + 1
+    # The first repetition runs on empty caches; the best of the rest shows
+    # what a repeat run of an unchanged file costs
+    return {
+        "corpus": os.path.basename(path),
+        "bytes": len(data),
+        "blocks": len(blocks),
+        "blocks_by_lang": by_lang,
+        "cold": summary(runs[0]),
+        "warm": summary(min(runs[1:], key=lambda r: r[0])) if len(runs) > 1 else None,
+    }
+
+def compare(current, previous_path):
+    previous = json.loads(Path(previous_path).read_text())
+    old = {r["corpus"]: r for r in previous.get("results", [])}
+    print(f"Compared with {previous_path} (m5rcode {previous.get('version', '?')}):")
+    for result in current["results"]:
+        before = old.get(result["corpus"])
+        if before is None:
+            continue
+        for state in ("cold", "warm"):
+            now_run, then_run = result.get(state), before.get(state)
+            if not now_run or not then_run:
+                continue
+            print(f"  {result['corpus']} ({state})")
+            for phase in ("wall",) + PHASES:
+                now = now_run["wall"] if phase == "wall" else now_run["phases"][phase]
+                then = then_run["wall"] if phase == "wall" else then_run["phases"].get(phase, 0.0)
+                change = f"{(now - then) / then * 100:+.1f}%" if then else "n/a"
+                print(f"    {phase:<9} {then:9.4f}s -> {now:9.4f}s  {change}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the m5rcode interpreter on stub runtimes")
+    parser.add_argument("corpus", nargs="*", help=".m5r files to run (default: generate one)")
+    for lang in LANGS:
+        parser.add_argument(f"--{lang}", type=int, default=20, help=f"<?{lang} blocks in the generated corpus")
+    parser.add_argument("--block-size", default="256")
+    parser.add_argument("--total-size", default=None)
+    parser.add_argument("--order", choices=["mixed", "grouped", "interleaved"], default="mixed")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--real-runtimes", action="store_true", help="use the toolchains on PATH instead of stubs")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", metavar="OLD_JSON")
+    args = parser.parse_args(argv)
+
+    work = tempfile.mkdtemp(prefix="m5r-bench-")
+    try:
+        # Fresh caches so every benchmark starts cold and leaves nothing behind
+        os.environ["M5R_CACHE_DIR"] = os.path.join(work, "cache")
+        stub_dir = os.path.join(work, "stubs")
+        os.makedirs(stub_dir)
+        make_stubs(stub_dir)
+        if not args.real_runtimes:
+            os.environ["PATH"] = stub_dir + os.pathsep + os.environ.get("PATH", "")
+
+        corpora = args.corpus
+        if not corpora:
+            path = os.path.join(work, "corpus.m5r")
+            generate(
+                path, {lang: getattr(args, lang) for lang in LANGS},
+                block_size=parse_size(args.block_size),
+                total_size=parse_size(args.total_size) if args.total_size else None,
+                order=args.order,
+            )
+            corpora = [path]
+
+        import m5r_interpreter as interp
+
+        version_file = Path(__file__).resolve().parents[1] / "version.txt"
+        result = {
+            "version": version_file.read_text().strip() if version_file.exists() else "unknown",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.time(),
+            "stub_runtimes": not args.real_runtimes,
+            "spawn": measure_spawn(stub_dir),
+            "results": [bench_file(interp, path, args.repeat) for path in corpora],
+        }
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    Path(args.out).write_text(json.dumps(result, indent=2))
+    for r in result["results"]:
+        print(f"{r['corpus']}: {r['blocks']} blocks, {r['bytes']} bytes")
+        for state in ("cold", "warm"):
+            if r[state]:
+                phases = "  ".join(f"{k}={v:.4f}s" for k, v in r[state]["phases"].items())
+                print(f"  {state}: wall={r[state]['wall']:.4f}s  {phases}")
+    print(f"spawn floor: {result['spawn'] * 1000:.2f} ms/process")
+    print(f"Results written to {args.out}")
+    if args.compare:
+        compare(result, args.compare)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+# Startup regression check for the shell: starts m5rshell.py with
+# animations off as far as its first prompt (--startup-profile), several
+# times, and fails when the median time to first prompt is over budget or
+# a module that should load on first use was imported on the way there.
+#
+#   python -m bench.startup [--runs 7] [--budget-ms 400]
+
+REPO = Path(__file__).resolve().parent.parent
+# Only ever needed by a command, never by the prompt. pyfiglet only draws
+# the banner on a cold render cache, which the warm-up run fills.
+LAZY_MODULES = ("requests", "bs4", "psutil", "m5r_interpreter", "commands", "pyfiglet")
+
+def start_once(home):
+    env = dict(os.environ, HOME=home, M5R_ANIMATIONS="0")
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, str(REPO / "m5rshell.py"), "--startup-profile=json", "--no-animations"],
+        cwd=REPO, env=env, capture_output=True, text=True, timeout=60,
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode:
+        raise RuntimeError(f"m5rshell exited with {proc.returncode}:\n{proc.stderr}")
+    # The banner comes first, the profile is the last line
+    profile = json.loads(proc.stdout.strip().splitlines()[-1])
+    return wall, profile
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check m5rshell's time to first prompt")
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--budget-ms", type=float, default=400,
+                        help="median process start to first prompt, interpreter start-up included")
+    args = parser.parse_args(argv)
+
+    walls, phases, eager = [], {}, set()
+    with tempfile.TemporaryDirectory(prefix="m5r-startup-") as home:
+        start_once(home)  # warm the page cache and __pycache__
+        for _ in range(args.runs):
+            wall, profile = start_once(home)
+            walls.append(wall)
+            for phase in profile["phases"]:
+                phases.setdefault(phase["name"], []).append(phase["seconds"])
+            for item in profile["imports"]:
+                if item["module"].split(".")[0] in LAZY_MODULES:
+                    eager.add(item["module"])
+
+    median = statistics.median(walls)
+    print(f"time to first prompt: median {median * 1000:.1f} ms, "
+          f"min {min(walls) * 1000:.1f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    for name, values in phases.items():
+        print(f"  {name:<28}{statistics.median(values) * 1000:>9.1f} ms")
+
+    failed = False
+    if median * 1000 > args.budget_ms:
+        print(f"FAIL: over budget by {median * 1000 - args.budget_ms:.1f} ms")
+        failed = True
+    if eager:
+        print(f"FAIL: imported before the first prompt: {', '.join(sorted(eager))}")
+        failed = True
+    if not failed:
+        print("ok")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
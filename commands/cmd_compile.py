@@ -0,0 +1,35 @@
+import os
+import time
+from colorama import Fore, Style
+
+import m5r_interpreter
+from utils.bundle import Bundle
+
+class CompileCommand:
+    """compile <file>  build <file>.m5rc: blocks parsed once, C++/C# blocks
+    compiled ahead of time. 'run <file>.m5rc' runs it."""
+
+    def __init__(self, base_dir, filename):
+        if not filename.endswith(".m5r"):
+            filename += ".m5r"
+        self.path = os.path.join(base_dir, filename)
+
+    def run(self):
+        if not os.path.exists(self.path):
+            print(Fore.RED + f"Error: {self.path} not found.")
+            return
+        start = time.perf_counter()
+        out_path, errors = m5r_interpreter.compile_bundle(self.path)
+        seconds = time.perf_counter() - start
+        for index, lang, err in errors:
+            print(Fore.RED + f"Block {index + 1} ({lang}) did not compile:")
+            print(Fore.RED + err.rstrip())
+        bundle = Bundle(out_path)
+        try:
+            blocks = bundle.manifest["blocks"]
+            prebuilt = sum("binary" in b for b in blocks)
+        finally:
+            bundle.close()
+        print(Fore.GREEN + f"Compiled: {out_path} " + Style.RESET_ALL +
+              Fore.LIGHTBLACK_EX + f"({len(blocks)} blocks, {prebuilt} prebuilt, "
+              f"{os.path.getsize(out_path) / 1024:.0f} KB, {seconds:.2f}s)")
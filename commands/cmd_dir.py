@@ -1,26 +1,29 @@
 import os
 from colorama import Fore, Style
-import re
 
-def strip_ansi(text):
-    return re.sub(r'\x1b\[[0-9;]*m', '', text)
+from utils import render
 
 class DirCommand:
     def __init__(self, cwd, target):
         self.cwd = cwd
         self.target = target if target else cwd
 
+    def _error_box(self, message, width):
+        frame = render.Frame()
+        box = render.Box(frame, width - 2, Fore.RED)
+        box.top()
+        box.centered(message)
+        box.bottom()
+        frame.flush()
+
     def run(self):
         path = os.path.abspath(os.path.join(self.cwd, self.target))
         box_min = 60
 
         if not os.path.exists(path):
             # Error box
-            width = max(box_min, len(f"No such file or directory: {self.target}") + 10)
-            print(Fore.RED + "╔" + "═" * (width - 2) + "╗")
             error_msg = f"No such file or directory: {self.target}"
-            print(Fore.RED + "║" + error_msg.center(width - 2) + "║")
-            print(Fore.RED + "╚" + "═" * (width - 2) + "╝" + Style.RESET_ALL)
+            self._error_box(error_msg, max(box_min, render.width(error_msg) + 10))
             return
 
         if os.path.isfile(path):
@@ -34,20 +37,22 @@ class DirCommand:
                 size_str = f"{file_size} B"
             
             width = max(box_min, len(self.target) + 20)
-            print(Fore.MAGENTA + "╔" + "═" * (width - 2) + "╗")
+            frame = render.Frame()
+            box = render.Box(frame, width - 2, Fore.MAGENTA)
+            box.top()
             title = "File Information"
-            print(Fore.MAGENTA + "║" + Fore.CYAN + Style.BRIGHT + title.center(width - 2) + Fore.MAGENTA + "║")
-            print(Fore.MAGENTA + "╟" + "─" * (width - 2) + "╢")
+            box.centered(title, Fore.CYAN + Style.BRIGHT)
+            box.rule()
             
             name_line = f"Name: {Fore.LIGHTWHITE_EX}{self.target}{Style.RESET_ALL}"
             size_line = f"Size: {Fore.LIGHTWHITE_EX}{size_str}{Style.RESET_ALL}"
             type_line = f"Type: {Fore.LIGHTWHITE_EX}File{Style.RESET_ALL}"
             
             for line in [name_line, size_line, type_line]:
-                pad = " " * (width - 2 - len(strip_ansi(line)))
-                print(Fore.MAGENTA + "║" + line + pad + Fore.MAGENTA + "║")
+                box.row(line)
             
-            print(Fore.MAGENTA + "╚" + "═" * (width - 2) + "╝" + Style.RESET_ALL)
+            box.bottom()
+            frame.flush()
             return
 
         # Directory listing
@@ -56,13 +61,16 @@ class DirCommand:
             if not items:
                 # Empty directory
                 width = box_min
-                print(Fore.MAGENTA + "╔" + "═" * (width - 2) + "╗")
+                frame = render.Frame()
+                box = render.Box(frame, width - 2, Fore.MAGENTA)
+                box.top()
                 title = f"Directory: {os.path.basename(path) or 'Root'}"
-                print(Fore.MAGENTA + "║" + Fore.CYAN + Style.BRIGHT + title.center(width - 2) + Fore.MAGENTA + "║")
-                print(Fore.MAGENTA + "╟" + "─" * (width - 2) + "╢")
+                box.centered(title, Fore.CYAN + Style.BRIGHT)
+                box.rule()
                 empty_msg = "Directory is empty"
-                print(Fore.MAGENTA + "║" + Fore.YELLOW + empty_msg.center(width - 2) + Fore.MAGENTA + "║")
-                print(Fore.MAGENTA + "╚" + "═" * (width - 2) + "╝" + Style.RESET_ALL)
+                box.centered(empty_msg, Fore.YELLOW)
+                box.bottom()
+                frame.flush()
                 return
 
             # Calculate columns for nice layout
@@ -71,6 +79,8 @@ class DirCommand:
             size_col = 15
             total_width = name_col + type_col + size_col + 6  # spaces + borders
             width = max(box_min, total_width)
+            frame = render.Frame()
+            box = render.Box(frame, width - 2, Fore.MAGENTA)
 
             # Separate files and directories
             dirs = []
@@ -93,10 +103,10 @@ class DirCommand:
                     files.append((item, size_str))
 
             # Header
-            print(Fore.MAGENTA + "╔" + "═" * (width - 2) + "╗")
+            box.top()
             title = f"Directory: {os.path.basename(path) or 'Root'}"
-            print(Fore.MAGENTA + "║" + Fore.CYAN + Style.BRIGHT + title.center(width - 2) + Fore.MAGENTA + "║")
-            print(Fore.MAGENTA + "╟" + "─" * (width - 2) + "╢")
+            box.centered(title, Fore.CYAN + Style.BRIGHT)
+            box.rule()
 
             # Column headers
             header = (
@@ -104,9 +114,8 @@ class DirCommand:
                 f"{'Name':<{name_col}} {'Type':<{type_col}} {'Size':<{size_col}}" +
                 Style.RESET_ALL
             )
-            pad = " " * (width - 2 - len(strip_ansi(header)))
-            print(Fore.MAGENTA + "║" + header + pad + Fore.MAGENTA + "║")
-            print(Fore.MAGENTA + "╟" + "─" * (width - 2) + "╢")
+            box.row(header)
+            box.rule()
 
             # List directories first
             for dirname in dirs:
@@ -115,9 +124,8 @@ class DirCommand:
                 type_colored = f"{Fore.LIGHTCYAN_EX}Directory{Style.RESET_ALL}"
                 size_colored = f"{Style.DIM}-{Style.RESET_ALL}"
                 
-                row = f"{name_colored} {type_colored:<{type_col}} {size_colored:<{size_col}}"
-                pad = " " * (width - 2 - len(strip_ansi(row)))
-                print(Fore.MAGENTA + "║" + row + pad + Fore.MAGENTA + "║")
+                row = f"{name_colored} {render.fill(type_colored, type_col)} {size_colored}"
+                box.row(row)
 
             # List files
             for filename, file_size in files:
@@ -146,18 +154,14 @@ class DirCommand:
                 size_colored = f"{Style.DIM}{Fore.LIGHTWHITE_EX}{file_size:<{size_col}}{Style.RESET_ALL}"
                 
                 row = f"{name_colored} {type_colored} {size_colored}"
-                pad = " " * (width - 2 - len(strip_ansi(row)))
-                print(Fore.MAGENTA + "║" + row + pad + Fore.MAGENTA + "║")
+                box.row(row)
 
             # Footer with count
-            print(Fore.MAGENTA + "╟" + "─" * (width - 2) + "╢")
+            box.rule()
             count_msg = f"{len(dirs)} directories, {len(files)} files"
-            print(Fore.MAGENTA + "║" + Fore.LIGHTBLACK_EX + Style.DIM + count_msg.center(width - 2) + Fore.MAGENTA + "║")
-            print(Fore.MAGENTA + "╚" + "═" * (width - 2) + "╝" + Style.RESET_ALL)
+            box.centered(count_msg, Fore.LIGHTBLACK_EX + Style.DIM)
+            box.bottom()
+            frame.flush()
 
         except PermissionError:
-            width = box_min
-            print(Fore.RED + "╔" + "═" * (width - 2) + "╗")
-            error_msg = "Access denied"
-            print(Fore.RED + "║" + error_msg.center(width - 2) + "║")
-            print(Fore.RED + "╚" + "═" * (width - 2) + "╝" + Style.RESET_ALL)
+            self._error_box("Access denied", box_min)
@@ -1,12 +1,12 @@
 from colorama import Fore, Style
 import time
-import os
-import sys
+
+from utils import render
 
 class ExitCommand:
     def shutdown_animation(self):
-        # Clear screen for clean shutdown
-        os.system('cls' if os.name == 'nt' else 'clear')
+        # Clear screen for clean shutdown, header in the same write
+        header = render.Frame(clear=True)
         
         # Shutdown sequence messages
         shutdown_msgs = [
@@ -19,35 +19,36 @@ class ExitCommand:
             "Thank you for using m5rcode shell!"
         ]
         
-        print(Fore.LIGHTBLACK_EX + "m5rOS Shutdown Sequence" + Style.RESET_ALL)
-        print(Fore.LIGHTBLACK_EX + "=" * 25 + Style.RESET_ALL)
+        header.line(Fore.LIGHTBLACK_EX + "m5rOS Shutdown Sequence" + Style.RESET_ALL)
+        header.line(Fore.LIGHTBLACK_EX + "=" * 25 + Style.RESET_ALL)
+        header.flush()
         
         for i, msg in enumerate(shutdown_msgs):
             time.sleep(0.3)
             if i == len(shutdown_msgs) - 1:
                 # Last message in cyan
-                print(Fore.CYAN + Style.BRIGHT + f"[  OK  ] {msg}" + Style.RESET_ALL)
+                render.write(Fore.CYAN + Style.BRIGHT + f"[  OK  ] {msg}" + Style.RESET_ALL + "\n")
             else:
                 # Regular messages in white/grey
                 color = Fore.WHITE if i % 2 == 0 else Fore.LIGHTBLACK_EX
-                print(color + f"[  OK  ] {msg}" + Style.RESET_ALL)
+                render.write(color + f"[  OK  ] {msg}" + Style.RESET_ALL + "\n")
         
         time.sleep(0.5)
         
         # Animated "powering down" effect
-        print()
-        sys.stdout.write(Fore.LIGHTMAGENTA_EX + "Powering down")
+        render.write("\n" + Fore.LIGHTMAGENTA_EX + "Powering down")
         for _ in range(6):
             time.sleep(0.2)
-            sys.stdout.write(".")
-            sys.stdout.flush()
+            render.write(".")
         
-        print(Style.RESET_ALL)
+        render.write(Style.RESET_ALL + "\n")
         time.sleep(0.3)
         
         # Final goodbye box
         box_width = 50
-        print(Fore.MAGENTA + "╔" + "═" * (box_width - 2) + "╗")
+        frame = render.Frame()
+        box = render.Box(frame, box_width - 2, Fore.MAGENTA)
+        box.top()
         
         goodbye_lines = [
             "m5rcode shell session ended",
@@ -57,14 +58,11 @@ class ExitCommand:
         ]
         
         for line in goodbye_lines:
-            if line == "":
-                print(Fore.MAGENTA + "║" + " " * (box_width - 2) + "║")
-            else:
-                color = Fore.CYAN if "m5rcode" in line else Fore.LIGHTWHITE_EX
-                centered = color + line.center(box_width - 2) + Style.RESET_ALL
-                print(Fore.MAGENTA + "║" + centered + Fore.MAGENTA + "║")
+            color = Fore.CYAN if "m5rcode" in line else Fore.LIGHTWHITE_EX
+            box.centered(line, color)
         
-        print(Fore.MAGENTA + "╚" + "═" * (box_width - 2) + "╝" + Style.RESET_ALL)
+        box.bottom()
+        frame.flush()
         time.sleep(1)
 
     def run(self):
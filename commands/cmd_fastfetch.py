@@ -1,19 +1,18 @@
 import platform
-import re
 import datetime
 from pathlib import Path
 from colorama import Fore, Style
 from pyfiglet import Figlet
 
+from utils import toolchains
+from utils import render
+
 try:
     import psutil
     _PSUTIL_AVAILABLE = True
 except ImportError:
     _PSUTIL_AVAILABLE = False
 
-def strip_ansi(text):
-    return re.sub(r'\x1b\[[0-9;]*m', '', text)
-
 class FastfetchCommand:
     def _get_uptime(self):
         if not _PSUTIL_AVAILABLE:
@@ -91,8 +90,8 @@ class FastfetchCommand:
             f"{Fore.CYAN}{'Uptime:':<{LABEL_PAD}}{Style.RESET_ALL} {Fore.LIGHTWHITE_EX}{uptime_info}{Style.RESET_ALL}",
         ]
 
-        ascii_width = len(strip_ansi(ascii_m[0]))
-        content_width = max(len(strip_ansi(line)) for line in info_lines)
+        ascii_width = render.width(ascii_m[0])
+        content_width = max(render.width(line) for line in info_lines)
         sep = "   "
         sep_width = len(sep)
         total_content_width = ascii_width + sep_width + content_width
@@ -105,17 +104,30 @@ class FastfetchCommand:
         if len(info_lines_padded) < n_ascii:
             info_lines_padded += [""] * (n_ascii - len(info_lines_padded))
 
-        # Header
-        print(Fore.MAGENTA + "╔" + "═" * (box_width-2) + "╗")
+        frame = render.Frame()
+        box = render.Box(frame, box_width - 2, Fore.MAGENTA)
 
-        title = f"m5rcode Fastfetch"
-        print(Fore.MAGENTA + "║" + Fore.CYAN + title.center(box_width-2) + Fore.MAGENTA + "║")
-        print(Fore.MAGENTA + "╟" + "─" * (box_width-2) + "╢")
+        # Header
+        box.top()
+        box.centered("m5rcode Fastfetch", Fore.CYAN)
+        box.rule()
 
         # Body
         for mline, iline in zip(ascii_m, info_lines_padded):
-            line_content = (mline + sep + iline).rstrip()
-            pad = " " * (box_width - 2 - len(strip_ansi(line_content)))
-            print(Fore.MAGENTA + "║" + line_content + pad + Fore.MAGENTA + "║")
+            box.row((mline + sep + iline).rstrip())
+
+        # Toolchains, from the registry's cache (utils/toolchains.py)
+        box.rule()
+        box.centered("Toolchains", Fore.CYAN)
+        for name, tool in toolchains.registry.all().items():
+            langs = "/".join(toolchains.TOOLS[name][0])
+            if tool is None:
+                line = f"  {Fore.RED}✘ {name:<8}{Style.RESET_ALL} {Fore.LIGHTBLACK_EX}{langs:<5} not found{Style.RESET_ALL}"
+            else:
+                caps = ", ".join(tool.capabilities)
+                line = (f"  {Fore.GREEN}✔ {name:<8}{Style.RESET_ALL} {Fore.LIGHTBLACK_EX}{langs:<5}{Style.RESET_ALL} "
+                        f"{Fore.LIGHTWHITE_EX}{tool.version or '?':<10}{Style.RESET_ALL} {Fore.LIGHTBLACK_EX}{caps}{Style.RESET_ALL}")
+            box.row(line)
 
-        print(Fore.MAGENTA + "╚" + "═" * (box_width-2) + "╝" + Style.RESET_ALL)
+        box.bottom()
+        frame.flush()
@@ -0,0 +1,63 @@
+import os
+import gzip
+import shlex
+import shutil
+import datetime
+import subprocess
+from colorama import Fore, Style
+
+from utils import capture
+
+class OutputCommand:
+    """output                  list saved full outputs of chatty blocks
+    output <n>              page one of them
+    output <n> save <file>  write it out uncompressed"""
+
+    def __init__(self, base_dir, arg):
+        self.base_dir = base_dir
+        self.words = arg.split()
+
+    def run(self):
+        saved = capture.spills()
+        if not self.words:
+            self._list(saved)
+            return
+        try:
+            path = saved[int(self.words[0]) - 1]
+        except (ValueError, IndexError):
+            print(Fore.RED + "Usage: output [<n> [save <file>]]  (n from the list 'output' prints)")
+            return
+        if len(self.words) >= 3 and self.words[1] == "save":
+            self._save(path, os.path.join(self.base_dir, " ".join(self.words[2:])))
+        else:
+            self._page(path)
+
+    def _list(self, saved):
+        if not saved:
+            print(Fore.YELLOW + "No saved outputs. Blocks whose output gets truncated are saved here.")
+            return
+        print(Fore.CYAN + "Saved block outputs (newest first):")
+        for i, path in enumerate(saved, 1):
+            when = datetime.datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y-%m-%d %H:%M:%S")
+            size = os.path.getsize(path) / 1024
+            print(f"  {Fore.LIGHTGREEN_EX}{i:>2}{Style.RESET_ALL}  {when}  "
+                  f"{Fore.LIGHTWHITE_EX}{os.path.basename(path)}{Style.RESET_ALL}  "
+                  f"{Fore.LIGHTBLACK_EX}({size:.0f} KB compressed){Style.RESET_ALL}")
+
+    def _save(self, path, target):
+        with gzip.open(path, "rb") as src, open(target, "wb") as dst:
+            shutil.copyfileobj(src, dst, capture.CHUNK)
+        print(Fore.GREEN + f"Saved to {target}")
+
+    def _page(self, path):
+        pager = os.environ.get("PAGER") or ("less -R" if shutil.which("less") else "more")
+        # Fed a chunk at a time, the whole output never has to fit in memory
+        proc = subprocess.Popen(shlex.split(pager, posix=os.name != "nt"), stdin=subprocess.PIPE)
+        try:
+            with gzip.open(path, "rb") as src:
+                shutil.copyfileobj(src, proc.stdin, capture.CHUNK)
+            proc.stdin.close()
+        except (BrokenPipeError, OSError):
+            # The pager was quit before the end
+            pass
+        proc.wait()
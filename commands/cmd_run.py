@@ -1,48 +1,105 @@
 import os
-import re
-import subprocess
-import tempfile
+import asyncio
 from colorama import Fore
 
+import m5r_interpreter
+from utils.block_plan import Block, load_plan, block_code
+from utils import trace
+from utils import m5rd_client
+from utils.bundle import BundleError
+
 class RunCommand:
-    def __init__(self, base_dir, filename):
-        if not filename.endswith(".m5r"):
+    def __init__(self, base_dir, filename, trace_path=None, watch=False):
+        if not filename.endswith((".m5r", ".m5rc")):
             filename += ".m5r"
         self.base_dir = base_dir
         self.path = os.path.join(base_dir, filename)
+        self.trace_path = trace_path
+        self.watch = watch
 
     def run(self):
         if not os.path.exists(self.path):
             print(Fore.RED + f"Error: {self.path} not found.")
             return
 
-        source = open(self.path, encoding="utf-8").read()
+        if self.watch:
+            self._watch()
+            return
+
+        if m5r_interpreter.is_bundle(self.path):
+            # A compiled bundle runs every block, prebuilt ones included
+            try:
+                m5r_interpreter.interpret_file(self.path, stream=True)
+            except BundleError as e:
+                print(Fore.RED + f"Error: {e}")
+            return
+
+        # Only this run goes into the trace, unless M5R_TRACE already
+        # records the whole session
+        owned = self.trace_path and not trace.enabled()
+        if self.trace_path:
+            trace.enable()
+        try:
+            self._run()
+        finally:
+            if self.trace_path:
+                trace.export(self.trace_path)
+                print(Fore.LIGHTBLACK_EX + f"Trace written to {self.trace_path}")
+            if owned:
+                trace.disable()
+
+    def _watch(self):
+        # Every block runs here, not just Python, so that each one can be
+        # re-run or replayed on its own
+        def on_run(executed, total, seconds):
+            print(Fore.LIGHTBLACK_EX + f"[watch] ran {executed} of {total} blocks in {seconds:.2f}s, "
+                  f"replayed {total - executed}. Waiting for changes (Ctrl+C to stop)...")
+
+        print(Fore.CYAN + f"Watching {self.path}")
+        try:
+            m5r_interpreter.watch_file(self.path, on_run=on_run)
+        except KeyboardInterrupt:
+            print(Fore.YELLOW + "\nStopped watching.")
+
+    def _run_remote(self, combined):
+        """Run on m5rd; False if it isn't running"""
+        def show(event):
+            if event["event"] == "output":
+                text = event["text"]
+                print(Fore.RED + text if event["stream"] == "stderr" else text, end="", flush=True)
+
+        # Raw output and no timeout, as when it runs here
+        done = m5rd_client.request(
+            {"op": "run", "blocks": [["py", combined]], "cwd": self.base_dir, "raw": True, "timeout": None},
+            on_event=show
+        )
+        if done is None:
+            return False
+        if done["event"] == "error":
+            print(Fore.RED + f"[m5rd] {done['error']}")
+        return True
+
+    def _run(self):
+        with trace.span("parse", path=self.path) as sp:
+            data, blocks = load_plan(self.path)
+            sp.set(bytes=len(data), blocks=len(blocks))
         # Extract only Python segments
-        py_segs = re.findall(r'<\?py(.*?)\?>', source, re.S)
+        py_segs = [block_code(data, b) for b in blocks if b.lang == "py"]
         if not py_segs:
             print(Fore.YELLOW + "No Python code found in this .m5r file.")
             return
 
-        combined = "\n".join(seg.strip() for seg in py_segs)
+        combined = "\n".join(py_segs)
 
-        # Write to a temporary .py file
-        with tempfile.NamedTemporaryFile("w", delete=False, suffix=".py") as tf:
-            tf.write(combined)
-            tmp_path = tf.name
+        if m5rd_client.DAEMON_ENABLED and not self.trace_path and self._run_remote(combined):
+            return
 
-        # Execute with python, in the project directory
-        try:
-            result = subprocess.run(
-                [ "python", tmp_path ],
-                cwd=self.base_dir,
-                capture_output=True,
-                text=True
-            )
-            if result.stdout:
-                print(result.stdout, end="")
-            if result.stderr:
-                print(Fore.RED + result.stderr, end="")
-        except FileNotFoundError:
-            print(Fore.RED + "Error: 'python' executable not found on PATH.")
-        finally:
-            os.unlink(tmp_path)
+        # One Python block of all of them, so they share their globals.
+        # The engine picks in-process, warm worker or a fresh python.
+        data = combined.encode("utf-8")
+        engine = m5r_interpreter.Engine(timeout=None)
+        result, = asyncio.run(engine.run_blocks(data, [Block(0, "py", 0, len(data), 1, "")], cwd=self.base_dir))
+        if result.stdout:
+            print(result.stdout, end="")
+        if result.stderr:
+            print(Fore.RED + result.stderr, end="")
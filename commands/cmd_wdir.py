@@ -4,8 +4,7 @@ from urllib.parse import urljoin
 from colorama import Fore, Style
 import re
 
-def strip_ansi(text):
-    return re.sub(r'\x1b\[[0-9;]*m', '', text)
+from utils import render
 
 class WdirCommand:
     def __init__(self, url):
@@ -62,33 +61,29 @@ class WdirCommand:
         table_width = sum(pad) + len(pad) + 1  # columns + spaces + box
         width = max(box_min, table_width + 2)
 
+        frame = render.Frame()
+        box = render.Box(frame, width - 2, Fore.MAGENTA)
+
         # If no files, pretty box saying so
         if not files:
-            print(Fore.MAGENTA + "╔" + "═" * (width - 2) + "╗")
-            out = "No files or directories found (maybe directory listing is disabled)."
-            out = out.center(width - 2)
-            print(Fore.MAGENTA + "║" + Fore.YELLOW + out + Fore.MAGENTA + "║")
-            print(Fore.MAGENTA + "╚" + "═" * (width - 2) + "╝" + Style.RESET_ALL)
+            box.top()
+            box.centered("No files or directories found (maybe directory listing is disabled).", Fore.YELLOW)
+            box.bottom()
+            frame.flush()
             return
 
         # Pretty header
-        print(Fore.MAGENTA + "╔" + "═" * (width - 2) + "╗")
-        title = "Web Directory Listing"
-        print(Fore.MAGENTA + "║" + Fore.CYAN + Style.BRIGHT + title.center(width - 2) + Fore.MAGENTA + "║")
-        print(Fore.MAGENTA + "╟" + "─" * (width - 2) + "╢")
+        box.top()
+        box.centered("Web Directory Listing", Fore.CYAN + Style.BRIGHT)
+        box.rule()
         # Table header
         header = (
             Fore.LIGHTMAGENTA_EX
             + f"{col_names[0]:<{pad[0]}} {col_names[1]:<{pad[1]}} {col_names[2]:<{pad[2]}} {col_names[3]:<{pad[3]}}"
             + Style.RESET_ALL
         )
-        print(
-            Fore.MAGENTA + "║"
-            + header
-            + " " * (width - 2 - len(strip_ansi(header)))
-            + Fore.MAGENTA + "║"
-        )
-        print(Fore.MAGENTA + "╟" + "─" * (width - 2) + "╢")
+        box.row(header)
+        box.rule()
 
         # Table rows
         for fname, ftype, size, modified in files:
@@ -102,12 +97,7 @@ class WdirCommand:
             typecol = f"{Style.DIM}{Fore.WHITE}{ftype:<{pad[1]}}{Style.RESET_ALL}"
             sizecol = f"{Style.DIM}{Fore.LIGHTWHITE_EX}{size:<{pad[2]}}{Style.RESET_ALL}"
             modcol = f"{Style.DIM}{Fore.LIGHTWHITE_EX}{modified:<{pad[3]}}{Style.RESET_ALL}"
-            row = f"{filecol} {typecol} {sizecol} {modcol}"
-            print(
-                Fore.MAGENTA + "║"
-                + row
-                + " " * (width - 2 - len(strip_ansi(row)))
-                + Fore.MAGENTA + "║"
-            )
+            box.row(f"{filecol} {typecol} {sizecol} {modcol}")
         # Footer
-        print(Fore.MAGENTA + "╚" + "═" * (width - 2) + "╝" + Style.RESET_ALL)
+        box.bottom()
+        frame.flush()
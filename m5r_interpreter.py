@@ -1,22 +1,175 @@
-import re
 import subprocess
-import tempfile
 import os
+import sys
+import time
+import codecs
 import shutil
+import hashlib
+import selectors
+import functools
+import contextlib
+import threading
+import weakref
+import glob
+import asyncio
+import argparse
+import concurrent.futures
+
+from utils.block_plan import Block, tokenize, load_plan, stream_plan, is_large, block_body, block_code, block_attrs
+from utils.artifact_cache import ArtifactCache, compiler_id, temp_name
+from utils.cache_dir import cache_path
+from utils.workers import WORKERS_ENABLED, get_pool
+from utils.inproc import INPROC_ENABLED, run_inprocess
+from utils.zygote import ZYGOTE_ENABLED
+from utils import zygote
+from utils.result_cache import ResultCache
+from utils.scratch import run_scratch, scratch_file, memory_script, make_scratch, remove_scratch, use_scratch
+from utils import trace
+from utils import supervisor
+from utils import channel
+from utils import toolchains
+from utils import capture
+from utils.capture import OutputCapture
+from utils.watch import FileWatcher
+from utils import m5rd_client
+from utils.bundle import Bundle, BundleError, write_bundle
+
+# Write block output through as it arrives instead of printing the whole
+# run at the end (interpret(..., stream=True) does the same per call)
+STREAM_OUTPUT = os.environ.get("M5R_STREAM") == "1"
+
+# Seconds a block may run; a run can change it (Engine(timeout=...), None
+# for no limit) and a block too, with timeout=N in its attributes
+BLOCK_TIMEOUT = 8
+
+# -------------------- RUN STATE -------------------- #
+# Per thread, so that several runs can share a process (m5rd, Engine):
+# cwd, timeout, what the running block did (BlockStatus), the RunControl
+# that can cancel it and, in an Engine run, where its processes start.
+
+_run_state = threading.local()
+
+def run_cwd():
+    """Directory the current run's blocks start in (None: the process cwd)"""
+    return getattr(_run_state, "cwd", None)
+
+def run_timeout():
+    return getattr(_run_state, "timeout", BLOCK_TIMEOUT)
+
+class BlockStatus:
+    """What happened to the running block besides its output, for Engine's
+    BlockResult. build is seconds spent compiling it."""
+
+    def __init__(self):
+        self.stage = "run"        # "compile" when a C++/C# block didn't build
+        self.timed_out = False
+        self.skipped = False
+        self.cached = False
+        self.build = 0.0
+
+def note(**fields):
+    status = getattr(_run_state, "status", None)
+    if status is not None:
+        for name, value in fields.items():
+            setattr(status, name, value)
+
+@contextlib.contextmanager
+def build_timer():
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        status = getattr(_run_state, "status", None)
+        if status is not None:
+            status.build += time.perf_counter() - start
+
+class RunCancelled(Exception):
+    """Raised in a run's thread when its RunControl cancels what it waits on"""
+
+class RunControl:
+    """Lets another thread stop a run: cancel() kills the process group of
+    the block running, cancels what the run waits on (see wait()) and no
+    further block starts. Blocks on warm workers or in process can't be
+    stopped early and run to their own timeout."""
+
+    def __init__(self):
+        self.cancelled = False
+        self._procs = set()
+        self._futures = set()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            procs, futures = list(self._procs), list(self._futures)
+        for proc in procs:
+            supervisor.kill_group(proc)
+        for future in futures:
+            future.cancel()
+
+    def wait(self, future):
+        """future.result() (a concurrent.futures.Future), or RunCancelled
+        once the run is cancelled"""
+        with self._lock:
+            if self.cancelled:
+                future.cancel()
+            self._futures.add(future)
+        try:
+            return future.result()
+        except concurrent.futures.CancelledError:
+            raise RunCancelled from None
+        finally:
+            with self._lock:
+                self._futures.discard(future)
+
+    @contextlib.contextmanager
+    def track(self, proc):
+        with self._lock:
+            self._procs.add(proc)
+            cancelled = self.cancelled
+        if cancelled:
+            supervisor.kill_group(proc)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._procs.discard(proc)
+
+def tracked(proc):
+    """Context during which the current run's RunControl can kill proc"""
+    control = getattr(_run_state, "control", None)
+    return control.track(proc) if control is not None else contextlib.nullcontext()
 
 def safe_run(cmd, timeout=8, **sub_kwargs):
+    # popen= starts the process some other way (utils/zygote.py)
+    popen = sub_kwargs.pop("popen", subprocess.Popen)
+    stdin_data = sub_kwargs.pop("input", None)
+    if stdin_data is not None:
+        sub_kwargs["stdin"] = subprocess.PIPE
     try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-            **sub_kwargs
-        )
-        out = result.stdout
-        err = result.stderr
-        rc = result.returncode
+        with supervisor.admission():
+            with trace.span("spawn", cmd=cmd[0]):
+                proc = popen(
+                    cmd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    **supervisor.popen_kwargs(),
+                    **sub_kwargs
+                )
+                supervisor.apply_limits(proc)
+            supervisor.reap_group_on_exit(proc)
+            # Only the head and tail of a huge output are kept in memory,
+            # the rest spills to disk (utils/capture.py)
+            label = os.path.basename(cmd[0])
+            out_cap, err_cap = OutputCapture(label, "stdout"), OutputCapture(label, "stderr")
+            with proc, tracked(proc), trace.span("run", cmd=cmd[0]) as sp:
+                try:
+                    rc = capture.communicate(proc, stdin_data, out_cap, err_cap, timeout, supervisor.kill_group)
+                finally:
+                    out, err = out_cap.getvalue(), err_cap.getvalue()
+                sp.set(stdout_bytes=out_cap.total, stderr_bytes=err_cap.total, rc=rc)
     except subprocess.TimeoutExpired:
+        note(timed_out=True)
         return "", "[ERROR: timed out]", 1
     except FileNotFoundError:
         return "", f"[ERROR: Not installed: {cmd[0]}]", 1
@@ -25,101 +178,1297 @@ def safe_run(cmd, timeout=8, **sub_kwargs):
     else:
         return out, err, rc
 
+def _feed_stdin(pipe, text):
+    try:
+        pipe.write(text.encode("utf-8"))
+    except OSError:
+        pass
+    finally:
+        try:
+            pipe.close()
+        except OSError:
+            pass
+
+def stream_run(cmd, write, timeout=8, **sub_kwargs):
+    """Like safe_run, but hands output to write(text, stream) as it arrives
+    instead of collecting it. Returns (saw_stderr, rc)."""
+    if os.name != "posix":
+        # selectors can't wait on pipes on Windows
+        out, err, rc = safe_run(cmd, timeout=timeout, **sub_kwargs)
+        if out:
+            write(out, "stdout")
+        if err:
+            write(err, "stderr")
+        return bool(err), rc
+    with supervisor.admission():
+        return _stream_run(cmd, write, timeout, **sub_kwargs)
+
+def _stream_run(cmd, write, timeout, **sub_kwargs):
+    popen = sub_kwargs.pop("popen", subprocess.Popen)
+    stdin_data = sub_kwargs.pop("input", None)
+    if stdin_data is not None:
+        sub_kwargs["stdin"] = subprocess.PIPE
+    try:
+        with trace.span("spawn", cmd=cmd[0]):
+            proc = popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                **supervisor.popen_kwargs(),
+                **sub_kwargs
+            )
+            supervisor.apply_limits(proc)
+    except FileNotFoundError:
+        write(f"[ERROR: Not installed: {cmd[0]}]", "stderr")
+        return True, 1
+    except Exception as e:
+        write(f"[ERROR: {e}]", "stderr")
+        return True, 1
+    supervisor.reap_group_on_exit(proc)
+
+    if stdin_data is not None:
+        threading.Thread(target=_feed_stdin, args=(proc.stdin, stdin_data), daemon=True).start()
+
+    saw_stderr = False
+    counts = {"stdout": 0, "stderr": 0}
+    deadline = None if timeout is None else time.monotonic() + timeout
+    sel = selectors.DefaultSelector()
+    for pipe, name in ((proc.stdout, "stdout"), (proc.stderr, "stderr")):
+        sel.register(pipe, selectors.EVENT_READ, (name, codecs.getincrementaldecoder("utf-8")("replace")))
+    sp = trace.span("run", cmd=cmd[0])
+    try:
+        with sp, tracked(proc):
+            while sel.get_map():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    supervisor.kill_group(proc)
+                    note(timed_out=True)
+                    write("[ERROR: timed out]", "stderr")
+                    return True, 1
+                for key, _ in sel.select(remaining):
+                    name, decoder = key.data
+                    chunk = os.read(key.fd, 65536)
+                    counts[name] += len(chunk)
+                    if not chunk:
+                        sel.unregister(key.fileobj)
+                        text = decoder.decode(b"", final=True)
+                    else:
+                        text = decoder.decode(chunk)
+                    if text:
+                        saw_stderr = saw_stderr or name == "stderr"
+                        write(text, name)
+            rc = proc.wait()
+            sp.set(rc=rc)
+            return saw_stderr, rc
+    finally:
+        sp.set(stdout_bytes=counts["stdout"], stderr_bytes=counts["stderr"])
+        sel.close()
+        proc.stdout.close()
+        proc.stderr.close()
+        if proc.poll() is None:
+            supervisor.kill_group(proc)
+            proc.wait()
+
+# Sinks take every write of a run. decoration is None for a block's own
+# output and "header" or "label" for the "====== [LANG BLOCK] ======" and
+# "[LANG ERROR]" lines around it, which not every consumer shows.
+
+class BufferSink:
+    """Keeps every piece of output; interpret() prints it all at the end"""
+    streaming = False
+    block = None
+    rc = 0
+    failed = 0
+    ran = 0
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text, stream="stdout", decoration=None):
+        self.parts.append(text)
+
+    def getvalue(self):
+        return ''.join(self.parts)
+
+class StreamSink:
+    """Passes output on as soon as a block produces it. callback gets
+    (block, stream, text); without one, text goes straight to the terminal.
+    With decorations=False only the blocks' own output is passed on."""
+    streaming = True
+    block = None
+    rc = 0
+    failed = 0
+    ran = 0
+
+    def __init__(self, callback=None, decorations=True):
+        self.callback = callback
+        self.decorations = decorations
+
+    def write(self, text, stream="stdout", decoration=None):
+        if decoration and not self.decorations:
+            return
+        if self.callback:
+            self.callback(self.block, stream, text)
+        else:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+class RecordingSink:
+    """Passes writes on to another sink and keeps a copy for the result cache"""
+
+    failed = 0
+    ran = 0
+
+    def __init__(self, target):
+        self.target = target
+        self.streaming = target.streaming
+        self.rc = 0
+        self.writes = []
+
+    @property
+    def block(self):
+        return self.target.block
+
+    @block.setter
+    def block(self, block):
+        self.target.block = block
+
+    def write(self, text, stream="stdout", decoration=None):
+        self.writes.append([text, stream, decoration] if decoration else [text, stream])
+        self.target.write(text, stream, decoration)
+
+def write_header(sink, name):
+    sink.write(lang_header(name), "stdout", "header")
+
+def write_label(sink, label, stage=""):
+    sink.write(f"[{label}{stage} ERROR]\n", "stderr", "label")
+
+def report(sink, label, out, err, rc):
+    # Worker and in-process results arrive whole, bound them like the rest
+    out, err = capture.bound_text(out, label), capture.bound_text(err, label, "stderr")
+    if err.startswith("[ERROR: timed out]"):
+        note(timed_out=True)
+    sink.rc = rc
+    sink.write(out)
+    if err or rc:
+        write_label(sink, label)
+        sink.write(err, "stderr")
+
+def execute(cmd, label, sink, **sub_kwargs):
+    """Run a block's process and write its output to sink, labelling stderr
+    with "[LABEL ERROR]" the way the buffered output always has"""
+    sub_kwargs.setdefault("env", channel.child_env())
+    sub_kwargs.setdefault("cwd", run_cwd())
+    timeout = run_timeout()
+    # An Engine run starts its processes on its event loop (EngineProcesses);
+    # the zygote's own popen can't go there
+    processes = getattr(_run_state, "processes", None)
+    if processes is None or "popen" in sub_kwargs:
+        run, stream = safe_run, stream_run
+    else:
+        run, stream = processes.run, processes.stream
+    if not sink.streaming:
+        out, err, rc = run(cmd, timeout=timeout, **sub_kwargs)
+        report(sink, label, out, err, rc)
+        return
+    labelled = []
+
+    def write(text, stream):
+        if stream == "stderr" and not labelled:
+            labelled.append(True)
+            write_label(sink, label)
+        sink.write(text, stream)
+
+    limiter = capture.StreamLimiter(write, label)
+    saw_stderr, rc = stream(cmd, limiter.write, timeout=timeout, **sub_kwargs)
+    limiter.finish()
+    sink.rc = rc
+    if rc and not labelled:
+        write_label(sink, label)
+
 def lang_header(name):
     s = f"\n====== [{name.upper()} BLOCK] ======\n"
     return s
 
-def interpret(source):
-    outputs = []
-
-    # Python
-    for segment in re.findall(r'<\?py(.*?)\?>', source, re.S):
-        code = segment.strip()
-        with tempfile.NamedTemporaryFile('w', delete=False, suffix='.py') as f:
-            f.write(code)
-            path = f.name
-        out, err, rc = safe_run(['python', path])
-        outputs.append(lang_header("python") + out)
-        if err or rc:
-            outputs.append(f"[PYTHON ERROR]\n{err}")
-        os.unlink(path)
-
-    # JavaScript
-    for segment in re.findall(r'<\?js(.*?)\?>', source, re.S):
-        code = segment.strip()
-        with tempfile.NamedTemporaryFile('w', delete=False, suffix='.js') as f:
-            f.write(code)
-            path = f.name
-        out, err, rc = safe_run(['node', path])
-        outputs.append(lang_header("js") + out)
-        if err or rc:
-            outputs.append(f"[JS ERROR]\n{err}")
-        os.unlink(path)
-
-    # PHP
-    for segment in re.findall(r'<\?php(.*?)\?>', source, re.S):
-        code = segment.strip()
-        with tempfile.NamedTemporaryFile('w', delete=False, suffix='.php') as f:
-            f.write("<?php\n" + code + "\n?>")
-            path = f.name
-        out, err, rc = safe_run(['php', path])
-        outputs.append(lang_header("php") + out)
-        if err or rc:
-            outputs.append(f"[PHP ERROR]\n{err}")
-        os.unlink(path)
-
-    # CSS (just pretty print)
-    for segment in re.findall(r'<\?css(.*?)\?>', source, re.S):
-        css = segment.strip()
-        outputs.append(lang_header("css") + "[CSS Styling Loaded]\n" + css + "\n")
-
-    # Bash/Shell
-    for segment in re.findall(r'<\?sh(.*?)\?>', source, re.S):
-        code = segment.strip()
-        with tempfile.NamedTemporaryFile('w', delete=False, suffix='.sh') as f:
-            f.write(code)
-            path = f.name
-        os.chmod(path, 0o700)
-        out, err, rc = safe_run(['bash', path])
-        outputs.append(lang_header("shell") + out)
-        if err or rc:
-            outputs.append(f"[BASH ERROR]\n{err}")
-        os.unlink(path)
-
-    # C#
-    for segment in re.findall(r'<\?cs(.*?)\?>', source, re.S):
-        code = segment.strip()
-        with tempfile.NamedTemporaryFile('w', delete=False, suffix='.cs') as f:
-            f.write(f"using System; class Program {{ static void Main() {{ {code} }} }}")
-            path = f.name
-        exe_path = path.replace('.cs', '.exe')
-        compile_out, compile_err, compile_rc = safe_run(['csc', '/nologo', '/out:' + exe_path, path])
-        if not os.path.exists(exe_path) or compile_rc:
-            outputs.append(lang_header("csharp") + "[C# COMPILE ERROR]\n" + compile_err)
+PHP_CMD = ["php", "-d", "auto_prepend_file=" + channel.PHP_HELPER]
+
+# How script blocks reach their runtime: an in-memory file where the
+# runtime can open /dev/fd/N, stdin otherwise (node resolves the script's
+# real path, which a memfd doesn't have)
+SCRIPT_COMMANDS = {
+    "py": (["python"], ["python", "-"], True),
+    "js": (["node"], ["node", "-"], False),
+    "php": (PHP_CMD, PHP_CMD, True),
+    "sh": (["bash"], ["bash", "-s"], True),
+}
+
+def run_script(lang, code, label, sink):
+    file_cmd, stdin_cmd, use_memfd = SCRIPT_COMMANDS[lang]
+    with memory_script(code, use_memfd) as (path, sub_kwargs):
+        cmd = file_cmd + [path] if path else stdin_cmd
+        execute(cmd, label, sink, **sub_kwargs)
+
+def inprocess():
+    """Whether Python blocks run in process: only when the run's cwd is
+    this process's own, exec() can't have a directory of its own"""
+    if not INPROC_ENABLED:
+        return False
+    cwd = run_cwd()
+    return cwd is None or os.path.realpath(cwd) == os.path.realpath(os.getcwd())
+
+def run_python(code, sink):
+    write_header(sink, "python")
+    if inprocess():
+        report(sink, "PYTHON", *run_inprocess(code, run_timeout()))
+    elif ZYGOTE_ENABLED:
+        execute(["python"], "PYTHON", sink, popen=zygote.popen(code))
+    elif WORKERS_ENABLED:
+        report(sink, "PYTHON", *get_pool().run("py", code, run_timeout(), run_cwd()))
+    else:
+        run_script("py", code, "PYTHON", sink)
+
+def run_js(code, sink):
+    write_header(sink, "js")
+    if WORKERS_ENABLED:
+        report(sink, "JS", *get_pool().run("js", code, run_timeout(), run_cwd()))
+    else:
+        run_script("js", code, "JS", sink)
+
+def run_php(code, sink):
+    write_header(sink, "php")
+    if WORKERS_ENABLED:
+        report(sink, "PHP", *get_pool().run("php", code, run_timeout(), run_cwd()))
+    else:
+        run_script("php", "<?php\n" + code + "\n?>", "PHP", sink)
+
+# CSS (just pretty print)
+def run_css(css, sink):
+    sink.rc = 0
+    write_header(sink, "css")
+    sink.write("[CSS Styling Loaded]\n" + css + "\n")
+
+# Bash/Shell
+def run_shell(code, sink):
+    write_header(sink, "shell")
+    run_script("sh", code, "BASH", sink)
+
+CSC_FLAGS = ['/nologo']
+CPP_FLAGS = []
+
+# Compiled C#/C++ blocks are kept between runs, see utils/artifact_cache.py
+csharp_cache = ArtifactCache("csharp", suffix=".exe")
+cpp_cache = ArtifactCache("cpp")
+
+def csharp_channel_sources(codes):
+    # The channel helper is compiled in only for blocks that use it
+    if not any(channel.uses_channel(c, "cs") for c in codes):
+        return []
+    return [channel.CS_HELPER]
+
+def cpp_channel_flags(codes):
+    if not any(channel.uses_channel(c, "cpp") for c in codes):
+        return []
+    return ['-include', channel.CPP_HEADER, '-DM5R_CHANNEL_HELPER=' + channel.helper_digest(channel.CPP_HEADER)]
+
+def csharp_unit(code):
+    """(source, extra sources, cache key) a C# block compiles as"""
+    source = f"using System; class Program {{ static void Main() {{ {code} }} }}"
+    extra = csharp_channel_sources([code])
+    key = csharp_cache.key(source, "csc", CSC_FLAGS + [channel.helper_digest(p) for p in extra])
+    return source, extra, key
+
+def build_csharp(code):
+    """Compile a C# block, or take it from the cache: (exe_path, compile_err, rc)"""
+    source, extra, key = csharp_unit(code)
+    exe_path = csharp_cache.get(key)
+    if exe_path is None:
+        path = scratch_file('block.cs')
+        with trace.span("write", bytes=len(source)), open(path, 'w') as f:
+            f.write(source)
+        built_path = path.replace('.cs', '.exe')
+        with trace.span("compile", compiler="csc", source_bytes=len(source)):
+            compile_out, compile_err, compile_rc = safe_run(['csc'] + CSC_FLAGS + ['/out:' + built_path, path] + extra)
+        if not os.path.exists(built_path) or compile_rc:
+            return None, compile_err, compile_rc or 1
+        exe_path = csharp_cache.put(key, built_path)
+    return exe_path, "", 0
+
+def run_csharp(code, sink):
+    with build_timer():
+        exe_path, compile_err, compile_rc = build_csharp(code)
+    write_header(sink, "csharp")
+    if exe_path is None:
+        note(stage="compile")
+        sink.rc = compile_rc
+        write_label(sink, "C#", " COMPILE")
+        sink.write(compile_err, "stderr")
+        return
+    execute([exe_path], "C#", sink)
+
+# C++ (requires g++)
+def cpp_unit(code):
+    """(source, flags, cache key) a C++ block compiles as"""
+    source = f"#include <iostream>\nusing namespace std;\nint main() {{ {code} return 0; }}"
+    flags = CPP_FLAGS + cpp_channel_flags([code])
+    return source, flags, cpp_cache.key(source, "g++", flags)
+
+def build_cpp(code):
+    """Compile a C++ block, or take it from the cache: (exe_path, compile_err, rc)"""
+    source, flags, key = cpp_unit(code)
+    exe_path = cpp_cache.get(key)
+    if exe_path is None:
+        path = scratch_file('block.cpp')
+        with trace.span("write", bytes=len(source)), open(path, 'w') as f:
+            f.write(source)
+        built_path = path.replace('.cpp', '')
+        with trace.span("compile", compiler="g++", source_bytes=len(source)):
+            compile_out, compile_err, compile_rc = safe_run(['g++'] + flags + [path, '-o', built_path])
+        if not os.path.exists(built_path) or compile_rc:
+            return None, compile_err, compile_rc or 1
+        exe_path = cpp_cache.put(key, built_path)
+    return exe_path, "", 0
+
+def run_cpp(code, sink):
+    with build_timer():
+        exe_path, compile_err, compile_rc = build_cpp(code)
+    write_header(sink, "cpp")
+    if exe_path is None:
+        note(stage="compile")
+        sink.rc = compile_rc
+        write_label(sink, "C++", " COMPILE")
+        sink.write(compile_err, "stderr")
+        return
+    execute([exe_path], "C++", sink)
+
+# Batched C++: every <?cpp block of a run goes into one translation unit as
+# its own function, and the generated main() dispatches on argv[1]. The
+# <iostream> wrapper is compiled once into a precompiled header.
+CPP_BATCH = os.environ.get("M5R_CPP_BATCH") == "1"
+CPP_WRAPPER = "#include <iostream>\nusing namespace std;\n"
+
+def cpp_wrapper_header():
+    """Path of the wrapper header, building its .gch next to it on first use"""
+    ident = hashlib.sha256(
+        ((compiler_id("g++") or "g++") + "\0" + "\0".join(CPP_FLAGS) + "\0" + CPP_WRAPPER).encode("utf-8")
+    ).hexdigest()[:16]
+    header = os.path.join(cache_path("pch", ident), "m5r_wrapper.h")
+    # The batch -includes the header whether or not there is a .gch for it
+    if not os.path.exists(header):
+        tmp = temp_name(header)
+        with open(tmp, 'w') as f:
+            f.write(CPP_WRAPPER)
+        os.replace(tmp, header)
+    # A PCH build that failed once fails again for the same compiler and
+    # flags (they're in ident), header + ".failed" says not to retry
+    failed = header + ".failed"
+    if not os.path.exists(header + ".gch") and not os.path.exists(failed) and toolchains.has("g++", "pch"):
+        # A failed PCH build is fine, -include then just parses the header
+        with trace.span("compile", compiler="g++", pch=True):
+            _, err, rc = safe_run(['g++'] + CPP_FLAGS + ['-x', 'c++-header', header, '-o', header + '.gch'], timeout=60)
+        if rc or not os.path.exists(header + ".gch"):
+            try:
+                with open(failed, 'w') as f:
+                    f.write(err)
+            except OSError:
+                pass
+    return header
+
+def cpp_batch_source(codes):
+    parts = []
+    for i, code in enumerate(codes):
+        parts.append(f"static int m5r_block_{i}() {{ {code} return 0; }}\n")
+    parts.append("int main(int argc, char **argv) {\n    int which = 0;\n")
+    parts.append("    for (const char *p = argc > 1 ? argv[1] : \"\"; *p; ++p) which = which * 10 + (*p - '0');\n")
+    parts.append("    switch (which) {\n")
+    for i in range(len(codes)):
+        parts.append(f"    case {i}: return m5r_block_{i}();\n")
+    parts.append("    }\n    return 2;\n}\n")
+    return ''.join(parts)
+
+def build_cpp_batch(codes):
+    """Compile all C++ blocks at once. Returns the executable, or None when the
+    batch doesn't compile so blocks fall back to one build each (which also
+    keeps compile errors attached to the right block)."""
+    if not codes:
+        return None
+    header = cpp_wrapper_header()
+    flags = CPP_FLAGS + ['-include', header] + cpp_channel_flags(codes)
+    source = cpp_batch_source(codes)
+    key = cpp_cache.key(source, "g++", flags)
+    exe_path = cpp_cache.get(key)
+    if exe_path is not None:
+        return exe_path
+    # Like the PCH's, a batch that didn't compile won't next time either:
+    # its key (source, compiler and flags) + ".failed" says to go straight
+    # to the per-block builds
+    failed = os.path.join(cache_path("cpp_batch"), key + ".failed")
+    if os.path.exists(failed):
+        return None
+    path = scratch_file('batch.cpp')
+    with trace.span("write", bytes=len(source)), open(path, 'w') as f:
+        f.write(source)
+    built_path = path.replace('.cpp', '')
+    with trace.span("compile", compiler="g++", source_bytes=len(source), batch=len(codes)):
+        compile_out, compile_err, compile_rc = safe_run(['g++'] + flags + [path, '-o', built_path], timeout=60)
+    if not os.path.exists(built_path) or compile_rc:
+        try:
+            with open(failed, 'w') as f:
+                f.write(compile_err)
+        except OSError:
+            pass
+        return None
+    return cpp_cache.put(key, built_path)
+
+def run_cpp_batched(exe_path, index, code, sink):
+    # code is already compiled into exe_path
+    write_header(sink, "cpp")
+    execute([exe_path, str(index)], "C++", sink)
+
+RUNNERS = {
+    "py": run_python,
+    "js": run_js,
+    "php": run_php,
+    "css": run_css,
+    "sh": run_shell,
+    "cs": run_csharp,
+    "cpp": run_cpp,
+}
+
+# Runtime whose version goes into a [pure] block's result cache key
+RUNTIMES = {
+    "py": "python",
+    "js": "node",
+    "php": "php",
+    "css": "",
+    "sh": "bash",
+    "cs": "csc",
+    "cpp": "g++",
+}
+
+result_cache = ResultCache()
+
+def run_block(code, block, runner, sink):
+    attrs = block_attrs(block)
+    if not attrs.get("pure"):
+        runner(code, sink)
+        return
+    try:
+        ttl = int(attrs["ttl"]) if "ttl" in attrs else None
+    except ValueError:
+        ttl = None
+    key = result_cache.key(block.lang, code, RUNTIMES[block.lang])
+    record = result_cache.get(key, ttl)
+    if record is not None:
+        note(cached=True)
+        for write in record["writes"]:
+            sink.write(*write)
+        sink.rc = record["rc"]
+        return
+    recorder = RecordingSink(sink)
+    runner(code, recorder)
+    sink.rc = recorder.rc
+    # Timeouts and missing runtimes say nothing about the block itself
+    if not any(w[1] == "stderr" and w[0].startswith("[ERROR:") for w in recorder.writes):
+        result_cache.put(key, recorder.writes, recorder.rc)
+
+# Header name and error label of each block language
+LANG_NAMES = {
+    "py": ("python", "PYTHON"),
+    "js": ("js", "JS"),
+    "php": ("php", "PHP"),
+    "sh": ("shell", "BASH"),
+    "cs": ("csharp", "C#"),
+    "cpp": ("cpp", "C++"),
+}
+
+def lang_available(lang):
+    if lang == "py" and inprocess():
+        return True
+    return toolchains.available(lang)
+
+def skip_block(block, sink):
+    # Same output as a block whose runtime fails to start, without
+    # writing or compiling anything first
+    name, label = LANG_NAMES[block.lang]
+    note(skipped=True)
+    write_header(sink, name)
+    report(sink, label, "", f"[ERROR: Not installed: {toolchains.LANG_TOOLS[block.lang]}]", 1)
+
+def run_prebuilt(lang, exe_path, code, sink):
+    # code was compiled into exe_path ahead of time (.m5rc bundles)
+    name, label = LANG_NAMES[lang]
+    write_header(sink, name)
+    execute([exe_path], label, sink)
+
+def run_blocks(data, blocks, sink, cwd=None, prebuilt=None, timeout=BLOCK_TIMEOUT, around_block=None):
+    # cwd and timeout are per run rather than os.chdir() and a global so
+    # that several runs can share a process (m5rd, Engine)
+    outer = run_cwd(), run_timeout()
+    _run_state.cwd = cwd or outer[0]
+    _run_state.timeout = timeout
+    try:
+        with run_scratch() as scratch, channel.run_channel(scratch):
+            _run_blocks(data, blocks, sink, prebuilt, around_block)
+    finally:
+        _run_state.cwd, _run_state.timeout = outer
+        _run_state.status = None
+
+def block_timeout(block, default):
+    """A block's own timeout=N attribute, default without one"""
+    value = block_attrs(block).get("timeout")
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+def _run_blocks(data, blocks, sink, prebuilt=None, around_block=None):
+    # Blocks run in document order, whatever their language. blocks can be
+    # a lazy iterator (stream_plan); C++ batching needs them all up front
+    # and is skipped then. prebuilt maps block index -> executable for
+    # blocks compiled ahead of time, which need no compiler here.
+    # around_block(block) is a context manager each block runs in (Engine).
+    prebuilt = prebuilt or {}
+    timeout = run_timeout()
+    control = getattr(_run_state, "control", None)
+    available = {}
+    cpp_exe = None
+    if CPP_BATCH and not prebuilt and isinstance(blocks, list) and lang_available("cpp"):
+        cpp_exe = build_cpp_batch([block_code(data, b) for b in blocks if b.lang == "cpp"])
+    cpp_index = 0
+    for block in blocks:
+        if control and control.cancelled:
+            break
+        sink.block = block
+        trace.set_block(block)
+        _run_state.status = BlockStatus()
+        _run_state.timeout = block_timeout(block, timeout)
+        runner = RUNNERS[block.lang]
+        if block.lang == "cpp" and cpp_exe:
+            runner = functools.partial(run_cpp_batched, cpp_exe, cpp_index)
+            cpp_index += 1
+        if block.index in prebuilt:
+            runner = functools.partial(run_prebuilt, block.lang, prebuilt[block.index])
+        sink.rc = 0
+        if block.lang not in available:
+            available[block.lang] = lang_available(block.lang)
+        with around_block(block) if around_block else contextlib.nullcontext():
+            if not available[block.lang] and block.index not in prebuilt:
+                skip_block(block, sink)
+            else:
+                run_block(block_code(data, block), block, runner, sink)
+        sink.ran += 1
+        if sink.rc:
+            sink.failed += 1
+    sink.block = None
+    trace.set_block(None)
+    _run_state.timeout = timeout
+
+def make_sink(stream, callback):
+    if stream is None:
+        stream = STREAM_OUTPUT or callback is not None
+    return StreamSink(callback) if stream else BufferSink()
+
+def interpret(source, stream=None, callback=None):
+    sink = make_sink(stream, callback)
+    asyncio.run(default_engine().run(source, sink=sink))
+    if not sink.streaming:
+        print(sink.getvalue())
+
+def open_plan(path):
+    """(data, blocks) for a file. Unchanged files reuse their cached block
+    plan and skip tokenizing; big ones are mapped and tokenized lazily as
+    they run, so memory stays around the size of the biggest block."""
+    if is_large(path):
+        return stream_plan(path)
+    return load_plan(path)
+
+def interpret_file(path, stream=None, callback=None):
+    if is_bundle(path):
+        sink = make_sink(stream, callback)
+        run_bundle(path, sink)
+        if not sink.streaming:
+            print(sink.getvalue())
+        return
+    with trace.span("parse", path=path) as sp:
+        data, blocks = open_plan(path)
+        sp.set(bytes=len(data))
+    sink = make_sink(stream, callback)
+    run_blocks(data, blocks, sink)
+    if not sink.streaming:
+        print(sink.getvalue())
+
+def block_digest(data, block):
+    h = hashlib.sha256()
+    for part in (block.lang.encode("ascii"), block.attrs.encode("utf-8"), block_body(data, block)):
+        h.update(part)
+        h.update(b"\0")
+    return h.hexdigest()
+
+class WatchSession:
+    """Runs a file again and again (run --watch), executing only the blocks
+    whose source changed since the last run and replaying the recorded
+    output of the rest. Keep one session per file being watched. The
+    session has its own scratch directory and data channel, made on the
+    first run and kept until close(), so values put in the channel by
+    blocks that are only replayed are still there."""
+
+    def __init__(self, path, stream=None, callback=None):
+        self.path = path
+        self.stream = stream
+        self.callback = callback
+        self.last = {}
+        self.scratch = None
+        self.channel = None
+
+    def run(self):
+        """Run once; returns (blocks re-executed, blocks in the file)"""
+        if self.scratch is None:
+            self.scratch = make_scratch()
+            self.channel = channel.create(self.scratch)
+        with use_scratch(self.scratch), channel.use_channel(self.channel):
+            return self._run()
+
+    def close(self):
+        if self.scratch is not None:
+            remove_scratch(self.scratch)
+            self.scratch = self.channel = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _run(self):
+        with trace.span("parse", path=self.path) as sp:
+            data, blocks = load_plan(self.path)
+            sp.set(bytes=len(data), blocks=len(blocks))
+        sink = make_sink(self.stream, self.callback)
+        results = {}
+        seen = {}
+        executed = 0
+        for block in blocks:
+            digest = block_digest(data, block)
+            # Identical blocks are told apart by their order among themselves
+            seen[digest] = seen.get(digest, -1) + 1
+            key = (digest, seen[digest])
+            record = self.last.get(key)
+            if record is None:
+                recorder = RecordingSink(sink)
+                _run_blocks(data, [block], recorder)
+                record = (recorder.writes, recorder.rc)
+                executed += 1
+            else:
+                sink.block = block
+                for write in record[0]:
+                    sink.write(*write)
+                sink.block = None
+            if record[1]:
+                sink.failed += 1
+            results[key] = record
+        self.last = results
+        if not sink.streaming:
+            print(sink.getvalue())
+        return executed, len(blocks)
+
+def watch_file(path, stream=None, callback=None, on_run=None):
+    """Run path now and again on every save until interrupted"""
+    watcher = FileWatcher(path)
+    try:
+        with WatchSession(path, stream, callback) as session:
+            while True:
+                start = time.perf_counter()
+                executed, total = session.run()
+                if on_run:
+                    on_run(executed, total, time.perf_counter() - start)
+                watcher.wait()
+    finally:
+        watcher.close()
+
+# -------------------- AOT BUNDLES (.m5rc) -------------------- #
+# compile_bundle() parses a .m5r once and builds its C++/C# blocks into a
+# bundle (utils/bundle.py); run_bundle() runs that without parsing or
+# compiling anything, as long as the source and compilers are unchanged.
+
+# lang -> (artifact cache, unit, build, compiler, wrapped source extension)
+COMPILED = {
+    "cpp": (cpp_cache, cpp_unit, build_cpp, "g++", "cpp"),
+    "cs": (csharp_cache, csharp_unit, build_csharp, "csc", "cs"),
+}
+
+def toolchain_hash(tool):
+    ident = compiler_id(tool)
+    return hashlib.sha256(ident.encode("utf-8")).hexdigest()[:16] if ident else None
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def is_bundle(path):
+    return path.endswith(".m5rc")
+
+def bundle_path_for(source_path):
+    return os.path.splitext(source_path)[0] + ".m5rc"
+
+def build_bundle(entries, out_path, source=None):
+    """Write a bundle of entries, (lang, attrs, line, code) per block. source
+    is the manifest's record of the .m5r it came from. Returns the blocks
+    that failed to compile as (index, lang, compile_err)."""
+    members, blocks, errors, toolchains_used = [], [], [], {}
+    with run_scratch():
+        for index, (lang, attrs, line, code) in enumerate(entries):
+            entry = {"lang": lang, "attrs": attrs, "line": line, "code": f"blocks/{index}.{lang}"}
+            members.append((entry["code"], code.encode("utf-8")))
+            if lang in COMPILED:
+                cache, unit, build, tool, ext = COMPILED[lang]
+                wrapped, _, key = unit(code)
+                entry["wrapped"] = f"wrapped/{index}.{ext}"
+                members.append((entry["wrapped"], wrapped.encode("utf-8")))
+                exe_path, compile_err, _ = build(code) if toolchains.get(tool) else (None, f"[ERROR: Not installed: {tool}]", 1)
+                if exe_path is None:
+                    errors.append((index, lang, compile_err))
+                else:
+                    entry["binary"] = f"bin/{index}"
+                    entry["cache_key"] = key
+                    members.append((entry["binary"], exe_path))
+                    toolchains_used[tool] = toolchain_hash(tool)
+            blocks.append(entry)
+    write_bundle(out_path, {"source": source, "toolchains": toolchains_used, "blocks": blocks}, members)
+    return errors
+
+def compile_bundle(source_path, out_path=None):
+    """Compile a .m5r into a .m5rc next to it; returns (out_path, errors)"""
+    out_path = out_path or bundle_path_for(source_path)
+    data, blocks = load_plan(source_path)
+    st = os.stat(source_path)
+    source = {
+        "path": os.path.relpath(os.path.abspath(source_path), os.path.dirname(os.path.abspath(out_path))),
+        "sha256": file_sha256(source_path),
+        "mtime_ns": st.st_mtime_ns,
+        "size": st.st_size,
+    }
+    entries = [(b.lang, b.attrs, b.line, block_code(data, b)) for b in blocks]
+    return out_path, build_bundle(entries, out_path, source)
+
+def _source_changed(bundle_path, source):
+    """The bundle's source .m5r if it's there and no longer matches"""
+    if not source:
+        return None
+    path = os.path.join(os.path.dirname(os.path.abspath(bundle_path)), source["path"])
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if (st.st_mtime_ns, st.st_size) == (source["mtime_ns"], source["size"]):
+        return None
+    return path if file_sha256(path) != source["sha256"] else None
+
+def open_bundle(path):
+    """Open a .m5rc, rebuilding it first when its source or a compiler it
+    was built with has changed. A compiler that's missing here doesn't
+    count, the prebuilt binaries are what a bundle is for."""
+    bundle = Bundle(path)
+    manifest = bundle.manifest
+    changed_source = _source_changed(path, manifest.get("source"))
+    stale = [tool for tool, h in manifest["toolchains"].items() if toolchain_hash(tool) not in (None, h)]
+    if not changed_source and not stale:
+        return bundle
+    if changed_source:
+        bundle.close()
+        compile_bundle(changed_source, path)
+    else:
+        entries = [(b["lang"], b["attrs"], b["line"], bundle.text(b["code"])) for b in manifest["blocks"]]
+        bundle.close()
+        build_bundle(entries, path, manifest.get("source"))
+    return Bundle(path)
+
+def bundle_plan(bundle):
+    """(data, blocks, prebuilt) to run a bundle with: blocks point straight
+    at their code inside the mapped bundle"""
+    blocks, prebuilt = [], {}
+    for index, entry in enumerate(bundle.manifest["blocks"]):
+        start, end = bundle.span(entry["code"])
+        blocks.append(Block(index, entry["lang"], start, end, entry["line"], entry["attrs"]))
+        if "binary" in entry:
+            cache = COMPILED[entry["lang"]][0]
+            exe_path = cache.get(entry["cache_key"])
+            if exe_path is None:
+                # First run on this machine, unpack it into the artifact cache
+                tmp = scratch_file("prebuilt" + cache.suffix)
+                with open(tmp, "wb") as f:
+                    f.write(bundle.member(entry["binary"]))
+                exe_path = cache.put(entry["cache_key"], tmp)
+            prebuilt[index] = exe_path
+    return bundle.map, blocks, prebuilt
+
+def run_bundle(path, sink, cwd=None, **run_kwargs):
+    bundle = open_bundle(path)
+    try:
+        with trace.span("parse", path=path, bundle=True):
+            data, blocks, prebuilt = bundle_plan(bundle)
+        run_blocks(data, blocks, sink, cwd=cwd, prebuilt=prebuilt, **run_kwargs)
+    finally:
+        bundle.close()
+
+# -------------------- ASYNC ENGINE -------------------- #
+# Engine runs sources as asyncio tasks and hands back one BlockResult per
+# block instead of printed text, for the shell, batch tools and programs
+# embedding m5rcode; interpret() and RunCommand are wrappers around it.
+# A run goes through run_blocks() on a thread of its own, so blocks are
+# planned, cached, batched and labelled exactly as everywhere else, while
+# their processes start on the engine's event loop
+# (asyncio.create_subprocess_exec). Compiles, warm workers, in-process
+# Python and the zygote stay on the run's thread.
+
+class BlockResult:
+    """What one block did. Times are in seconds: queued waiting for a slot,
+    build compiling it (C++/C#), run the rest of it, wall all of it."""
+
+    def __init__(self, block):
+        self.block = block
+        self.index = block.index
+        self.lang = block.lang
+        self.line = block.line
+        self.stdout = ""
+        self.stderr = ""
+        self.rc = 0
+        self.stage = "run"        # "compile" when a C++/C# block didn't build
+        self.timed_out = False
+        self.cancelled = False
+        self.skipped = False      # its runtime isn't installed
+        self.cached = False       # a [pure] block's result was replayed
+        self.queued = 0.0
+        self.build = 0.0
+        self.run = 0.0
+        self.wall = 0.0
+
+    @property
+    def ok(self):
+        return self.rc == 0 and not self.timed_out and not self.cancelled
+
+    def __repr__(self):
+        return f"<BlockResult {self.index} {self.lang} rc={self.rc} {self.wall:.3f}s>"
+
+class ResultSink:
+    """Sink of an Engine run: a block's own output goes into its BlockResult
+    and on to on_output(result, stream, text). With a target sink (as for
+    interpret()) every write, headers and labels too, is passed on as well."""
+
+    failed = 0
+    ran = 0
+
+    def __init__(self, on_output=None, target=None):
+        self.on_output = on_output
+        self.target = target
+        self.streaming = target.streaming if target is not None else True
+        self.rc = 0
+        self.result = None
+        self._block = None
+
+    @property
+    def block(self):
+        return self._block
+
+    @block.setter
+    def block(self, block):
+        self._block = block
+        if self.target is not None:
+            self.target.block = block
+
+    def write(self, text, stream="stdout", decoration=None):
+        if self.target is not None:
+            self.target.write(text, stream, decoration)
+        if decoration or not text or self.result is None:
+            return
+        if stream == "stdout":
+            self.result.stdout += text
         else:
-            out, err, rc = safe_run([exe_path])
-            outputs.append(lang_header("csharp") + out)
-            if err or rc:
-                outputs.append(f"[C# ERROR]\n{err}")
-            os.unlink(exe_path)
-        os.unlink(path)
-
-    # C++ (requires g++)
-    for segment in re.findall(r'<\?cpp(.*?)\?>', source, re.S):
-        code = segment.strip()
-        with tempfile.NamedTemporaryFile('w', delete=False, suffix='.cpp') as f:
-            f.write(f"#include <iostream>\nusing namespace std;\nint main() {{ {code} return 0; }}")
-            path = f.name
-        exe_path = path.replace('.cpp', '')
-        compile_out, compile_err, compile_rc = safe_run(['g++', path, '-o', exe_path])
-        if not os.path.exists(exe_path) or compile_rc:
-            outputs.append(lang_header("cpp") + "[C++ COMPILE ERROR]\n" + compile_err)
+            self.result.stderr += text
+        if self.on_output:
+            self.on_output(self.result, stream, text)
+
+class EngineProcesses:
+    """safe_run() and stream_run() for an Engine run's thread: the process
+    itself starts and is pumped on the engine's event loop"""
+
+    def __init__(self, loop, control):
+        self.loop = loop
+        self.control = control
+        self.tasks = set()  # touched on the loop only
+
+    def run(self, cmd, timeout=8, **sub_kwargs):
+        try:
+            out, err, rc, saw_stderr, timed_out = self._call(cmd, timeout, None, sub_kwargs)
+        except RunCancelled:
+            raise
+        except FileNotFoundError:
+            return "", f"[ERROR: Not installed: {cmd[0]}]", 1
+        except Exception as e:
+            return "", f"[ERROR: {e}]", 1
+        if timed_out:
+            note(timed_out=True)
+            return "", "[ERROR: timed out]", 1
+        return out, err, rc
+
+    def stream(self, cmd, write, timeout=8, **sub_kwargs):
+        try:
+            out, err, rc, saw_stderr, timed_out = self._call(cmd, timeout, write, sub_kwargs)
+        except RunCancelled:
+            raise
+        except FileNotFoundError:
+            write(f"[ERROR: Not installed: {cmd[0]}]", "stderr")
+            return True, 1
+        except Exception as e:
+            write(f"[ERROR: {e}]", "stderr")
+            return True, 1
+        if timed_out:
+            note(timed_out=True)
+            write("[ERROR: timed out]", "stderr")
+            return True, 1
+        return saw_stderr, rc
+
+    def _call(self, cmd, timeout, write, sub_kwargs):
+        coro = self._tracked(self._spawn(cmd, timeout, write, trace.current_block(), **sub_kwargs))
+        with supervisor.admission():
+            return self.control.wait(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    async def _tracked(self, coro):
+        task = asyncio.current_task()
+        self.tasks.add(task)
+        try:
+            return await coro
+        finally:
+            self.tasks.discard(task)
+
+    async def settle(self):
+        """Cancel the processes still running and wait until they're gone"""
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _spawn(self, cmd, timeout, write, block, input=None, stdin=None, **sub_kwargs):
+        """Run cmd, handing its output to write(text, stream) as it arrives
+        or, without write, capturing it. (out, err, rc, saw_stderr, timed_out)"""
+        with trace.block_span(block, "spawn", cmd=cmd[0]):
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.PIPE if input is not None else stdin,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                **supervisor.popen_kwargs(),
+                **sub_kwargs
+            )
+            supervisor.apply_limits(proc)
+        label = os.path.basename(cmd[0])
+        captures = {"stdout": OutputCapture(label, "stdout"), "stderr": OutputCapture(label, "stderr")}
+        counts = {"stdout": 0, "stderr": 0}
+        saw_stderr = []
+
+        async def pump(pipe, stream):
+            decoder = codecs.getincrementaldecoder("utf-8")("replace")
+            while True:
+                chunk = await pipe.read(65536)
+                counts[stream] += len(chunk)
+                if write is None:
+                    captures[stream].write(chunk)
+                else:
+                    text = decoder.decode(chunk, final=not chunk)
+                    if text:
+                        if stream == "stderr":
+                            saw_stderr.append(True)
+                        write(text, stream)
+                if not chunk:
+                    return
+
+        async def feed():
+            try:
+                proc.stdin.write(input.encode("utf-8"))
+                await proc.stdin.drain()
+                proc.stdin.close()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        async def reap():
+            # Once the block's own process is gone, take the rest of its
+            # group with it so leftovers can't hold the pipes open
+            rc = await proc.wait()
+            supervisor.kill_group(proc)
+            return rc
+
+        tasks = [pump(proc.stdout, "stdout"), pump(proc.stderr, "stderr"), reap()]
+        if input is not None:
+            tasks.append(feed())
+        timed_out = False
+        gathered = asyncio.gather(*tasks)
+        # Cut short, it ends with the pumps' CancelledError; nobody else is
+        # going to look at that
+        gathered.add_done_callback(lambda f: f.cancelled() or f.exception())
+        with trace.block_span(block, "run", cmd=cmd[0]) as sp:
+            try:
+                await asyncio.wait_for(gathered, timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+            finally:
+                # Timed out or the run cancelled
+                if proc.returncode is None:
+                    supervisor.kill_group(proc)
+                    await proc.wait()
+                sp.set(stdout_bytes=counts["stdout"], stderr_bytes=counts["stderr"], rc=proc.returncode)
+        out, err = captures["stdout"].getvalue(), captures["stderr"].getvalue()
+        return out, err, proc.returncode, bool(saw_stderr), timed_out
+
+class Engine:
+    """Runs .m5r sources as asyncio tasks:
+
+        results = await Engine(max_concurrency=4).run(source)
+
+    Blocks of one run go in document order and share its scratch directory
+    and data channel; separate runs awaited together on one event loop
+    interleave, with at most max_concurrency blocks executing at once. A
+    block over its timeout (the engine's, or timeout=N in the block's
+    attributes, None for no limit) is killed, and so is the running block
+    of a cancelled run (see RunControl for the blocks that can't be).
+
+    on_start(result), on_output(result, stream, text) and on_finish(result)
+    are called on the event loop as a block starts, prints and ends. With
+    sink=, the run also writes to that sink the way run_blocks() does."""
+
+    def __init__(self, max_concurrency=None, timeout=BLOCK_TIMEOUT):
+        self.max_concurrency = max_concurrency or supervisor.MAX_PROCS or os.cpu_count() or 4
+        self.timeout = timeout
+        # asyncio.Semaphore belongs to one event loop, so one per loop
+        self._slots = weakref.WeakKeyDictionary()
+
+    async def run(self, source, cwd=None, **options):
+        data = source.encode("utf-8") if isinstance(source, str) else source
+        with trace.span("parse", bytes=len(data)):
+            blocks = tokenize(data)
+        return await self.run_blocks(data, blocks, cwd, **options)
+
+    async def run_file(self, path, cwd=None, **options):
+        if is_bundle(path):
+            return await self._run(functools.partial(run_bundle, path, cwd=cwd), **options)
+        with trace.span("parse", path=path) as sp:
+            data, blocks = open_plan(path)
+            sp.set(bytes=len(data))
+        return await self.run_blocks(data, blocks, cwd, **options)
+
+    async def run_blocks(self, data, blocks, cwd=None, **options):
+        return await self._run(functools.partial(run_blocks, data, blocks, cwd=cwd), **options)
+
+    async def _run(self, run, sink=None, on_start=None, on_output=None, on_finish=None):
+        """run(sink, timeout=..., around_block=...) on a thread of its own,
+        collecting a BlockResult per block"""
+        loop = asyncio.get_running_loop()
+        slots = self._slots.get(loop)
+        if slots is None:
+            slots = self._slots[loop] = asyncio.Semaphore(self.max_concurrency)
+        done = loop.create_future()
+        control = RunControl()
+        processes = EngineProcesses(loop, control)
+        results = []
+
+        def call(callback, *args):
+            if callback:
+                loop.call_soon_threadsafe(callback, *args)
+
+        result_sink = ResultSink(lambda result, stream, text: call(on_output, result, stream, text), sink)
+
+        @contextlib.contextmanager
+        def slot():
+            held = []
+
+            async def acquire():
+                await slots.acquire()
+                held.append(True)
+
+            try:
+                control.wait(asyncio.run_coroutine_threadsafe(acquire(), loop))
+            except RunCancelled:
+                # It may have got the slot just as the run was cancelled
+                loop.call_soon_threadsafe(lambda: held and slots.release())
+                raise
+            try:
+                yield
+            finally:
+                loop.call_soon_threadsafe(slots.release)
+
+        @contextlib.contextmanager
+        def around_block(block):
+            result = BlockResult(block)
+            results.append(result)
+            result_sink.result = result
+            start = time.perf_counter()
+            call(on_start, result)
+            try:
+                with slot():
+                    result.queued = time.perf_counter() - start
+                    yield
+            finally:
+                status = _run_state.status
+                result.stage = status.stage
+                result.timed_out = status.timed_out
+                result.skipped = status.skipped
+                result.cached = status.cached
+                result.build = status.build
+                result.cancelled = control.cancelled
+                result.rc = result_sink.rc
+                result.wall = time.perf_counter() - start
+                result.run = max(0.0, result.wall - result.queued - result.build)
+                result_sink.result = None
+                call(on_finish, result)
+
+        def settle(error):
+            if not done.done():
+                if error is None:
+                    done.set_result(results)
+                else:
+                    done.set_exception(error)
+
+        def target():
+            _run_state.control = control
+            _run_state.processes = processes
+            try:
+                run(result_sink, timeout=self.timeout, around_block=around_block)
+            except RunCancelled:
+                error = None
+            except BaseException as e:
+                error = e
+            else:
+                error = None
+            finally:
+                _run_state.control = _run_state.processes = None
+                if sink is not None:
+                    sink.rc, sink.ran, sink.failed = result_sink.rc, result_sink.ran, result_sink.failed
+            loop.call_soon_threadsafe(settle, error)
+
+        threading.Thread(target=target, name="m5r-engine-run", daemon=True).start()
+        try:
+            return await asyncio.shield(done)
+        except asyncio.CancelledError:
+            # Stop the thread's block and wait for it to wind down, so the
+            # run's scratch directory is gone by the time this returns
+            control.cancel()
+            with contextlib.suppress(Exception):
+                await processes.settle()
+                await asyncio.shield(done)
+            raise
+
+_default_engine = None
+
+def default_engine():
+    """The Engine interpret() runs on, one per process"""
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = Engine()
+    return _default_engine
+
+# -------------------- BATCH RUNNER -------------------- #
+# python -m m5r_interpreter --jobs N file_or_glob...
+
+def run_file_remote(path):
+    """run_file() on m5rd; None when it isn't running"""
+    start = time.perf_counter()
+    parts = []
+    done = m5rd_client.request(
+        {"op": "run", "path": os.path.abspath(path), "cwd": os.getcwd()},
+        on_event=lambda e: parts.append(e["text"]) if e["event"] == "output" else None,
+    )
+    if done is None:
+        return None
+    if done["event"] == "error":
+        return "".join(parts) + f"[ERROR: {done['error']}]\n", 1, 0, time.perf_counter() - start
+    return "".join(parts), done["failed"], done["blocks"], time.perf_counter() - start
+
+def run_file(path):
+    """Run one file with buffered output; returns (output, failed_blocks, blocks, seconds)"""
+    if m5rd_client.DAEMON_ENABLED:
+        result = run_file_remote(path)
+        if result is not None:
+            return result
+    start = time.perf_counter()
+    sink = BufferSink()
+    try:
+        if is_bundle(path):
+            run_bundle(path, sink)
+        else:
+            data, blocks = open_plan(path)
+            run_blocks(data, blocks, sink)
+    except (OSError, BundleError) as e:
+        return sink.getvalue() + f"[ERROR: {e}]\n", 1, sink.ran, time.perf_counter() - start
+    return sink.getvalue(), sink.failed, sink.ran, time.perf_counter() - start
+
+def expand_paths(patterns):
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(glob.glob(os.path.join(pattern, "**", "*.m5r"), recursive=True))
         else:
-            out, err, rc = safe_run([exe_path])
-            outputs.append(lang_header("cpp") + out)
-            if err or rc:
-                outputs.append(f"[C++ ERROR]\n{err}")
-            os.unlink(exe_path)
-        os.unlink(path)
-
-    print(''.join(outputs))
+            matches = sorted(glob.glob(pattern, recursive=True)) or [pattern]
+        for path in matches:
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+def print_summary(results):
+    name_w = max([len("File")] + [len(path) for path, *_ in results])
+    rows = [f" {'File':<{name_w}}  {'Status':<8}{'Blocks':>7}{'Failed':>7}{'Wall':>10} "]
+    for path, failed, blocks, seconds in results:
+        status = "FAILED" if failed else "ok"
+        rows.append(f" {path:<{name_w}}  {status:<8}{blocks:>7}{failed:>7}{seconds:>9.2f}s ")
+    width = len(rows[0])
+    print("╔" + "═" * width + "╗")
+    print("║" + rows[0] + "║")
+    print("╟" + "─" * width + "╢")
+    for row in rows[1:]:
+        print("║" + row + "║")
+    print("╚" + "═" * width + "╝")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m m5r_interpreter",
+        description="Run .m5r files non-interactively",
+    )
+    parser.add_argument("files", nargs="+", help=".m5r files, directories or glob patterns")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="files to run in parallel (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    paths = expand_paths(args.files)
+    if not paths:
+        print("No .m5r files matched.", file=sys.stderr)
+        return 2
+
+    def report_file(path, result):
+        output, failed, blocks, seconds = result
+        # Each file's output is printed in one piece, in the order given
+        sys.stdout.write(f"\n#### {path} ####\n{output}\n")
+        sys.stdout.flush()
+        results.append((path, failed, blocks, seconds))
+
+    results = []
+    if args.jobs <= 1:
+        for path in paths:
+            report_file(path, run_file(path))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            futures = [pool.submit(run_file, path) for path in paths]
+            for path, future in zip(paths, futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = (f"[ERROR: {e}]\n", 1, 0, 0.0)
+                report_file(path, result)
+
+    print_summary(results)
+    return 1 if any(failed for _, failed, _, _ in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+import os
+import sys
+import json
+import time
+import queue
+import signal
+import argparse
+import threading
+import socketserver
+from collections import deque
+
+# m5rd: a long-running process that runs .m5r files for the shell and the
+# batch runner (see utils/m5rd_client.py for the protocol). Everything a
+# fresh process rebuilds on every run stays warm here: the worker pool,
+# the toolchain registry, the artifact caches and the imported runners.
+#
+#   python m5rd.py [--jobs N] [--socket PATH]
+#   python m5rd.py --stats
+
+# Warm workers are the point of the daemon, so they default to on
+os.environ.setdefault("M5R_WORKERS", "1")
+
+import m5r_interpreter as interp
+from utils.block_plan import Block, tokenize
+from utils import m5rd_client
+
+THROUGHPUT_WINDOW = 60  # seconds
+
+class Job:
+    def __init__(self, message, conn):
+        self.message = message
+        self.conn = conn
+        self.queued_at = time.monotonic()
+        self.done = threading.Event()
+        self.gone = False
+        self._lock = threading.Lock()
+
+    def send(self, event):
+        # A client that hung up just stops getting events, the run goes on
+        if self.gone:
+            return
+        with self._lock:
+            try:
+                self.conn.write((json.dumps(event) + "\n").encode("utf-8"))
+                self.conn.flush()
+            except OSError:
+                self.gone = True
+
+def blocks_from_message(message):
+    """(data, blocks) for a run request"""
+    if "path" in message:
+        return interp.open_plan(message["path"])
+    if "source" in message:
+        data = message["source"].encode("utf-8")
+        return data, tokenize(data)
+    # Ready-made blocks, laid end to end in one buffer
+    parts, blocks, pos = [], [], 0
+    for index, (lang, code) in enumerate(message["blocks"]):
+        body = code.encode("utf-8")
+        blocks.append(Block(index, lang, pos, pos + len(body), 1, ""))
+        parts.append(body)
+        pos += len(body)
+    return b"".join(parts), blocks
+
+class Stats:
+    def __init__(self):
+        self.started = time.time()
+        self.completed = 0
+        self.failed = 0
+        self.running = 0
+        self.recent = deque()  # (finished at, blocks) within THROUGHPUT_WINDOW
+        self.wait_total = 0.0
+        self.run_total = 0.0
+        self.lock = threading.Lock()
+
+    def finish(self, blocks, failed, wait, wall):
+        now = time.monotonic()
+        with self.lock:
+            self.completed += 1
+            self.failed += bool(failed)
+            self.wait_total += wait
+            self.run_total += wall
+            self.recent.append((now, blocks))
+            while self.recent and self.recent[0][0] < now - THROUGHPUT_WINDOW:
+                self.recent.popleft()
+
+    def snapshot(self, queue_depth, jobs):
+        now = time.monotonic()
+        with self.lock:
+            recent = [(t, b) for t, b in self.recent if t >= now - THROUGHPUT_WINDOW]
+            done = self.completed or 1
+            return {
+                "event": "stats",
+                "uptime": time.time() - self.started,
+                "executors": jobs,
+                "queue_depth": queue_depth,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "runs_per_min": len(recent) * 60 / THROUGHPUT_WINDOW,
+                "blocks_per_sec": sum(b for _, b in recent) / THROUGHPUT_WINDOW,
+                "avg_wait": self.wait_total / done,
+                "avg_run": self.run_total / done,
+                "workers_enabled": interp.WORKERS_ENABLED,
+            }
+
+class Daemon:
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.queue = queue.Queue()
+        self.stats = Stats()
+        for i in range(jobs):
+            threading.Thread(target=self._executor, name=f"m5rd-exec-{i}", daemon=True).start()
+
+    def submit(self, job):
+        job.send({"event": "queued", "position": self.queue.qsize() + 1})
+        self.queue.put(job)
+        job.done.wait()
+
+    def _executor(self):
+        while True:
+            job = self.queue.get()
+            with self.stats.lock:
+                self.stats.running += 1
+            try:
+                self._run(job)
+            finally:
+                with self.stats.lock:
+                    self.stats.running -= 1
+                job.done.set()
+
+    def _run(self, job):
+        wait = time.monotonic() - job.queued_at
+        start = time.monotonic()
+        bundle = interp.is_bundle(job.message.get("path", ""))
+        try:
+            # Bundles are opened (and rebuilt if stale) by run_bundle itself
+            data, blocks = (None, None) if bundle else blocks_from_message(job.message)
+        except (OSError, KeyError, ValueError, TypeError) as e:
+            job.send({"event": "error", "error": str(e)})
+            return
+
+        def forward(block, stream, text):
+            job.send({
+                "event": "output",
+                "block": block.index if block is not None else None,
+                "lang": block.lang if block is not None else None,
+                "stream": stream,
+                "text": text,
+            })
+
+        # raw: only the blocks' own output, no headers or error labels
+        sink = interp.StreamSink(forward, decorations=not job.message.get("raw"))
+        options = {"cwd": job.message.get("cwd"), "timeout": job.message.get("timeout", interp.BLOCK_TIMEOUT)}
+        try:
+            if bundle:
+                interp.run_bundle(job.message["path"], sink, **options)
+            else:
+                interp.run_blocks(data, blocks, sink, **options)
+        except Exception as e:
+            job.send({"event": "error", "error": f"{type(e).__name__}: {e}"})
+            return
+        wall = time.monotonic() - start
+        self.stats.finish(sink.ran, sink.failed, wait, wall)
+        job.send({"event": "done", "blocks": sink.ran, "failed": sink.failed, "wait": wait, "wall": wall})
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        daemon = self.server.m5rd
+        for line in self.rfile:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                self._reply({"event": "error", "error": "bad request"})
+                continue
+            op = message.get("op")
+            if op == "stats":
+                self._reply(daemon.stats.snapshot(daemon.queue.qsize(), daemon.jobs))
+            elif op == "run":
+                daemon.submit(Job(message, self.wfile))
+            else:
+                self._reply({"event": "error", "error": f"unknown op {op!r}"})
+
+    def _reply(self, event):
+        self.wfile.write((json.dumps(event) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def serve(path, jobs):
+    if os.path.exists(path):
+        sock = m5rd_client.connect(timeout=1)
+        if sock is not None:
+            sock.close()
+            print(f"m5rd is already running on {path}", file=sys.stderr)
+            return 1
+        # Left behind by a daemon that didn't shut down cleanly
+        os.unlink(path)
+    server = Server(path, Handler)
+    os.chmod(path, 0o600)
+    server.m5rd = Daemon(jobs)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    print(f"m5rd listening on {path} ({jobs} executors, workers {'on' if interp.WORKERS_ENABLED else 'off'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    return 0
+
+def print_stats():
+    stats = m5rd_client.stats()
+    if stats is None:
+        print("m5rd is not running", file=sys.stderr)
+        return 1
+    print(f"uptime         {stats['uptime']:.0f}s")
+    print(f"queue depth    {stats['queue_depth']}")
+    print(f"running        {stats['running']} of {stats['executors']}")
+    print(f"completed      {stats['completed']} ({stats['failed']} with failed blocks)")
+    print(f"throughput     {stats['runs_per_min']:.1f} runs/min, {stats['blocks_per_sec']:.2f} blocks/s (last {THROUGHPUT_WINDOW}s)")
+    print(f"avg wait/run   {stats['avg_wait']:.3f}s / {stats['avg_run']:.3f}s")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="m5rd", description="m5rcode execution daemon")
+    parser.add_argument("--socket", help="socket path (default: M5R_SOCKET or <cache>/m5rd.sock)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 2, help="runs executed at once")
+    parser.add_argument("--stats", action="store_true", help="print a running daemon's statistics")
+    args = parser.parse_args(argv)
+    if args.socket:
+        os.environ["M5R_SOCKET"] = args.socket
+    if args.stats:
+        return print_stats()
+    if not hasattr(socketserver, "UnixStreamServer"):
+        print("m5rd needs Unix domain sockets", file=sys.stderr)
+        return 1
+    return serve(m5rd_client.socket_path(), max(1, args.jobs))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,25 +1,23 @@
+import time
+import sys
+
+# --startup-profile has to be watching before anything else gets imported
+from utils.startup import StartupProfile
+PROFILE = StartupProfile() if any(a.startswith("--startup-profile") for a in sys.argv[1:]) else None
+if PROFILE:
+    PROFILE.watch_imports()
+
 import os
 import cmd
+import importlib
+import contextlib
+import threading
 from colorama import init, Fore, Style
-from pyfiglet import Figlet
-import time
 import random
-import sys
-import math
-import re
-
-# Import Discord RPC library
-from pypresence import Presence, exceptions
-
-# Import your existing command modules
-from commands.cmd_new import NewCommand
-from commands.cmd_nano import NanoCommand
-from commands.cmd_run import RunCommand
-from commands.cmd_fastfetch import FastfetchCommand
-from commands.cmd_credits import CreditsCommand
-from commands.cmd_cd import CdCommand
-from commands.cmd_exit import ExitCommand
-from commands.cmd_wdir import WdirCommand
+import shutil
+
+from utils import render
+from utils import render_cache
 
 # Initialize colorama
 init(autoreset=True)
@@ -27,6 +25,56 @@ init(autoreset=True)
 CLIENT_ID = '1414669512158220409'
 BANNER_LENGTH = 70  # Unified width for all boxes/banners
 
+# M5R_ANIMATIONS=0 or --no-animations skips the boot log and the donut
+ANIMATIONS = os.environ.get("M5R_ANIMATIONS", "1") != "0"
+
+# Command modules are imported the first time their command is used, some
+# of them pull in requests, bs4, psutil or pyfiglet
+COMMANDS = {
+    "new": ("commands.cmd_new", "NewCommand"),
+    "nano": ("commands.cmd_nano", "NanoCommand"),
+    "run": ("commands.cmd_run", "RunCommand"),
+    "output": ("commands.cmd_output", "OutputCommand"),
+    "compile": ("commands.cmd_compile", "CompileCommand"),
+    "fastfetch": ("commands.cmd_fastfetch", "FastfetchCommand"),
+    "credits": ("commands.cmd_credits", "CreditsCommand"),
+    "cd": ("commands.cmd_cd", "CdCommand"),
+    "exit": ("commands.cmd_exit", "ExitCommand"),
+    "wdir": ("commands.cmd_wdir", "WdirCommand"),
+}
+_command_classes = {}
+
+def command(name):
+    cls = _command_classes.get(name)
+    if cls is None:
+        module_name, class_name = COMMANDS[name]
+        cls = _command_classes[name] = getattr(importlib.import_module(module_name), class_name)
+    return cls
+
+# Sections of the help screen, (command, description) each
+HELP_SECTIONS = [
+    (" FILE/PROJECT ", [
+        ("new", "Create a new .m5r file"),
+        ("nano", "Edit a file with your editor"),
+        ("run", "Run a .m5r script (executes only Python blocks)"),
+        ("compile", "Build a .m5rc bundle with C++/C# blocks precompiled"),
+        ("output", "Page or save the full output of a truncated block")
+    ]),
+    (" INFORMATION ", [
+        ("fastfetch", "Show language & system info"),
+        ("credits", "Show project credits"),
+    ]),
+    (" NAVIGATION & UTILITY ", [
+        ("cd", "Change directory within m5rcode/files"),
+        ("dir", "List files in the current directory"),
+        ("wdir", "List files hosted at a website directory"),
+        ("clear", "Clear the shell output"),
+        ("exit", "Exit the m5rcode shell"),
+        ("help", "Display this help message"),
+        ("?", "Alias for 'help'")
+    ])
+]
+
 # -------------------- UTILITY EFFECT FUNCTIONS -------------------- #
 
 PURPLE_GRADIENT = [Fore.MAGENTA, Fore.LIGHTMAGENTA_EX, Fore.LIGHTWHITE_EX]
@@ -42,14 +90,7 @@ def purple_gradient_text(text):
         result += PURPLE_GRADIENT[idx] + c
     return result + Style.RESET_ALL
 
-def strip_ansi(text):
-    return re.sub(r'\x1b\[[0-9;]*m', '', text)
-
-def center_text(text, width):
-    text_len = len(strip_ansi(text))
-    if text_len >= width:
-        return text
-    return ' ' * ((width - text_len) // 2) + text
+center_text = render.center
 
 def linux_boot_log_animation(lines=22, width=BANNER_LENGTH, term_height=32):
     messages_ok = [
@@ -76,55 +117,33 @@ def linux_boot_log_animation(lines=22, width=BANNER_LENGTH, term_height=32):
         "Ready."
     ]
     blanks = (term_height - lines) // 2
-    os.system('cls' if os.name == 'nt' else 'clear')
-    for _ in range(blanks):
-        print('')
-    print(center_text(Fore.WHITE + Style.BRIGHT + "m5rOS (Unofficial) Shell Boot Sequence" + Style.RESET_ALL, width))
+    frame = render.Frame(clear=True)
+    frame.lines([''] * blanks)
+    frame.line(center_text(Fore.WHITE + Style.BRIGHT + "m5rOS (Unofficial) Shell Boot Sequence" + Style.RESET_ALL, width))
+    frame.flush()
     for i in range(lines):
         time.sleep(0.06 if i < lines - 2 else 0.16)
         msg = messages_ok[i] if i < len(messages_ok) else "Booting" + '.' * ((i % 5) + 1)
         prefix = "[ OK ]"
         color = Fore.LIGHTBLACK_EX if i % 2 == 0 else Fore.WHITE
-        print(center_text(color + prefix + ' ' + msg + Style.RESET_ALL, width))
-    print(center_text(Fore.WHITE + Style.BRIGHT + "\n>>> Boot complete." + Style.RESET_ALL, width))
+        frame.line(center_text(color + prefix + ' ' + msg + Style.RESET_ALL, width)).flush()
+    frame.line(center_text(Fore.WHITE + Style.BRIGHT + "\n>>> Boot complete." + Style.RESET_ALL, width)).flush()
     time.sleep(0.5)
 
 def print_spinning_donut(frames=36, width=74, height=28, sleep=0.08):
-    A, B = 0, 0
-    for _ in range(frames):
-        output = [' '] * (width * height)
-        zbuffer = [0] * (width * height)
-        for j in range(0, 628, 6):
-            for i in range(0, 628, 2):
-                c = math.sin(i / 100)
-                d = math.cos(j / 100)
-                e = math.sin(A)
-                f = math.sin(j / 100)
-                g = math.cos(A)
-                h = d + 2
-                D = 1 / (c * h * e + f * g + 5)
-                l = math.cos(i / 100)
-                m = math.cos(B)
-                n = math.sin(B)
-                t = c * h * g - f * e
-                x = int(width / 2 + width / 3 * D * (l * h * m - t * n))
-                y = int(height / 2 + height / 3.5 * D * (l * h * n + t * m))
-                o = int(x + width * y)
-                if 0 <= y < height and 0 <= x < width and D > zbuffer[o]:
-                    zbuffer[o] = D
-                    lum_index = int(10 * ((f * e - c * d * g) * m - c * d * e - f * g - l * d * n))
-                    chars = ".,-~:;=!*#$@"
-                    output[o] = chars[lum_index % len(chars)]
-        os.system('cls' if os.name == 'nt' else 'clear')
-        blanks = 3
-        for _ in range(blanks):
-            print('')
-        print(center_text(Style.BRIGHT + Fore.LIGHTMAGENTA_EX + "m5rcode: Initializing..." + Style.RESET_ALL, width))
-        for y in range(height):
-            line = ''.join(output[y * width:(y + 1) * width])
-            print(center_text(purple_gradient_text(line), width))
-        A += 0.08
-        B += 0.03
+    from utils import donut  # NumPy, when it's there, only for the animation
+    # Fit the terminal: 3 blank lines and the title go above the donut
+    columns, rows = shutil.get_terminal_size((width, height + 5))
+    width, height = max(min(width, columns), 20), max(min(height, rows - 5), 10)
+    title = center_text(Style.BRIGHT + Fore.LIGHTMAGENTA_EX + "m5rcode: Initializing..." + Style.RESET_ALL, width)
+    # Clear once, then each frame overwrites the last from the top left
+    clear = True
+    for lines in donut.frames(frames, width, height):
+        frame = render.Frame(clear=clear, home=True)
+        frame.lines(['', '', '', title])
+        frame.lines(center_text(purple_gradient_text(line), width) for line in lines)
+        frame.flush()
+        clear = False
         time.sleep(sleep)
     time.sleep(0.2)
 
@@ -142,19 +161,35 @@ class M5RShell(cmd.Cmd):
         self.update_prompt()
         self.rpc_active = False
         self.rpc = None
+        self.rpc_notice = None
+        # pypresence and the Discord handshake stay off the way to the prompt
+        threading.Thread(target=self._start_rpc, name="m5r-rpc", daemon=True).start()
+
+    def _start_rpc(self):
         self._connect_rpc()
         if self.rpc_active:
             self._set_idle_presence()
 
     def _connect_rpc(self):
+        try:
+            from pypresence import Presence, exceptions
+        except ImportError:
+            self.rpc_notice = "[RPC] pypresence not installed. RPC disabled."
+            return
         try:
             self.rpc = Presence(CLIENT_ID)
             self.rpc.connect()
             self.rpc_active = True
         except exceptions.DiscordNotFound:
-            print(Fore.LIGHTBLACK_EX + "[RPC] Discord not found. RPC disabled." + Style.RESET_ALL)
+            self.rpc_notice = "[RPC] Discord not found. RPC disabled."
         except Exception as e:
-            print(Fore.LIGHTBLACK_EX + f"[RPC Error] {e}" + Style.RESET_ALL)
+            self.rpc_notice = f"[RPC Error] {e}"
+
+    def _show_rpc_notice(self):
+        # Printed from the shell's thread, never over the prompt
+        if self.rpc_notice:
+            print(Fore.LIGHTBLACK_EX + self.rpc_notice + Style.RESET_ALL)
+            self.rpc_notice = None
 
     def _set_idle_presence(self):
         if self.rpc_active and self.rpc:
@@ -229,28 +264,43 @@ class M5RShell(cmd.Cmd):
         )
 
     def preloop(self):
-        linux_boot_log_animation()
-        print_spinning_donut()
-        os.system('cls' if os.name == 'nt' else 'clear')
-        self._print_banner()
+        if ANIMATIONS:
+            with self._phase("boot log animation"):
+                linux_boot_log_animation()
+            with self._phase("donut animation"):
+                print_spinning_donut()
+        with self._phase("banner"):
+            self._print_banner(clear=True)
+        self._show_rpc_notice()
         if self.rpc_active:
             self._set_idle_presence()
 
-    def _print_banner(self):
+    def _phase(self, name):
+        return PROFILE.phase(name) if PROFILE else contextlib.nullcontext()
+
+    def _print_banner(self, clear=False):
+        # Pre-rendered, clear just writes it out again
+        banner = render_cache.screen("banner", self._render_banner, BANNER_LENGTH, Fore.LIGHTBLACK_EX, PURPLE_GRADIENT)
+        render.write((render.CLEAR if clear else "") + banner)
+
+    def _render_banner(self):
         blen = BANNER_LENGTH
-        ascii_art = Figlet(font='slant')
-        print(Fore.LIGHTBLACK_EX + "╔" + "═" * blen + "╗")
-        for line in ascii_art.renderText("m5rcode").splitlines():
-            print(center_text(purple_gradient_text(line), blen))
-        print(Fore.LIGHTBLACK_EX + "╠" + "═" * blen + "╣")
-        print(center_text(purple_gradient_text("  Welcome to the m5rcode shell!  ".center(blen)), blen))
-        print(Fore.LIGHTBLACK_EX + "╚" + "═" * blen + "╝" + Style.RESET_ALL)
-        print(Fore.LIGHTCYAN_EX + Style.BRIGHT +
-              "Type 'help' or '?' for commands · 'exit' to quit\n" + Style.RESET_ALL)
+        frame = render.Frame()
+        box = render.Box(frame, blen, Fore.LIGHTBLACK_EX)
+        box.top()
+        for line in render_cache.figlet_text("m5rcode", font='slant').splitlines():
+            frame.line(center_text(purple_gradient_text(line), blen))
+        box.rule(heavy=True)
+        frame.line(center_text(purple_gradient_text("  Welcome to the m5rcode shell!  ".center(blen)), blen))
+        box.bottom()
+        frame.line(Fore.LIGHTCYAN_EX + Style.BRIGHT +
+                   "Type 'help' or '?' for commands · 'exit' to quit\n" + Style.RESET_ALL)
+        return frame.text()
 
     def postcmd(self, stop, line):
         print(Fore.LIGHTBLACK_EX + Style.DIM +
               f"· Finished: '{line.strip() or '[empty input]'}' ·" + Style.RESET_ALL)
+        self._show_rpc_notice()
         if self.rpc_active:
             self._set_idle_presence()
         return stop
@@ -268,72 +318,49 @@ class M5RShell(cmd.Cmd):
 
     # ----------- Stylized HELP command ----------- #
     def do_help(self, arg):
-        blen = BANNER_LENGTH
-        inner_width = blen - 2
-        def c(s): return "║" + s + "║"
         if arg:
             super().do_help(arg)
         else:
-            # Top border
-            print(Fore.LIGHTCYAN_EX + "╔" + "═" * inner_width + "╗")
-
-            # ASCII art heading
-            fig = Figlet(font='standard')
-            for line in fig.renderText("M5R   HELP").splitlines():
-                if line.strip() == "": continue
-                raw = line[:inner_width]
-                pad = (inner_width - len(strip_ansi(raw))) // 2
-                out = " " * pad + purple_gradient_text(raw)
-                out = out + " " * (inner_width - len(strip_ansi(out)))
-                print(Fore.LIGHTCYAN_EX + c(out))
-
-            print(Fore.LIGHTCYAN_EX + "╟" + "─" * inner_width + "╢" + Style.RESET_ALL)
-
-            # Section headers and commands
-            sections = [
-                (" FILE/PROJECT ", [
-                    ("new", "Create a new .m5r file"),
-                    ("nano", "Edit a file with your editor"),
-                    ("run", "Run a .m5r script (executes only Python blocks)")
-                ]),
-                (" INFORMATION ", [
-                    ("fastfetch", "Show language & system info"),
-                    ("credits", "Show project credits"),
-                ]),
-                (" NAVIGATION & UTILITY ", [
-                    ("cd", "Change directory within m5rcode/files"),
-                    ("dir", "List files in the current directory"),
-                    ("wdir", "List files hosted at a website directory"),
-                    ("clear", "Clear the shell output"),
-                    ("exit", "Exit the m5rcode shell"),
-                    ("help", "Display this help message"),
-                    ("?", "Alias for 'help'")
-                ])
-            ]
-            for idx, (header, cmds) in enumerate(sections):
-                header_line = purple_gradient_text(header.center(inner_width))
-                print(Fore.LIGHTCYAN_EX + c(header_line))
-                for command, desc in cmds:
-                    print(self._print_command_help(command, desc, inner_width, boxed=True))
-                if idx < len(sections) - 1:
-                    print(Fore.LIGHTCYAN_EX + "╟" + "─" * inner_width + "╢" + Style.RESET_ALL)
-
-            # Bottom border
-            print(Fore.LIGHTCYAN_EX + "╚" + "═" * inner_width + "╝" + Style.RESET_ALL)
-            # Footer
-            foot = Fore.LIGHTBLACK_EX + Style.DIM + "For details: " + Style.NORMAL + Fore.LIGHTCYAN_EX + "help <command>" + Style.RESET_ALL
-            pad = (blen - len(strip_ansi(foot))) // 2
-            print(" " * pad + foot)
-            print()
+            render.write(render_cache.screen(
+                "help", self._render_help, BANNER_LENGTH, Fore.LIGHTCYAN_EX, PURPLE_GRADIENT, HELP_SECTIONS))
+
+    def _render_help(self):
+        blen = BANNER_LENGTH
+        inner_width = blen - 2
+        frame = render.Frame()
+        box = render.Box(frame, inner_width, Fore.LIGHTCYAN_EX)
+        box.top()
+
+        # ASCII art heading
+        for line in render_cache.figlet_text("M5R   HELP", font='standard').splitlines():
+            if line.strip() == "": continue
+            raw = line[:inner_width]
+            pad = (inner_width - render.width(raw)) // 2
+            box.row(" " * pad + purple_gradient_text(raw))
+
+        box.rule()
+
+        # Section headers and commands
+        for idx, (header, cmds) in enumerate(HELP_SECTIONS):
+            box.row(purple_gradient_text(header.center(inner_width)))
+            for command, desc in cmds:
+                frame.line(self._print_command_help(command, desc, inner_width, boxed=True))
+            if idx < len(HELP_SECTIONS) - 1:
+                box.rule()
+
+        box.bottom()
+        # Footer
+        foot = Fore.LIGHTBLACK_EX + Style.DIM + "For details: " + Style.NORMAL + Fore.LIGHTCYAN_EX + "help <command>" + Style.RESET_ALL
+        frame.line(center_text(foot, blen))
+        frame.line()
+        return frame.text()
 
     def _print_command_help(self, command, description, inner_width=68, boxed=False):
         left = f"{Fore.LIGHTGREEN_EX}{command:<10}{Style.RESET_ALL}"
         arr = f"{Fore.LIGHTCYAN_EX}→{Style.RESET_ALL}"
         desc = f"{Fore.LIGHTWHITE_EX}{description}{Style.RESET_ALL}"
-        raw = f"  {left}{arr} {desc}"
-        raw_stripped = strip_ansi(raw)
-        # pad so the visual column is even, including color codes
-        line = raw + " " * (inner_width - len(raw_stripped))
+        # pad so the visual column is even, whatever the color codes
+        line = render.fill(f"  {left}{arr} {desc}", inner_width)
         if boxed:
             return Fore.LIGHTCYAN_EX + "║" + line + "║" + Style.RESET_ALL
         else:
@@ -342,40 +369,59 @@ class M5RShell(cmd.Cmd):
     # ------------- Remaining commands unchanged ------------- #
 
     def do_clear(self, arg):
-        os.system('cls' if os.name == 'nt' else 'clear')
-        self._print_banner()
+        self._print_banner(clear=True)
         self.update_prompt()
 
     def do_new(self, arg):
         if self.rpc_active:
             self._set_running_presence("new file")
-        NewCommand(self.cwd, arg.strip()).run()
+        command("new")(self.cwd, arg.strip()).run()
 
     def do_nano(self, arg):
         filename = arg.strip()
         if self.rpc_active:
             self._set_editing_presence(filename)
-        NanoCommand(self.cwd, filename).run()
+        command("nano")(self.cwd, filename).run()
 
     def do_run(self, arg):
+        # run <file> [--trace <out.json|out.jsonl>] [--watch]
+        words = arg.split()
+        trace_path = None
+        watch = "--watch" in words
+        if watch:
+            words.remove("--watch")
+        if "--trace" in words:
+            i = words.index("--trace")
+            trace_path = words[i + 1] if i + 1 < len(words) else "m5r_trace.json"
+            del words[i:i + 2]
+        filename = " ".join(words)
         if self.rpc_active:
-            self._set_running_presence(f"script {arg.strip()}")
-        RunCommand(self.cwd, arg.strip()).run()
+            self._set_running_presence(f"script {filename}")
+        command("run")(self.cwd, filename, trace_path=trace_path, watch=watch).run()
+
+    def do_compile(self, arg):
+        if self.rpc_active:
+            self._set_running_presence(f"compiling {arg}")
+        command("compile")(self.cwd, arg).run()
+
+    def do_output(self, arg):
+        # output [<n> [save <file>]]
+        command("output")(self.cwd, arg).run()
 
     def do_fastfetch(self, arg):
         if self.rpc_active:
             self._set_running_presence("fastfetch")
-        FastfetchCommand().run()
+        command("fastfetch")().run()
 
     def do_credits(self, arg):
         if self.rpc_active:
             self._set_running_presence("credits")
-        CreditsCommand().run()
+        command("credits")().run()
 
     def do_cd(self, arg):
         if self.rpc_active:
             self._set_running_presence(f"changing directory to {arg.strip()}")
-        CdCommand(self.base_dir, [self], arg).run()
+        command("cd")(self.base_dir, [self], arg).run()
         os.chdir(self.cwd)
         self.update_prompt()
 
@@ -387,25 +433,45 @@ class M5RShell(cmd.Cmd):
             if not files:
                 print(Fore.YELLOW + "Directory is empty." + Style.RESET_ALL)
                 return
-            print(Fore.GREEN + "\nFiles in directory:" + Style.RESET_ALL)
+            frame = render.Frame()
+            frame.line(Fore.GREEN + "\nFiles in directory:" + Style.RESET_ALL)
             for f in files:
                 path = os.path.join(self.cwd, f)
                 if os.path.isdir(path):
-                    print(f"  {Fore.CYAN}{f}/ {Style.RESET_ALL}")
+                    frame.line(f"  {Fore.CYAN}{f}/ {Style.RESET_ALL}")
                 else:
-                    print(f"  {Fore.WHITE}{f}{Style.RESET_ALL}")
+                    frame.line(f"  {Fore.WHITE}{f}{Style.RESET_ALL}")
+            frame.flush()
         except Exception as e:
             print(Fore.RED + f"[ERR] {e}" + Style.RESET_ALL)
 
     def do_wdir(self, arg):
         if self.rpc_active:
             self._set_running_presence("wdir")
-        WdirCommand(arg).run()
+        command("wdir")(arg).run()
 
     def do_exit(self, arg):
         self._clear_presence()
         self._close_rpc()
-        return ExitCommand().run()
+        return command("exit")().run()
+
+def main(argv=None):
+    global ANIMATIONS
+    argv = sys.argv[1:] if argv is None else argv
+    if "--no-animations" in argv:
+        ANIMATIONS = False
+    if not PROFILE:
+        M5RShell().cmdloop()
+        return 0
+    # Go as far as the first prompt, report and leave
+    fmt = "json" if "--startup-profile=json" in argv else "text"
+    PROFILE.phases.append(("module imports", PROFILE.elapsed()))
+    with PROFILE.phase("shell init"):
+        shell = M5RShell()
+    shell.preloop()
+    PROFILE.stop()
+    PROFILE.report(fmt)
+    return 0
 
 if __name__ == "__main__":
-    M5RShell().cmdloop()
+    sys.exit(main())
@@ -0,0 +1,83 @@
+// Data channel between the blocks of one m5rcode run, C# side. Compiled
+// into any <?cs block that mentions M5RChannel.
+//
+//   byte[] xs = M5RChannel.Get("xs");   // null if unset
+//   M5RChannel.Put("greeting", System.Text.Encoding.UTF8.GetBytes("hi"));
+//
+// Layout: see m5r_channel.py.
+using System;
+using System.IO;
+using System.Text;
+using System.IO.MemoryMappedFiles;
+
+static class M5RChannel
+{
+    static MemoryMappedViewAccessor view;
+
+    static MemoryMappedViewAccessor Map()
+    {
+        if (view != null) return view;
+        string path = Environment.GetEnvironmentVariable("M5R_CHANNEL");
+        if (string.IsNullOrEmpty(path))
+            throw new InvalidOperationException("no m5r channel, this is only available inside an m5rcode run");
+        var file = MemoryMappedFile.CreateFromFile(
+            new FileStream(path, FileMode.Open, FileAccess.ReadWrite, FileShare.ReadWrite),
+            null, 0, MemoryMappedFileAccess.ReadWrite, HandleInheritability.None, false);
+        view = file.CreateViewAccessor();
+        var magic = new byte[8];
+        view.ReadArray(0, magic, 0, 8);
+        if (Encoding.ASCII.GetString(magic) != "M5RCHAN1")
+            throw new InvalidOperationException(path + " is not an m5r channel");
+        return view;
+    }
+
+    static long Pad(long n) { return (n + 7) & ~7L; }
+
+    public static byte[] Get(string name)
+    {
+        var m = Map();
+        long end = m.ReadInt64(8), off = 16, foundAt = -1, foundLen = 0;
+        while (off < end)
+        {
+            int nameLen = m.ReadInt32(off);
+            long dataLen = m.ReadInt64(off + 8);
+            var recordName = new byte[nameLen];
+            m.ReadArray(off + 16, recordName, 0, nameLen);
+            long dataAt = off + 16 + Pad(nameLen);
+            if (Encoding.UTF8.GetString(recordName) == name) { foundAt = dataAt; foundLen = dataLen; }
+            off = dataAt + Pad(dataLen);
+        }
+        if (foundAt < 0) return null;
+        var data = new byte[foundLen];
+        m.ReadArray(foundAt, data, 0, (int) foundLen);
+        return data;
+    }
+
+    public static string GetString(string name)
+    {
+        var data = Get(name);
+        return data == null ? null : Encoding.UTF8.GetString(data);
+    }
+
+    public static void Put(string name, byte[] data)
+    {
+        var m = Map();
+        var nameBytes = Encoding.UTF8.GetBytes(name);
+        long end = m.ReadInt64(8);
+        long dataAt = end + 16 + Pad(nameBytes.Length);
+        long newEnd = dataAt + Pad(data.Length);
+        if (newEnd > m.Capacity)
+            throw new InvalidOperationException("m5r channel is full (see M5R_CHANNEL_MB)");
+        m.Write(end, nameBytes.Length);
+        m.Write(end + 4, 0);
+        m.Write(end + 8, (long) data.Length);
+        m.WriteArray(end + 16, nameBytes, 0, nameBytes.Length);
+        m.WriteArray(dataAt, data, 0, data.Length);
+        m.Write(8, newEnd);
+    }
+
+    public static void Put(string name, string value)
+    {
+        Put(name, Encoding.UTF8.GetBytes(value));
+    }
+}
@@ -0,0 +1,121 @@
+// Data channel between the blocks of one m5rcode run, C++ side. Included
+// automatically into any <?cpp block that mentions m5r_channel.
+//
+//   size_t n;
+//   const double *xs = m5r_channel::get_as<double>("xs", &n);   // nullptr if unset
+//   m5r_channel::put("sum", &total, sizeof total);
+//
+// get() points straight into the shared mapping, nothing is copied.
+// Layout: see m5r_channel.py.
+#ifndef M5R_CHANNEL_H
+#define M5R_CHANNEL_H
+
+#include <cstdint>
+#include <cstdlib>
+#include <cstring>
+#include <string>
+#include <stdexcept>
+
+#ifdef _WIN32
+#include <windows.h>
+#else
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#endif
+
+namespace m5r_channel {
+
+struct Map { unsigned char *base; size_t size; };
+
+inline Map &map() {
+    static Map m = {nullptr, 0};
+    if (m.base) return m;
+    const char *path = std::getenv("M5R_CHANNEL");
+    if (!path) throw std::runtime_error("no m5r channel, this is only available inside an m5rcode run");
+#ifdef _WIN32
+    HANDLE file = CreateFileA(path, GENERIC_READ | GENERIC_WRITE, FILE_SHARE_READ | FILE_SHARE_WRITE,
+                              nullptr, OPEN_EXISTING, FILE_ATTRIBUTE_NORMAL, nullptr);
+    if (file == INVALID_HANDLE_VALUE) throw std::runtime_error("can't open the m5r channel");
+    LARGE_INTEGER size;
+    GetFileSizeEx(file, &size);
+    HANDLE mapping = CreateFileMappingA(file, nullptr, PAGE_READWRITE, 0, 0, nullptr);
+    void *base = mapping ? MapViewOfFile(mapping, FILE_MAP_ALL_ACCESS, 0, 0, 0) : nullptr;
+    if (!base) throw std::runtime_error("can't map the m5r channel");
+    m.size = (size_t) size.QuadPart;
+#else
+    int fd = open(path, O_RDWR);
+    struct stat st;
+    if (fd < 0 || fstat(fd, &st) != 0) throw std::runtime_error("can't open the m5r channel");
+    void *base = mmap(nullptr, st.st_size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    close(fd);
+    if (base == MAP_FAILED) throw std::runtime_error("can't map the m5r channel");
+    m.size = (size_t) st.st_size;
+#endif
+    m.base = (unsigned char *) base;
+    if (std::memcmp(m.base, "M5RCHAN1", 8) != 0) throw std::runtime_error("not an m5r channel");
+    return m;
+}
+
+inline size_t pad(size_t n) { return (n + 7) & ~(size_t) 7; }
+
+inline const void *get(const std::string &name, size_t *size = nullptr) {
+    Map &m = map();
+    uint64_t end;
+    std::memcpy(&end, m.base + 8, 8);
+    const void *found = nullptr;
+    size_t off = 16;
+    while (off < end) {
+        uint32_t name_len;
+        uint64_t data_len;
+        std::memcpy(&name_len, m.base + off, 4);
+        std::memcpy(&data_len, m.base + off + 8, 8);
+        size_t data_at = off + 16 + pad(name_len);
+        if (name_len == name.size() && std::memcmp(m.base + off + 16, name.data(), name_len) == 0) {
+            found = m.base + data_at;
+            if (size) *size = (size_t) data_len;
+        }
+        off = data_at + pad((size_t) data_len);
+    }
+    return found;
+}
+
+template <class T>
+inline const T *get_as(const std::string &name, size_t *count = nullptr) {
+    size_t size = 0;
+    const T *data = static_cast<const T *>(get(name, &size));
+    if (count) *count = data ? size / sizeof(T) : 0;
+    return data;
+}
+
+inline std::string get_string(const std::string &name) {
+    size_t size = 0;
+    const char *data = static_cast<const char *>(get(name, &size));
+    return data ? std::string(data, size) : std::string();
+}
+
+inline void put(const std::string &name, const void *data, size_t size) {
+    Map &m = map();
+    uint64_t end;
+    std::memcpy(&end, m.base + 8, 8);
+    size_t data_at = (size_t) end + 16 + pad(name.size());
+    uint64_t new_end = data_at + pad(size);
+    if (new_end > m.size) throw std::runtime_error("m5r channel is full (see M5R_CHANNEL_MB)");
+    uint32_t name_len = (uint32_t) name.size(), zero = 0;
+    uint64_t data_len = size;
+    std::memcpy(m.base + end, &name_len, 4);
+    std::memcpy(m.base + end + 4, &zero, 4);
+    std::memcpy(m.base + end + 8, &data_len, 8);
+    std::memcpy(m.base + end + 16, name.data(), name.size());
+    std::memcpy(m.base + data_at, data, size);
+    std::memcpy(m.base + 8, &new_end, 8);
+}
+
+inline void put(const std::string &name, const std::string &value) {
+    put(name, value.data(), value.size());
+}
+
+}
+
+#endif
@@ -0,0 +1,87 @@
+// Data channel between the blocks of one m5rcode run, Node side.
+//
+//   const channel = require('m5r_channel');
+//   channel.put('xs', Buffer.from(new Float64Array(values).buffer));
+//   const xs = channel.get('xs');   // Buffer, or null
+//
+// Node has no mmap, so this reads and writes the channel file at offsets.
+// The file lives on tmpfs where there is one, which is the same memory the
+// other runtimes map. Layout: see m5r_channel.py.
+const fs = require('fs');
+
+const MAGIC = 'M5RCHAN1';
+const HEADER = 16;
+const RECORD = 16;
+
+function open() {
+  const path = process.env.M5R_CHANNEL;
+  if (!path) throw new Error('no m5r channel, this is only available inside an m5rcode run');
+  const fd = fs.openSync(path, 'r+');
+  const head = Buffer.alloc(HEADER);
+  fs.readSync(fd, head, 0, HEADER, 0);
+  if (head.toString('latin1', 0, 8) !== MAGIC) {
+    fs.closeSync(fd);
+    throw new Error(path + ' is not an m5r channel');
+  }
+  return { fd, end: Number(head.readBigUInt64LE(8)), size: fs.fstatSync(fd).size };
+}
+
+const pad = (n) => (n + 7) & ~7;
+
+function find(ch, name) {
+  const head = Buffer.alloc(RECORD);
+  let off = HEADER, found = null;
+  while (off < ch.end) {
+    fs.readSync(ch.fd, head, 0, RECORD, off);
+    const nameLen = head.readUInt32LE(0), dataLen = Number(head.readBigUInt64LE(8));
+    const nameBuf = Buffer.alloc(nameLen);
+    fs.readSync(ch.fd, nameBuf, 0, nameLen, off + RECORD);
+    const dataAt = off + RECORD + pad(nameLen);
+    if (nameBuf.toString('utf8') === name) found = [dataAt, dataLen];
+    off = dataAt + pad(dataLen);
+  }
+  return found;
+}
+
+function get(name) {
+  const ch = open();
+  try {
+    const found = find(ch, name);
+    if (!found) return null;
+    const data = Buffer.alloc(found[1]);
+    fs.readSync(ch.fd, data, 0, found[1], found[0]);
+    return data;
+  } finally {
+    fs.closeSync(ch.fd);
+  }
+}
+
+function getString(name) {
+  const data = get(name);
+  return data === null ? null : data.toString('utf8');
+}
+
+function put(name, data) {
+  if (typeof data === 'string') data = Buffer.from(data, 'utf8');
+  else if (!Buffer.isBuffer(data)) data = Buffer.from(data.buffer || data, data.byteOffset || 0, data.byteLength);
+  const nameBuf = Buffer.from(name, 'utf8');
+  const ch = open();
+  try {
+    const dataAt = ch.end + RECORD + pad(nameBuf.length);
+    const end = dataAt + pad(data.length);
+    if (end > ch.size) throw new Error('m5r channel is full (' + ch.size + ' bytes, see M5R_CHANNEL_MB)');
+    const head = Buffer.alloc(RECORD);
+    head.writeUInt32LE(nameBuf.length, 0);
+    head.writeBigUInt64LE(BigInt(data.length), 8);
+    fs.writeSync(ch.fd, head, 0, RECORD, ch.end);
+    fs.writeSync(ch.fd, nameBuf, 0, nameBuf.length, ch.end + RECORD);
+    fs.writeSync(ch.fd, data, 0, data.length, dataAt);
+    const endBuf = Buffer.alloc(8);
+    endBuf.writeBigUInt64LE(BigInt(end), 0);
+    fs.writeSync(ch.fd, endBuf, 0, 8, 8);
+  } finally {
+    fs.closeSync(ch.fd);
+  }
+}
+
+module.exports = { get, getString, put };
@@ -0,0 +1,67 @@
+<?php
+// Data channel between the blocks of one m5rcode run, PHP side.
+//
+//   m5r_channel_put('xs', pack('e*', ...$values));
+//   $xs = unpack('e*', m5r_channel_get('xs'));   // string, or null
+//
+// PHP has no mmap, so this reads and writes the channel file at offsets.
+// Layout: see m5r_channel.py.
+
+function m5r_channel_open() {
+    $path = getenv('M5R_CHANNEL');
+    if (!$path) {
+        throw new RuntimeException('no m5r channel, this is only available inside an m5rcode run');
+    }
+    $f = fopen($path, 'r+b');
+    if (fread($f, 8) !== 'M5RCHAN1') {
+        fclose($f);
+        throw new RuntimeException("$path is not an m5r channel");
+    }
+    $end = unpack('P', fread($f, 8))[1];
+    return [$f, $end];
+}
+
+function m5r_channel_pad($n) {
+    return ($n + 7) & ~7;
+}
+
+function m5r_channel_get($name) {
+    [$f, $end] = m5r_channel_open();
+    $off = 16;
+    $found = null;
+    while ($off < $end) {
+        fseek($f, $off);
+        $head = unpack('Vname/Vzero/Pdata', fread($f, 16));
+        $record_name = $head['name'] ? fread($f, $head['name']) : '';
+        $data_at = $off + 16 + m5r_channel_pad($head['name']);
+        if ($record_name === $name) {
+            $found = [$data_at, $head['data']];
+        }
+        $off = $data_at + m5r_channel_pad($head['data']);
+    }
+    $data = null;
+    if ($found !== null) {
+        fseek($f, $found[0]);
+        $data = $found[1] ? fread($f, $found[1]) : '';
+    }
+    fclose($f);
+    return $data;
+}
+
+function m5r_channel_put($name, $data) {
+    [$f, $end] = m5r_channel_open();
+    $data = (string) $data;
+    $data_at = $end + 16 + m5r_channel_pad(strlen($name));
+    $new_end = $data_at + m5r_channel_pad(strlen($data));
+    if ($new_end > fstat($f)['size']) {
+        fclose($f);
+        throw new RuntimeException('m5r channel is full (see M5R_CHANNEL_MB)');
+    }
+    fseek($f, $end);
+    fwrite($f, pack('VVP', strlen($name), 0, strlen($data)) . $name);
+    fseek($f, $data_at);
+    fwrite($f, $data);
+    fseek($f, 8);
+    fwrite($f, pack('P', $new_end));
+    fclose($f);
+}
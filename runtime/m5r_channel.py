@@ -0,0 +1,96 @@
+import os
+import mmap
+import struct
+import threading
+
+# Data channel between the blocks of one m5rcode run, Python side.
+#
+#   import m5r_channel
+#   m5r_channel.put("xs", array.array("d", values))   # any bytes-like or str
+#   view = m5r_channel.get("xs")                       # memoryview, or None
+#
+# The channel is one file-backed shared mapping per run, named by
+# M5R_CHANNEL. Layout (little endian): an 8 byte magic, the u64 offset of
+# the end of the data, then records of
+#   u32 name length, u32 zero, u64 data length, name, data
+# with name and data each padded to 8 bytes, so numeric arrays come out
+# aligned. Records are only ever appended; the latest one for a name wins.
+
+MAGIC = b"M5RCHAN1"
+HEADER = 16
+_RECORD = struct.Struct("<IIQ")
+_END = struct.Struct("<Q")
+
+_local = threading.local()
+_maps = {}
+
+def use(path):
+    """Point this thread at a channel (for blocks run inside the shell itself)"""
+    _local.path = path
+
+def _map():
+    path = getattr(_local, "path", None) or os.environ.get("M5R_CHANNEL")
+    if not path:
+        raise RuntimeError("no m5r channel, this is only available inside an m5rcode run")
+    m = _maps.get(path)
+    if m is None:
+        # A warm worker outlives its runs, drop the channels of earlier ones
+        for old in list(_maps):
+            try:
+                _maps.pop(old).close()
+            except BufferError:
+                pass
+        with open(path, "r+b") as f:
+            m = mmap.mmap(f.fileno(), 0)
+        if m[:8] != MAGIC:
+            raise RuntimeError(f"{path} is not an m5r channel")
+        _maps[path] = m
+    return m
+
+def _pad(n):
+    return (n + 7) & ~7
+
+def _records(m):
+    end = _END.unpack_from(m, 8)[0]
+    off = HEADER
+    while off < end:
+        name_len, _, data_len = _RECORD.unpack_from(m, off)
+        name_at = off + _RECORD.size
+        data_at = name_at + _pad(name_len)
+        yield bytes(m[name_at:name_at + name_len]).decode("utf-8"), data_at, data_len
+        off = data_at + _pad(data_len)
+
+def put(name, data):
+    m = _map()
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    data = memoryview(data).cast("B")
+    name_bytes = name.encode("utf-8")
+    off = _END.unpack_from(m, 8)[0]
+    data_at = off + _RECORD.size + _pad(len(name_bytes))
+    end = data_at + _pad(len(data))
+    if end > len(m):
+        raise MemoryError(f"m5r channel is full ({len(m)} bytes, see M5R_CHANNEL_MB)")
+    _RECORD.pack_into(m, off, len(name_bytes), 0, len(data))
+    m[off + _RECORD.size:off + _RECORD.size + len(name_bytes)] = name_bytes
+    m[data_at:data_at + len(data)] = data
+    # Publish the record last, readers never see half of it
+    _END.pack_into(m, 8, end)
+
+def get(name):
+    """The latest value stored under name as a memoryview into the channel"""
+    m = _map()
+    found = None
+    for record_name, data_at, data_len in _records(m):
+        if record_name == name:
+            found = (data_at, data_len)
+    if found is None:
+        return None
+    return memoryview(m)[found[0]:found[0] + found[1]]
+
+def get_str(name):
+    view = get(name)
+    return None if view is None else bytes(view).decode("utf-8")
+
+def names():
+    return sorted({name for name, _, _ in _records(_map())})
@@ -0,0 +1,106 @@
+import os
+import shutil
+import hashlib
+
+from utils.cache_dir import cache_path, temp_name
+from utils import toolchains
+
+DEFAULT_MAX_BYTES = int(os.environ.get("M5R_ARTIFACT_CACHE_MB", "256")) * 1024 * 1024
+
+def compiler_id(compiler):
+    """Resolved path + version string of a compiler, or None if it's missing"""
+    if not compiler:
+        return None
+    tool = toolchains.get(compiler)
+    if tool is None:
+        return None
+    return f"{tool.path}\n{tool.version_text}"
+
+class ArtifactCache:
+    """Compiled executables stored by a hash of source, compiler and flags.
+    Least recently used entries are evicted once the cache passes max_bytes."""
+
+    def __init__(self, name, suffix="", max_bytes=DEFAULT_MAX_BYTES):
+        self.name = name
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def dir(self):
+        return cache_path("artifacts", self.name)
+
+    def key(self, source, compiler, flags=()):
+        h = hashlib.sha256()
+        for part in (source, compiler_id(compiler) or compiler, "\0".join(flags)):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.dir, key + self.suffix)
+
+    def get(self, key):
+        path = self._entry(key)
+        if os.path.exists(path):
+            self.hits += 1
+            try:
+                # mtime doubles as the LRU clock
+                os.utime(path)
+            except OSError:
+                pass
+            return path
+        self.misses += 1
+        return None
+
+    def put(self, key, built_path):
+        """Move a freshly built artifact into the cache and return its new path"""
+        target = self._entry(key)
+        tmp = temp_name(target)
+        shutil.move(built_path, tmp)
+        os.chmod(tmp, 0o755)
+        try:
+            os.replace(tmp, target)
+        except OSError:
+            # Another thread or process put the same key first (Windows
+            # won't replace a file that is running), theirs will do
+            os.unlink(tmp)
+            if not os.path.exists(target):
+                raise
+        self.evict()
+        return target
+
+    def entries(self):
+        found = []
+        for entry in os.scandir(self.dir):
+            if entry.name.endswith(".tmp") or not entry.is_file():
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue  # evicted or replaced meanwhile
+            found.append((st.st_mtime, st.st_size, entry.path))
+        return found
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,138 @@
+import os
+import re
+import json
+import mmap
+import hashlib
+from collections import namedtuple
+
+from utils.cache_dir import cache_path, temp_name
+
+# Bump when the on-disk plan layout or the tokenizer rules change
+PLAN_VERSION = 2
+
+# One pass over the source. Tags must not run into another word character,
+# so "<?css" is never read as a "<?cs" block followed by "s". Attributes go
+# in brackets straight after the tag, e.g. <?js[pure ttl=3600]
+BLOCK_RE = re.compile(rb'<\?(cpp|css|php|cs|py|js|sh)(?!\w)(?:\[([^\]\n]*)\])?(.*?)\?>', re.S)
+
+# start/end are byte offsets of the block body, line is the 1-based line
+# of the opening tag, attrs is the raw text between the tag's brackets
+Block = namedtuple("Block", "index lang start end line attrs")
+
+# Files at least this big are memory-mapped instead of read, and run with
+# a lazy block iterator (see stream_plan)
+MMAP_THRESHOLD = int(os.environ.get("M5R_MMAP_MB", "8")) * 1024 * 1024
+LINE_CHUNK = 1 << 20
+
+_memory_plans = {}
+
+def _count_lines(data, start, end):
+    if isinstance(data, bytes):
+        return data.count(b"\n", start, end)
+    # mmap has no count(); go through it a chunk at a time
+    return sum(data[i:min(i + LINE_CHUNK, end)].count(b"\n") for i in range(start, end, LINE_CHUNK))
+
+def iter_blocks(data):
+    """Yield the blocks of a .m5r buffer (bytes or mmap) in document order"""
+    line = 1
+    pos = 0
+    for index, m in enumerate(BLOCK_RE.finditer(data)):
+        line += _count_lines(data, pos, m.start())
+        pos = m.start()
+        attrs = (m.group(2) or b"").decode("utf-8", errors="replace")
+        yield Block(index, m.group(1).decode("ascii"), m.start(3), m.end(3), line, attrs)
+
+def tokenize(source):
+    if isinstance(source, str):
+        source = source.encode("utf-8")
+    return list(iter_blocks(source))
+
+def block_body(data, block):
+    """The raw body of a block as a memoryview into data, nothing is copied"""
+    return memoryview(data)[block.start:block.end]
+
+def block_code(data, block):
+    return str(block_body(data, block), "utf-8", "replace").strip()
+
+def map_file(path):
+    """Read-only mapping of a file (b"" for an empty one, which can't be mapped)"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def stream_plan(path):
+    """Return (data, blocks) for a big .m5r file: data is a mapping of the
+    file and blocks an iterator that finds each block as it's asked for, so
+    neither the file nor its block list is ever held in memory at once"""
+    data = map_file(path)
+    return data, iter_blocks(data)
+
+def is_large(path):
+    return os.path.getsize(path) >= MMAP_THRESHOLD
+
+def block_attrs(block):
+    """Parse "pure ttl=60" into {"pure": True, "ttl": "60"}"""
+    attrs = {}
+    for item in block.attrs.replace(",", " ").split():
+        name, sep, value = item.partition("=")
+        attrs[name.lower()] = value if sep else True
+    return attrs
+
+def _plan_file(path):
+    digest = hashlib.sha1(path.encode("utf-8", errors="surrogateescape")).hexdigest()
+    return os.path.join(cache_path("plans"), digest + ".json")
+
+def _plan_key(path, st):
+    return (path, st.st_mtime_ns, st.st_size)
+
+def _read_disk_plan(path, key):
+    try:
+        with open(_plan_file(path), encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get("version") != PLAN_VERSION or tuple(cached.get("key", ())) != key:
+        return None
+    return [Block(i, *fields) for i, fields in enumerate(cached["blocks"])]
+
+def _write_disk_plan(path, key, blocks):
+    target = _plan_file(path)
+    tmp = temp_name(target)
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": PLAN_VERSION,
+                "key": list(key),
+                "blocks": [[b.lang, b.start, b.end, b.line, b.attrs] for b in blocks],
+            }, f)
+        os.replace(tmp, target)
+    except OSError:
+        # The plan cache is only an optimisation
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+def load_plan(path):
+    """Return (data, blocks) for a .m5r file, reusing a cached plan when the
+    file's path, mtime and size are unchanged"""
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    key = _plan_key(path, st)
+    if st.st_size >= MMAP_THRESHOLD:
+        data = map_file(path)
+    else:
+        with open(path, "rb") as f:
+            data = f.read()
+
+    cached = _memory_plans.get(path)
+    if cached and cached[0] == key:
+        return data, cached[1]
+
+    blocks = _read_disk_plan(path, key)
+    if blocks is None:
+        blocks = tokenize(data)
+        _write_disk_plan(path, key, blocks)
+    _memory_plans[path] = (key, blocks)
+    return data, blocks
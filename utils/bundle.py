@@ -0,0 +1,103 @@
+import os
+import json
+import mmap
+import struct
+import zipfile
+
+from utils.cache_dir import temp_name
+
+# .m5rc bundles: a .m5r compiled ahead of time (see compile_bundle in
+# m5r_interpreter.py). A bundle is a plain zip with every member stored
+# uncompressed, so a member is just a byte range of the file and is read
+# straight out of a memory mapping. Members:
+#   manifest.json    blocks in order, source and toolchain hashes
+#   blocks/N.<lang>  each block's code, already extracted
+#   wrapped/N.<ext>  the full source a C++/C# block compiles as
+#   bin/N            its prebuilt executable
+
+FORMAT = 1
+MANIFEST = "manifest.json"
+_LOCAL_HEADER = struct.Struct("<4s22xHH")  # signature ... name length, extra length
+
+class BundleError(Exception):
+    pass
+
+def write_bundle(path, manifest, members):
+    """members: (name, bytes) or (name, file path) pairs"""
+    tmp = temp_name(path)
+    try:
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_STORED) as zf:
+            zf.writestr(MANIFEST, json.dumps(dict(manifest, format=FORMAT), indent=1))
+            for name, content in members:
+                if isinstance(content, bytes):
+                    zf.writestr(name, content)
+                else:
+                    zf.write(content, name)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+def _check_manifest(manifest):
+    """Raises KeyError/TypeError if manifest lacks what running it takes"""
+    dict(manifest["toolchains"])
+    for block in manifest["blocks"]:
+        block["lang"], block["attrs"], block["line"], block["code"]
+        if "binary" in block:
+            block["cache_key"]
+
+class Bundle:
+    def __init__(self, path):
+        self.path = path
+        try:
+            self.zip = zipfile.ZipFile(path)
+        except (OSError, zipfile.BadZipFile) as e:
+            raise BundleError(f"{path}: not an m5rc bundle ({e})")
+        self.map = None
+        try:
+            with open(path, "rb") as f:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.manifest = json.loads(self.text(MANIFEST))
+            if self.manifest.get("format") != FORMAT:
+                raise BundleError(f"{path}: unsupported bundle format {self.manifest.get('format')}")
+            _check_manifest(self.manifest)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.close()
+            raise BundleError(f"{path}: damaged manifest ({type(e).__name__}: {e})") from e
+        except BaseException:
+            self.close()
+            raise
+
+    def span(self, name):
+        """(start, end) of a member's bytes in the file"""
+        try:
+            info = self.zip.getinfo(name)
+        except KeyError:
+            raise BundleError(f"{self.path}: missing member {name}")
+        if info.compress_type != zipfile.ZIP_STORED:
+            raise BundleError(f"{self.path}: member {name} is compressed")
+        signature, name_len, extra_len = _LOCAL_HEADER.unpack_from(self.map, info.header_offset)
+        if signature != b"PK\x03\x04":
+            raise BundleError(f"{self.path}: damaged member {name}")
+        start = info.header_offset + _LOCAL_HEADER.size + name_len + extra_len
+        return start, start + info.file_size
+
+    def member(self, name):
+        start, end = self.span(name)
+        return memoryview(self.map)[start:end]
+
+    def text(self, name):
+        return str(self.member(name), "utf-8")
+
+    def close(self):
+        self.zip.close()
+        if self.map is None:
+            return
+        try:
+            self.map.close()
+        except BufferError:
+            # A memoryview into it is still around, let GC unmap it
+            pass
@@ -0,0 +1,18 @@
+import os
+import threading
+
+# All on-disk caches live under ~/m5rcode/.cache (next to the shell's files/ dir)
+# unless M5R_CACHE_DIR points somewhere else.
+CACHE_ROOT = os.environ.get("M5R_CACHE_DIR") or os.path.join(
+    os.path.expanduser("~"), "m5rcode", ".cache"
+)
+
+def cache_path(*parts):
+    """Return a directory under the cache root, creating it if needed"""
+    path = os.path.join(CACHE_ROOT, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def temp_name(target):
+    """Where to write target before os.replace(), unique per process and thread"""
+    return f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
@@ -0,0 +1,209 @@
+import os
+import re
+import gzip
+import time
+import itertools
+import threading
+import subprocess
+
+from utils.cache_dir import cache_path
+
+# Bounded output capture. A block's output is kept in memory only up to
+# HEAD_BYTES from the start plus TAIL_BYTES from the end. Once it's bigger
+# than that, everything it prints also goes to a gzip file under
+# <cache>/output and the terminal gets the head, a "N bytes omitted" marker
+# and the tail. The full text can be paged or saved later with the shell's
+# "output" command. A block that never stops printing is cut off on disk
+# too, after MAX_SPILL_BYTES.
+
+HEAD_BYTES = int(os.environ.get("M5R_OUTPUT_HEAD_KB", "64")) * 1024
+TAIL_BYTES = int(os.environ.get("M5R_OUTPUT_TAIL_KB", "64")) * 1024
+MAX_SPILL_BYTES = int(os.environ.get("M5R_OUTPUT_MAX_MB", "512")) * 1024 * 1024
+KEEP_SPILLS = 20
+CHUNK = 65536
+MARKER_SLACK = 1024  # room for the marker line in an already bounded text
+
+_names = itertools.count()
+
+def spill_dir():
+    return cache_path("output")
+
+def spills():
+    """Saved full outputs, newest first"""
+    directory = spill_dir()
+    paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".gz")]
+    return sorted(paths, key=os.path.getmtime, reverse=True)
+
+def _prune():
+    for path in spills()[KEEP_SPILLS:]:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+def _spill_name(label, stream):
+    label = re.sub(r"[^A-Za-z0-9+#]+", "_", label)[:16] or "block"
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_names)}-{label}-{stream}.gz"
+
+def _text(data):
+    # What text=True pipes used to give us: universal newlines
+    return data.decode("utf-8", "replace").replace("\r\n", "\n").replace("\r", "\n")
+
+class OutputCapture:
+    """One stream of one block process, fed raw bytes with write()"""
+
+    def __init__(self, label="block", stream="stdout"):
+        self.label = label
+        self.stream = stream
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+        self.spill = None
+        self.spill_path = None
+        self.spilled = 0
+
+    def _start_spill(self):
+        self.spill_path = os.path.join(spill_dir(), _spill_name(self.label, self.stream))
+        # Speed over ratio, this is written while the block runs
+        self.spill = gzip.open(self.spill_path, "wb", compresslevel=1)
+        self._to_spill(bytes(self.head))
+        self.tail = self.head[HEAD_BYTES:]
+        del self.head[HEAD_BYTES:]
+
+    def _to_spill(self, data):
+        room = MAX_SPILL_BYTES - self.spilled
+        if room > 0:
+            self.spill.write(data[:room])
+            self.spilled += min(len(data), room)
+
+    def write(self, data):
+        self.total += len(data)
+        if self.spill is None:
+            self.head += data
+            if len(self.head) > HEAD_BYTES + TAIL_BYTES:
+                self._start_spill()
+        else:
+            self._to_spill(data)
+            self.tail += data
+        if len(self.tail) > TAIL_BYTES:
+            del self.tail[:len(self.tail) - TAIL_BYTES]
+
+    @property
+    def omitted(self):
+        return self.total - len(self.head) - len(self.tail)
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+            _prune()
+            # Start the tail on a whole line
+            cut = self.tail.find(b"\n")
+            if 0 <= cut < len(self.tail) - 1:
+                del self.tail[:cut + 1]
+
+    def getvalue(self):
+        self.close()
+        if not self.omitted:
+            return _text(bytes(self.head))
+        return _text(bytes(self.head)) + self.marker() + _text(bytes(self.tail))
+
+    def marker(self):
+        where = os.path.basename(self.spill_path)
+        if self.spilled < self.total:
+            where += f", first {self.spilled} bytes only"
+        return f"\n[... {self.omitted} bytes omitted; full output in {where} (see 'output') ...]\n"
+
+def bound_text(text, label, stream="stdout"):
+    """Cut an already captured string down the same way (worker and
+    in-process results arrive whole)"""
+    if len(text) <= HEAD_BYTES + TAIL_BYTES + MARKER_SLACK:
+        return text
+    capture = OutputCapture(label, stream)
+    data = text.encode("utf-8")
+    for i in range(0, len(data), CHUNK):
+        capture.write(data[i:i + CHUNK])
+    return capture.getvalue() if capture.omitted else text
+
+class StreamLimiter:
+    """Sits in front of a streaming write(text, stream): passes the first
+    HEAD_BYTES of each stream through, then only spills and remembers the
+    tail, which finish() writes after the marker"""
+
+    def __init__(self, write, label):
+        self.write_through = write
+        self.label = label
+        self.captures = {}
+
+    def write(self, text, stream):
+        capture = self.captures.get(stream)
+        if capture is None:
+            capture = self.captures[stream] = OutputCapture(self.label, stream)
+        data = text.encode("utf-8")
+        shown = min(capture.total, HEAD_BYTES)
+        capture.write(data)
+        if shown + len(data) <= HEAD_BYTES:
+            self.write_through(text, stream)
+        elif shown < HEAD_BYTES:
+            self.write_through(data[:HEAD_BYTES - shown].decode("utf-8", "replace"), stream)
+
+    def finish(self):
+        for stream, capture in self.captures.items():
+            capture.close()
+            if capture.spill_path is None:
+                # Never spilled, just show what was held back past the head
+                held = capture.head[HEAD_BYTES:]
+                if held:
+                    self.write_through(held.decode("utf-8", "replace"), stream)
+            else:
+                self.write_through(capture.marker() + capture.tail.decode("utf-8", "replace"), stream)
+
+def _read_into(pipe, capture):
+    read = getattr(pipe, "read1", pipe.read)
+    while True:
+        chunk = read(CHUNK)
+        if not chunk:
+            break
+        capture.write(chunk)
+
+def _feed(pipe, data):
+    try:
+        pipe.write(data)
+    except OSError:
+        pass
+    finally:
+        try:
+            pipe.close()
+        except OSError:
+            pass
+
+def communicate(proc, stdin_data, out, err, timeout, kill):
+    """Proc.communicate() into two OutputCaptures. On timeout kill(proc) is
+    called, the pipes are drained and TimeoutExpired raised."""
+    threads = [
+        threading.Thread(target=_read_into, args=(proc.stdout, out), daemon=True),
+        threading.Thread(target=_read_into, args=(proc.stderr, err), daemon=True),
+    ]
+    if stdin_data is not None:
+        if isinstance(stdin_data, str):
+            stdin_data = stdin_data.encode("utf-8")
+        threads.append(threading.Thread(target=_feed, args=(proc.stdin, stdin_data), daemon=True))
+    for t in threads:
+        t.start()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for t in threads[:2]:
+        t.join(None if deadline is None else max(0, deadline - time.monotonic()))
+    if any(t.is_alive() for t in threads[:2]):
+        kill(proc)
+        for t in threads[:2]:
+            t.join()
+        proc.wait()
+        raise subprocess.TimeoutExpired(proc.args, timeout)
+    remaining = None if deadline is None else max(0, deadline - time.monotonic())
+    try:
+        proc.wait(remaining)
+    except subprocess.TimeoutExpired:
+        kill(proc)
+        proc.wait()
+        raise
+    return proc.returncode
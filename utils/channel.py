@@ -0,0 +1,98 @@
+import os
+import sys
+import struct
+import hashlib
+import functools
+import threading
+from contextlib import contextmanager
+
+# Per-run data channel between blocks. Each run gets one file in its scratch
+# directory (tmpfs when there is one) that every block can map and read or
+# write through the helper for its language in runtime/:
+#   py   import m5r_channel            (PYTHONPATH)
+#   js   require('m5r_channel')        (NODE_PATH)
+#   php  m5r_channel_get()/_put()      (auto-prepended)
+#   cpp  m5r_channel::get()/put()      (header included when the block uses it)
+#   cs   M5RChannel.Get()/Put()        (compiled in when the block uses it)
+# Block processes find the file through M5R_CHANNEL. The file is sparse, so
+# M5R_CHANNEL_MB only caps it, memory is used as values get written.
+
+RUNTIME_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "runtime")
+CPP_HEADER = os.path.join(RUNTIME_DIR, "m5r_channel.h")
+CS_HELPER = os.path.join(RUNTIME_DIR, "M5RChannel.cs")
+PHP_HELPER = os.path.join(RUNTIME_DIR, "m5r_channel.php")
+
+CHANNEL_SIZE = int(os.environ.get("M5R_CHANNEL_MB", "64")) * 1024 * 1024
+MAGIC = b"M5RCHAN1"
+HEADER = 16
+
+_local = threading.local()
+
+@contextmanager
+def run_channel(scratch_dir):
+    """Create the channel for the current run; nested calls share the outer one"""
+    if getattr(_local, "path", None):
+        yield _local.path
+        return
+    path = create(scratch_dir)
+    _local.path = path
+    try:
+        yield path
+    finally:
+        _local.path = None
+
+def create(scratch_dir):
+    """Make an empty channel file in scratch_dir and return its path"""
+    path = os.path.join(scratch_dir, "channel")
+    with open(path, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", HEADER))
+        f.truncate(CHANNEL_SIZE)
+    return path
+
+@contextmanager
+def use_channel(path):
+    """Make path this thread's channel for a while"""
+    outer = current()
+    _local.path = path
+    try:
+        yield path
+    finally:
+        _local.path = outer
+
+def current():
+    """Channel file of the run on this thread, or None"""
+    return getattr(_local, "path", None)
+
+def _prepend(var, path):
+    old = os.environ.get(var)
+    return path + os.pathsep + old if old else path
+
+def child_env(path=None):
+    """Environment for a block process: helpers on the module paths and,
+    inside a run, M5R_CHANNEL. path overrides this thread's channel."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = _prepend("PYTHONPATH", RUNTIME_DIR)
+    env["NODE_PATH"] = _prepend("NODE_PATH", RUNTIME_DIR)
+    path = path or current()
+    if path:
+        env["M5R_CHANNEL"] = path
+    else:
+        env.pop("M5R_CHANNEL", None)
+    return env
+
+def bind_inprocess(path):
+    """Point in-process Python blocks on this thread at a channel"""
+    if RUNTIME_DIR not in sys.path:
+        sys.path.append(RUNTIME_DIR)
+    import m5r_channel
+    m5r_channel.use(path)
+
+def uses_channel(code, lang):
+    """Whether a compiled block needs the helper built in"""
+    return ("M5RChannel" if lang == "cs" else "m5r_channel") in code
+
+@functools.lru_cache(maxsize=None)
+def helper_digest(path):
+    # Goes into artifact cache keys so a changed helper means a rebuild
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
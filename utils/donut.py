@@ -0,0 +1,131 @@
+import os
+import json
+import math
+
+from utils.cache_dir import cache_path, temp_name
+
+try:
+    import numpy as np
+    _NUMPY_AVAILABLE = True
+except ImportError:
+    _NUMPY_AVAILABLE = False
+
+# The spinning donut of the shell's start-up, as frames of plain text (a
+# list of lines each). The torus is sampled on a fixed grid of angles, so
+# its sin/cos tables are computed once; with NumPy a whole frame is then a
+# handful of array operations, without it the same tables still save most
+# of the trig. Frames for a given size are kept on disk under
+# <cache>/frames, so after the first start-up they are just read back.
+
+FORMAT = 1  # bump when the picture changes
+CHARS = ".,-~:;=!*#$@"
+THETA = range(0, 628, 2)   # around the tube, in hundredths of a radian
+PHI = range(0, 628, 6)     # around the ring
+STEP_A, STEP_B = 0.08, 0.03
+
+_tables = None
+
+def tables():
+    """sin/cos of every sample angle, as the rows of the frame loop use them"""
+    global _tables
+    if _tables is None:
+        _tables = (
+            [math.sin(i / 100) for i in THETA],
+            [math.cos(i / 100) for i in THETA],
+            [math.sin(j / 100) for j in PHI],
+            [math.cos(j / 100) for j in PHI],
+        )
+    return _tables
+
+_grids = None
+
+def grids():
+    """The tables broadcast over the whole (phi, theta) grid, flattened"""
+    global _grids
+    if _grids is None:
+        sin_i, cos_i, sin_j, cos_j = (np.array(t) for t in tables())
+        c = np.broadcast_to(sin_i, (len(PHI), len(THETA))).ravel()
+        l = np.broadcast_to(cos_i, (len(PHI), len(THETA))).ravel()
+        f = np.broadcast_to(sin_j[:, None], (len(PHI), len(THETA))).ravel()
+        d = np.broadcast_to(cos_j[:, None], (len(PHI), len(THETA))).ravel()
+        h = d + 2
+        order = np.arange(c.size)
+        _grids = (c, d, f, l, c * h, l * h, c * d, l * d, order)
+    return _grids
+
+def frame_numpy(A, B, width, height):
+    c, d, f, l, ch, lh, cd, ld, order = grids()
+    e, g, m, n = math.sin(A), math.cos(A), math.cos(B), math.sin(B)
+    # Same operations in the same order as frame_python(), so both give
+    # the same picture
+    D = 1 / (ch * e + f * g + 5)
+    t = ch * g - f * e
+    x = (width / 2 + width / 3 * D * (lh * m - t * n)).astype(np.int64)
+    y = (height / 2 + height / 3.5 * D * (lh * n + t * m)).astype(np.int64)
+    visible = (0 <= y) & (y < height) & (0 <= x) & (x < width)
+    o = (x + width * y)[visible]
+    D = D[visible]
+    # z-buffer: per cell, the nearest point (largest D), first one on a tie
+    ranked = np.lexsort((-order[visible], D, o))
+    o_sorted = o[ranked]
+    nearest = ranked[np.append(o_sorted[1:] != o_sorted[:-1], True)]
+    lum = (10 * ((f * e - cd * g) * m - cd * e - f * g - ld * n))[visible][nearest].astype(np.int64)
+    output = np.full(width * height, " ", dtype="<U1")
+    output[o[nearest]] = np.array(list(CHARS))[lum % len(CHARS)]
+    return ["".join(row) for row in output.reshape(height, width).tolist()]
+
+def frame_python(A, B, width, height):
+    sin_i, cos_i, sin_j, cos_j = tables()
+    e, g, m, n = math.sin(A), math.cos(A), math.cos(B), math.sin(B)
+    output = [" "] * (width * height)
+    zbuffer = [0] * (width * height)
+    for f, d in zip(sin_j, cos_j):
+        h = d + 2
+        for c, l in zip(sin_i, cos_i):
+            ch = c * h
+            D = 1 / (ch * e + f * g + 5)
+            t = ch * g - f * e
+            lh = l * h
+            x = int(width / 2 + width / 3 * D * (lh * m - t * n))
+            y = int(height / 2 + height / 3.5 * D * (lh * n + t * m))
+            o = x + width * y
+            if 0 <= y < height and 0 <= x < width and D > zbuffer[o]:
+                zbuffer[o] = D
+                cd = c * d
+                lum = int(10 * ((f * e - cd * g) * m - cd * e - f * g - l * d * n))
+                output[o] = CHARS[lum % len(CHARS)]
+    return ["".join(output[y * width:(y + 1) * width]) for y in range(height)]
+
+def render(count, width, height, use_numpy=_NUMPY_AVAILABLE):
+    frame = frame_numpy if use_numpy else frame_python
+    result, A, B = [], 0, 0
+    for _ in range(count):
+        result.append(frame(A, B, width, height))
+        # Stepped the way the old loop did, float rounding included
+        A += STEP_A
+        B += STEP_B
+    return result
+
+def _cache_file(count, width, height):
+    return os.path.join(cache_path("frames"), f"donut-{FORMAT}-{width}x{height}-{count}.json")
+
+def frames(count, width, height):
+    """count frames of width x height, from the disk cache when it has them"""
+    path = _cache_file(count, width, height)
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    result = render(count, width, height)
+    tmp = temp_name(path)
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+    return result
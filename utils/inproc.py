@@ -0,0 +1,108 @@
+import io
+import os
+import sys
+import hashlib
+import builtins
+import threading
+import traceback
+from collections import OrderedDict
+
+from utils import trace
+from utils import channel
+
+# Trusted-mode executor for <?py blocks: the block is compiled once, the code
+# object is cached by source hash and exec'd in this interpreter with a fresh
+# namespace. No process is started at all.
+#
+# Turn it on with M5R_INPROC=1. Only use it for scripts you trust, a block
+# can touch everything the shell can. Blocks run in the process's cwd, so a
+# run with a cwd of its own (m5rd, Engine) starts python for them instead.
+
+INPROC_ENABLED = os.environ.get("M5R_INPROC") == "1"
+CODE_CACHE_SIZE = 256
+
+_code_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+class _StreamRouter:
+    """Stands in for sys.stdout/sys.stderr and sends each write to the buffer
+    of the block running on the current thread, or to the real stream."""
+
+    def __init__(self, real):
+        self.real = real
+        self.buffers = {}
+
+    def _target(self):
+        return self.buffers.get(threading.get_ident(), self.real)
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        return self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.real, name)
+
+_routers = None
+_router_lock = threading.Lock()
+
+def _install_routers():
+    global _routers
+    with _router_lock:
+        if _routers is None:
+            _routers = (_StreamRouter(sys.stdout), _StreamRouter(sys.stderr))
+            sys.stdout, sys.stderr = _routers
+    return _routers
+
+def compile_block(code):
+    key = hashlib.sha256(code.encode("utf-8")).hexdigest()
+    with _cache_lock:
+        compiled = _code_cache.get(key)
+        if compiled is not None:
+            _code_cache.move_to_end(key)
+            return compiled
+    compiled = compile(code, "<m5r block>", "exec")
+    with _cache_lock:
+        _code_cache[key] = compiled
+        while len(_code_cache) > CODE_CACHE_SIZE:
+            _code_cache.popitem(last=False)
+    return compiled
+
+def run_inprocess(code, timeout=8):
+    """Run a Python block in this process; same (stdout, stderr, rc) shape as safe_run"""
+    out_router, err_router = _install_routers()
+    out, err = io.StringIO(), io.StringIO()
+    result = {"rc": 0}
+    channel_path = channel.current()
+
+    def target():
+        ident = threading.get_ident()
+        out_router.buffers[ident] = out
+        err_router.buffers[ident] = err
+        try:
+            channel.bind_inprocess(channel_path)
+            exec(compile_block(code), {"__name__": "__main__", "__builtins__": builtins})
+        except SystemExit as e:
+            if isinstance(e.code, int):
+                result["rc"] = e.code
+            elif e.code is not None:
+                print(e.code, file=sys.stderr)
+                result["rc"] = 1
+        except BaseException:
+            etype, value, tb = sys.exc_info()
+            traceback.print_exception(etype, value, tb.tb_next)
+            result["rc"] = 1
+        finally:
+            out_router.buffers.pop(ident, None)
+            err_router.buffers.pop(ident, None)
+
+    # Watchdog: a thread can't be killed, so a block that overruns is left
+    # to finish on its own (as a daemon) and its output is dropped
+    worker = threading.Thread(target=target, name="m5r-py-block", daemon=True)
+    with trace.span("run", inprocess=True):
+        worker.start()
+        worker.join(timeout)
+    if worker.is_alive():
+        return "", "[ERROR: timed out]", 1
+    return out.getvalue(), err.getvalue(), result["rc"]
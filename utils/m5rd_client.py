@@ -0,0 +1,59 @@
+import os
+import json
+import socket
+
+from utils.cache_dir import cache_path
+
+# Talking to m5rd (see m5rd.py). Requests and events are JSON lines over a
+# Unix socket:
+#   -> {"op": "run", "path": ..., "cwd": ...}       (or "source": text, or
+#                                                    "blocks": [[lang, code], ...])
+#      optional: "raw": true for the blocks' output without headers and
+#      "[LANG ERROR]" labels, "timeout": seconds per block (null: none)
+#   <- {"event": "queued", "position": N}
+#   <- {"event": "output", "block": i, "lang": ..., "stream": ..., "text": ...}
+#   <- {"event": "done", "blocks": N, "failed": N, "wait": s, "wall": s}
+#   -> {"op": "stats"}
+#   <- {"event": "stats", ...}
+#
+# With M5R_DAEMON=1 the shell's run and the batch runner send their work to
+# a running m5rd, and run it themselves when there isn't one.
+
+DAEMON_ENABLED = os.environ.get("M5R_DAEMON") == "1"
+
+def socket_path():
+    return os.environ.get("M5R_SOCKET") or os.path.join(cache_path(), "m5rd.sock")
+
+def connect(timeout=None):
+    """A socket connected to m5rd, or None if it isn't running"""
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_path())
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+def request(message, on_event=None):
+    """Send one request and return its final event. on_event gets every
+    event before that. None if the daemon couldn't be reached."""
+    sock = connect()
+    if sock is None:
+        return None
+    with sock, sock.makefile("rwb") as f:
+        f.write((json.dumps(message) + "\n").encode("utf-8"))
+        f.flush()
+        for line in f:
+            event = json.loads(line)
+            if event["event"] in ("done", "stats", "error"):
+                return event
+            if on_event:
+                on_event(event)
+    # The daemon went away mid-run
+    return {"event": "error", "error": "m5rd closed the connection"}
+
+def stats():
+    return request({"op": "stats"})
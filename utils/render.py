@@ -0,0 +1,103 @@
+import re
+import sys
+import unicodedata
+from functools import lru_cache
+from colorama import Style
+
+# Terminal output for the shell's boxes and animations. A Frame collects a
+# whole screen (or box) in memory and writes it with one write() and one
+# flush(), so slow links get it in one piece instead of line by line.
+# Screens are cleared with escape sequences rather than a cls/clear
+# subprocess (colorama translates them on Windows).
+
+ANSI_RE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+CLEAR = "\x1b[H\x1b[2J"  # cursor home, then erase the screen
+HOME = "\x1b[H"
+
+def strip_ansi(text):
+    return ANSI_RE.sub("", text)
+
+def _char_width(c):
+    if unicodedata.combining(c) or unicodedata.category(c) in ("Mn", "Me", "Cf"):
+        return 0
+    return 2 if unicodedata.east_asian_width(c) in ("W", "F") else 1
+
+@lru_cache(maxsize=4096)
+def width(text):
+    """Columns text takes on screen: escape codes take none, wide
+    characters (CJK, most emoji) two"""
+    plain = strip_ansi(text)
+    if plain.isascii():
+        return len(plain)
+    return sum(_char_width(c) for c in plain)
+
+def center(text, columns):
+    """Left-pads text so it sits in the middle of columns"""
+    w = width(text)
+    if w >= columns:
+        return text
+    return " " * ((columns - w) // 2) + text
+
+def fill(text, columns):
+    """Right-pads text to columns"""
+    return text + " " * max(0, columns - width(text))
+
+def write(text, out=None):
+    out = out or sys.stdout
+    out.write(text)
+    out.flush()
+
+def clear(out=None):
+    write(CLEAR, out)
+
+class Frame:
+    """A screenful of lines, written out in one go"""
+
+    def __init__(self, clear=False, home=False):
+        self.parts = [CLEAR if clear else HOME if home else ""]
+
+    def line(self, text=""):
+        # Every line ends reset, as print() with colorama's autoreset did
+        if "\x1b" in text and not text.endswith(Style.RESET_ALL):
+            text += Style.RESET_ALL
+        self.parts.append(text + "\n")
+        return self
+
+    def lines(self, texts):
+        for text in texts:
+            self.line(text)
+        return self
+
+    def text(self):
+        return "".join(self.parts)
+
+    def flush(self, out=None):
+        write(self.text(), out)
+        self.parts = [""]
+
+class Box:
+    """A ╔═╗ box of inner columns in color, drawn into a Frame"""
+
+    def __init__(self, frame, inner, color):
+        self.frame = frame
+        self.inner = inner
+        self.color = color
+
+    def top(self):
+        self.frame.line(self.color + "╔" + "═" * self.inner + "╗")
+
+    def rule(self, heavy=False):
+        if heavy:
+            self.frame.line(self.color + "╠" + "═" * self.inner + "╣")
+        else:
+            self.frame.line(self.color + "╟" + "─" * self.inner + "╢")
+
+    def bottom(self):
+        self.frame.line(self.color + "╚" + "═" * self.inner + "╝")
+
+    def row(self, text=""):
+        self.frame.line(self.color + "║" + fill(text, self.inner) + self.color + "║")
+
+    def centered(self, text, color=""):
+        # text is plain, str.center() just needs to know about wide characters
+        self.row(color + text.center(self.inner - (width(text) - len(text))))
@@ -0,0 +1,94 @@
+import os
+import re
+import json
+import hashlib
+import threading
+import importlib.util
+
+from utils.cache_dir import cache_path, temp_name
+
+# Rendered figlet text and pre-rendered screens (help, credits, the
+# banner), kept in memory and in one JSON file under <cache>/render. A
+# render is keyed by everything it is drawn from: font, text, width and
+# the colors (the escape codes themselves), plus the content of a screen.
+# The file belongs to one pyfiglet version and is dropped when that
+# changes, since fonts and layout come with the package. On a hit pyfiglet
+# isn't even imported.
+
+FORMAT = 1  # bump when a screen's layout changes in the code
+
+_memory = None
+_lock = threading.Lock()
+_version = None
+
+def pyfiglet_version():
+    global _version
+    if _version is None:
+        # Read off its version.py: importing pyfiglet, or even
+        # importlib.metadata, takes longer than a whole cache hit
+        spec = importlib.util.find_spec("pyfiglet")
+        if spec is None or not spec.origin:
+            _version = "none"
+        else:
+            package = os.path.dirname(spec.origin)
+            try:
+                with open(os.path.join(package, "version.py"), encoding="utf-8") as f:
+                    _version = re.search(r"__version__\s*=\s*['\"]([^'\"]+)", f.read()).group(1)
+            except (OSError, AttributeError):
+                # No version to go by, the package's own mtime will do
+                _version = f"mtime:{os.stat(spec.origin).st_mtime_ns}"
+    return _version
+
+def _cache_file():
+    return os.path.join(cache_path("render"), "renders.json")
+
+def _load():
+    global _memory
+    if _memory is None:
+        _memory = {}
+        try:
+            with open(_cache_file(), encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("format") == FORMAT and data.get("pyfiglet") == pyfiglet_version():
+                _memory = data["renders"]
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            pass
+    return _memory
+
+def _save():
+    path = _cache_file()
+    tmp = temp_name(path)
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"format": FORMAT, "pyfiglet": pyfiglet_version(), "renders": _memory}, f)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+def key(*parts):
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def cached(build, *parts):
+    """build()'s string for parts, rendered once and then reused"""
+    k = key(*parts)
+    with _lock:
+        text = _load().get(k)
+    if text is None:
+        text = build()
+        with _lock:
+            _memory[k] = text
+            _save()
+    return text
+
+def figlet_text(text, font="standard", width=80):
+    def build():
+        from pyfiglet import Figlet
+        return Figlet(font=font, width=width).renderText(text)
+    return cached(build, "figlet", font, text, width)
+
+def screen(name, build, *parts):
+    """A whole pre-rendered screen, parts being whatever it is drawn from"""
+    return cached(build, "screen", name, *parts)
@@ -0,0 +1,57 @@
+import os
+import json
+import time
+
+from utils.artifact_cache import ArtifactCache, temp_name
+
+# Replayable output of blocks marked [pure]: what the block wrote (in order,
+# tagged stdout/stderr, plus "header"/"label" on the decorations) and its
+# exit code, keyed by language, source and the runtime's path/version.
+# Shares the size cap + LRU eviction of ArtifactCache and adds a TTL on top.
+
+DEFAULT_TTL = int(os.environ.get("M5R_RESULT_TTL", str(24 * 3600)))
+DEFAULT_MAX_BYTES = int(os.environ.get("M5R_RESULT_CACHE_MB", "64")) * 1024 * 1024
+
+FORMAT = 2  # bump when what goes into "writes" changes
+
+class ResultCache(ArtifactCache):
+    def __init__(self, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__("results", suffix=".json", max_bytes=max_bytes)
+        self.ttl = ttl
+
+    def key(self, lang, code, runtime):
+        return super().key(f"{FORMAT}\0{lang}\0{code}", runtime)
+
+    def get(self, key, ttl=None):
+        path = super().get(key)
+        if path is None:
+            return None
+        ttl = self.ttl if ttl is None else ttl
+        try:
+            with open(path, encoding="utf-8") as f:
+                record = json.load(f)
+            if time.time() - record["created"] <= ttl:
+                return record
+            os.unlink(path)
+        except (OSError, ValueError, KeyError):
+            pass
+        # Expired or unreadable: count it as a miss after all
+        self.hits -= 1
+        self.misses += 1
+        return None
+
+    def put(self, key, writes, rc):
+        target = self._entry(key)
+        tmp = temp_name(target)
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"created": time.time(), "writes": writes, "rc": rc}, f)
+            os.replace(tmp, target)
+        except OSError:
+            # Lost to another writer of the same key, its record stands
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            return
+        self.evict()
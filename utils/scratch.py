@@ -0,0 +1,82 @@
+import os
+import atexit
+import shutil
+import tempfile
+import threading
+import itertools
+from contextlib import contextmanager
+
+from utils import trace
+
+# Keeping block sources off the disk. Script blocks are handed to their
+# runtime as an anonymous memfd (/dev/fd/N) where the runtime can read one,
+# or piped over stdin otherwise. Compiled languages still need real files,
+# so each run gets one scratch directory (on tmpfs when there is one) that is
+# shared by all of its blocks and removed once at the end.
+
+HAS_MEMFD = hasattr(os, "memfd_create")
+SCRATCH_ROOT = "/dev/shm" if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else None
+
+_local = threading.local()
+_names = itertools.count()
+
+@contextmanager
+def run_scratch():
+    """Scratch directory for the current run; nested calls share the outer one"""
+    if getattr(_local, "dir", None):
+        yield _local.dir
+        return
+    path = make_scratch()
+    _local.dir = path
+    try:
+        yield path
+    finally:
+        _local.dir = None
+        remove_scratch(path)
+
+def make_scratch():
+    return tempfile.mkdtemp(prefix="m5r-run-", dir=SCRATCH_ROOT)
+
+def remove_scratch(path):
+    with trace.span("cleanup", scratch=True):
+        shutil.rmtree(path, ignore_errors=True)
+
+@contextmanager
+def use_scratch(path):
+    """Make path this thread's scratch directory for a while (a run that
+    hands work to another thread)"""
+    outer = getattr(_local, "dir", None)
+    _local.dir = path
+    try:
+        yield path
+    finally:
+        _local.dir = outer
+
+def scratch_file(name):
+    """A fresh path inside the current run's scratch directory"""
+    base = getattr(_local, "dir", None) or getattr(_local, "fallback", None)
+    if base is None:
+        # Called outside of a run, give it a private directory that
+        # lives as long as the process
+        base = _local.fallback = make_scratch()
+        atexit.register(shutil.rmtree, base, True)
+    return os.path.join(base, f"{next(_names)}-{name}")
+
+@contextmanager
+def memory_script(code, use_memfd=True):
+    """Yield (path, sub_kwargs) for running code without a file on disk.
+    path is /dev/fd/N for a memfd, or None when the code goes over stdin
+    (sub_kwargs then carries it as input=)."""
+    if not (use_memfd and HAS_MEMFD):
+        yield None, {"input": code}
+        return
+    with trace.span("write", memfd=True) as sp:
+        data = code.encode("utf-8")
+        fd = os.memfd_create("m5r-block", 0)
+        sp.set(bytes=len(data))
+        os.write(fd, data)
+    try:
+        yield f"/dev/fd/{fd}", {"pass_fds": (fd,)}
+    finally:
+        with trace.span("cleanup", memfd=True):
+            os.close(fd)
@@ -0,0 +1,74 @@
+import sys
+import json
+import time
+import builtins
+import threading
+from contextlib import contextmanager
+
+# Where m5rshell's time to first prompt goes (m5rshell.py --startup-profile).
+# Phases are timed with phase(); imports are timed by wrapping __import__,
+# only the first import of each module (the one that actually loads it) is
+# recorded, inclusive of everything it imports in turn.
+
+class StartupProfile:
+    def __init__(self, started=None):
+        self.started = started or time.perf_counter()
+        self.phases = []   # (name, seconds)
+        self.imports = []  # (module, seconds, depth)
+        self._local = threading.local()  # import depth, per thread
+        self._original_import = None
+
+    def watch_imports(self):
+        original = self._original_import = builtins.__import__
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if level or name in sys.modules:
+                return original(name, globals, locals, fromlist, level)
+            depth = getattr(self._local, "depth", 0)
+            start = time.perf_counter()
+            self._local.depth = depth + 1
+            try:
+                return original(name, globals, locals, fromlist, level)
+            finally:
+                self._local.depth = depth
+                self.imports.append((name, time.perf_counter() - start, depth))
+
+        builtins.__import__ = timed_import
+
+    def stop(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def as_dict(self):
+        return {
+            "first_prompt": self.elapsed(),
+            "phases": [{"name": name, "seconds": s} for name, s in self.phases],
+            "imports": [{"module": name, "seconds": s, "depth": d} for name, s, d in self.imports],
+        }
+
+    def report(self, fmt="text", top=15, out=None):
+        out = out or sys.stdout
+        if fmt == "json":
+            out.write(json.dumps(self.as_dict()) + "\n")
+            return
+        total = self.elapsed()
+        out.write(f"Time to first prompt: {total * 1000:.1f} ms\n\nPhases:\n")
+        for name, seconds in self.phases:
+            out.write(f"  {name:<28}{seconds * 1000:>9.1f} ms\n")
+        # Top-level imports only, nested ones are part of their times
+        slowest = sorted((i for i in self.imports if i[2] == 0), key=lambda i: -i[1])[:top]
+        out.write(f"\nSlowest imports (of {len(self.imports)} modules loaded):\n")
+        for name, seconds, _ in slowest:
+            out.write(f"  {name:<28}{seconds * 1000:>9.1f} ms\n")
@@ -0,0 +1,138 @@
+import os
+import time
+import signal
+import threading
+from contextlib import contextmanager
+
+from utils.cache_dir import cache_path
+
+# Keeping block processes on a leash.
+#
+# Every block process starts in its own session (and so its own process
+# group) with CPU-time, address-space and open-file rlimits applied, and the
+# whole group is killed once the block's main process exits or times out, so
+# nothing it forked or backgrounded outlives it.
+#
+# On top of that, admission() caps how many block processes may run at once.
+# Slots are lock files under the cache dir, so the cap holds across every
+# shell, batch runner and daemon on the machine, and a slot is freed by the
+# kernel even if its holder dies.
+
+IS_POSIX = os.name == "posix"
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    value = int(value)
+    return value if value > 0 else None
+
+RLIMIT_CPU = _env_int("M5R_RLIMIT_CPU", 60)            # seconds
+RLIMIT_AS_MB = _env_int("M5R_RLIMIT_AS_MB", None)      # off: V8/.NET reserve huge address ranges
+RLIMIT_NOFILE = _env_int("M5R_RLIMIT_NOFILE", 1024)
+MAX_PROCS = _env_int("M5R_MAX_PROCS", os.cpu_count() or 4)
+
+if IS_POSIX:
+    import fcntl
+    import resource
+
+def rlimits():
+    """(resource, (soft, hard)) pairs every block process runs under"""
+    limits = []
+    if RLIMIT_CPU:
+        limits.append((resource.RLIMIT_CPU, (RLIMIT_CPU, RLIMIT_CPU + 1)))
+    if RLIMIT_AS_MB:
+        size = RLIMIT_AS_MB * 1024 * 1024
+        limits.append((resource.RLIMIT_AS, (size, size)))
+    if RLIMIT_NOFILE:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        limit = RLIMIT_NOFILE if hard == resource.RLIM_INFINITY else min(RLIMIT_NOFILE, hard)
+        limits.append((resource.RLIMIT_NOFILE, (limit, hard)))
+    return limits
+
+# prlimit() sets the limits from the parent right after the spawn; the
+# preexec_fn fallback is not safe with threads around, so only other
+# POSIX systems use it
+HAS_PRLIMIT = IS_POSIX and hasattr(resource, "prlimit")
+
+def _apply_limits():
+    # Runs in the child between fork and exec
+    for res, value in rlimits():
+        resource.setrlimit(res, value)
+
+def popen_kwargs(limits=True):
+    """Extra Popen arguments for a supervised block process"""
+    if not IS_POSIX:
+        return {}
+    kwargs = {"start_new_session": True}
+    if limits and not HAS_PRLIMIT:
+        kwargs["preexec_fn"] = _apply_limits
+    return kwargs
+
+def apply_limits(proc):
+    """Call right after spawning a process with popen_kwargs()"""
+    if not HAS_PRLIMIT:
+        return
+    for res, value in rlimits():
+        try:
+            resource.prlimit(proc.pid, res, value)
+        except OSError:
+            pass
+
+def kill_group(proc):
+    """Kill the process and everything left in its process group"""
+    if IS_POSIX:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+    # asyncio processes have no poll(), their returncode is kept current
+    running = proc.poll() is None if hasattr(proc, "poll") else proc.returncode is None
+    if running:
+        try:
+            proc.kill()
+        except OSError:
+            pass
+
+def reap_group_on_exit(proc):
+    """Kill the rest of proc's group as soon as proc itself exits. Stragglers
+    holding the output pipes open would otherwise keep the reader waiting."""
+    if not IS_POSIX:
+        return
+
+    def watch():
+        proc.wait()
+        kill_group(proc)
+
+    threading.Thread(target=watch, name="m5r-reaper", daemon=True).start()
+
+_local_slots = threading.BoundedSemaphore(MAX_PROCS) if MAX_PROCS else None
+
+@contextmanager
+def admission():
+    """Wait for one of MAX_PROCS machine-wide process slots"""
+    if not MAX_PROCS:
+        yield
+        return
+    if not IS_POSIX:
+        with _local_slots:
+            yield
+        return
+    slot_dir = cache_path("slots")
+    delay = 0.005
+    while True:
+        for slot in range(MAX_PROCS):
+            fd = os.open(os.path.join(slot_dir, f"slot-{slot}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                continue
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+            return
+        time.sleep(delay)
+        delay = min(delay * 2, 0.1)
@@ -0,0 +1,176 @@
+import os
+import re
+import json
+import shutil
+import threading
+import subprocess
+
+from utils.cache_dir import cache_path, temp_name
+
+# Which runtimes and compilers this machine has. Every tool is looked up on
+# PATH and asked for its version once; the answers go to toolchains.json in
+# the cache dir and are reused until PATH changes, a PATH directory changes
+# (something was installed or removed) or a binary's mtime changes.
+
+CACHE_VERSION = 1
+
+# tool -> (block languages it serves, version arguments)
+TOOLS = {
+    "python": (("py",), ["--version"]),
+    "node": (("js",), ["--version"]),
+    "php": (("php",), ["--version"]),
+    "bash": (("sh",), ["--version"]),
+    "csc": (("cs",), ["/version"]),
+    "g++": (("cpp",), ["--version"]),
+}
+
+LANG_TOOLS = {lang: name for name, (langs, _) in TOOLS.items() for lang in langs}
+
+def _major_minor(version):
+    m = re.search(r"(\d+)\.(\d+)", version)
+    return (int(m.group(1)), int(m.group(2))) if m else (0, 0)
+
+def capabilities(name, version_text):
+    """Optional features a tool supports, judging by its version output"""
+    caps = []
+    number = _major_minor(version_text)
+    if name == "g++" and ("GCC" in version_text or "Free Software Foundation" in version_text):
+        caps.append("pch")  # clang's g++ alias ignores .gch files
+    if name == "node" and number >= (12, 0):
+        caps.append("channel")  # BigInt buffer reads
+    if name == "php" and number >= (7, 1):
+        caps.append("channel")
+    if name == "python" and number >= (3, 0):
+        caps.append("channel")
+    if name in ("g++", "csc"):
+        caps.append("channel")
+    return caps
+
+class Toolchain:
+    def __init__(self, name, path, mtime_ns, version_text):
+        self.name = name
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.version_text = version_text
+        m = re.search(r"\d+(?:\.\d+)+", version_text)
+        self.version = m.group(0) if m else ""
+        self.capabilities = capabilities(name, version_text)
+
+    def has(self, capability):
+        return capability in self.capabilities
+
+    def to_json(self):
+        return {"path": self.path, "mtime_ns": self.mtime_ns, "version_text": self.version_text}
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def _path_signature():
+    path = os.environ.get("PATH", "")
+    return [path] + [_mtime(d) for d in path.split(os.pathsep) if d]
+
+def probe(name):
+    """Resolve and version one tool; None if it isn't installed"""
+    path = shutil.which(name)
+    if path is None:
+        return None
+    try:
+        result = subprocess.run(
+            [path] + TOOLS.get(name, ((), ["--version"]))[1], capture_output=True, text=True, timeout=8
+        )
+        version_text = (result.stdout or result.stderr).strip()
+    except Exception:
+        version_text = ""
+    return Toolchain(name, path, _mtime(path), version_text)
+
+class Registry:
+    def __init__(self):
+        self._tools = None
+        self._signature = None
+        self._lock = threading.Lock()
+
+    @property
+    def file(self):
+        return os.path.join(cache_path(), "toolchains.json")
+
+    def _load(self, signature):
+        try:
+            with open(self.file, encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if cached.get("version") != CACHE_VERSION or cached.get("signature") != signature:
+            return {}
+        tools = {}
+        for name, entry in cached.get("tools", {}).items():
+            tools[name] = Toolchain(name, **entry) if entry else None
+        return tools
+
+    def _save(self):
+        tmp = temp_name(self.file)
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({
+                    "version": CACHE_VERSION,
+                    "signature": self._signature,
+                    "tools": {name: t.to_json() if t else None for name, t in self._tools.items()},
+                }, f, indent=1)
+            os.replace(tmp, self.file)
+        except OSError:
+            # Only an optimisation, the next process probes again
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    def _refresh(self):
+        signature = _path_signature()
+        if self._tools is None or signature != self._signature:
+            self._signature = signature
+            self._tools = self._load(signature)
+
+    def _lookup(self, name):
+        tool = self._tools.get(name, False)
+        # Tools upgraded in place keep their path but get a new mtime
+        if tool is False or (tool is not None and _mtime(tool.path) != tool.mtime_ns):
+            tool = self._tools[name] = probe(name)
+            self._save()
+        return tool
+
+    def get(self, name):
+        """The Toolchain for name, or None if it isn't installed"""
+        with self._lock:
+            self._refresh()
+            return self._lookup(name)
+
+    def all(self):
+        with self._lock:
+            self._refresh()
+            return {name: self._lookup(name) for name in TOOLS}
+
+    def rescan(self):
+        """Forget everything and probe again"""
+        with self._lock:
+            self._tools = {}
+            self._signature = _path_signature()
+            for name in TOOLS:
+                self._tools[name] = probe(name)
+            self._save()
+            return dict(self._tools)
+
+registry = Registry()
+
+def get(name):
+    return registry.get(name)
+
+def available(lang):
+    """Whether the tool a block language needs is installed"""
+    name = LANG_TOOLS.get(lang)
+    return name is None or registry.get(name) is not None
+
+def has(name, capability):
+    tool = registry.get(name)
+    return tool is not None and tool.has(capability)
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import atexit
+import threading
+
+# Span recorder for finding out where a run's time goes. Every span has a
+# phase (parse/write/compile/spawn/run/cleanup), the index and language of
+# the block it belongs to, start/end timestamps and byte counts.
+#
+# Off by default, and span() is then a shared no-op. M5R_TRACE=<file> turns
+# it on for the whole process and writes the trace on exit; a path ending in
+# .jsonl gets JSON lines, anything else Chrome trace_event JSON (open it in
+# chrome://tracing or https://ui.perfetto.dev).
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+_CURRENT = object()  # the block set on the thread that ends the span
+
+class Span:
+    def __init__(self, recorder, phase, args, block=_CURRENT):
+        self.recorder = recorder
+        self.phase = phase
+        self.args = args
+        self.block = block
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.add(self.phase, self.start, time.perf_counter_ns(), self.args, self.block)
+        return False
+
+    def set(self, **args):
+        self.args.update(args)
+
+class TraceRecorder:
+    def __init__(self):
+        self.events = []
+        self.origin = time.perf_counter_ns()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def set_block(self, block):
+        self._local.block = block
+
+    def current_block(self):
+        return getattr(self._local, "block", None)
+
+    def add(self, phase, start, end, args, block=_CURRENT):
+        if block is _CURRENT:
+            block = self.current_block()
+        event = {
+            "phase": phase,
+            "block": block.index if block is not None else None,
+            "lang": block.lang if block is not None else None,
+            "start_ns": start - self.origin,
+            "end_ns": end - self.origin,
+            "thread": threading.get_ident(),
+            "args": args,
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def chrome_events(self, events):
+        pid = os.getpid()
+        for e in events:
+            yield {
+                "name": e["phase"],
+                "cat": e["lang"] or "m5r",
+                "ph": "X",
+                "ts": e["start_ns"] / 1000,
+                "dur": (e["end_ns"] - e["start_ns"]) / 1000,
+                "pid": pid,
+                # One row per block in the viewer, run-level spans on row 0
+                "tid": (e["block"] + 1) if e["block"] is not None else 0,
+                "args": dict(e["args"], block=e["block"]),
+            }
+
+    def export(self, path):
+        with self._lock:
+            events = list(self.events)
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith(".jsonl"):
+                for e in events:
+                    f.write(json.dumps(e) + "\n")
+            else:
+                json.dump({"traceEvents": list(self.chrome_events(events)), "displayTimeUnit": "ms"}, f)
+
+_recorder = None
+
+def enable(path=None):
+    """Start recording (if not already) and return the recorder. With a path,
+    the trace is written there when the process exits."""
+    global _recorder
+    if _recorder is None:
+        _recorder = TraceRecorder()
+        if path:
+            atexit.register(_recorder.export, path)
+    return _recorder
+
+def disable():
+    """Stop recording and drop what was recorded"""
+    global _recorder
+    _recorder = None
+
+def enabled():
+    return _recorder is not None
+
+def set_block(block):
+    if _recorder is not None:
+        _recorder.set_block(block)
+
+def current_block():
+    return _recorder.current_block() if _recorder is not None else None
+
+def span(phase, **args):
+    if _recorder is None:
+        return _NULL_SPAN
+    return Span(_recorder, phase, args)
+
+def block_span(block, phase, **args):
+    """span() for work done for block on another thread (Engine's event loop)"""
+    if _recorder is None:
+        return _NULL_SPAN
+    return Span(_recorder, phase, args, block)
+
+def export(path):
+    if _recorder is not None:
+        _recorder.export(path)
+
+if os.environ.get("M5R_TRACE"):
+    enable(os.environ["M5R_TRACE"])
@@ -0,0 +1,102 @@
+import os
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+
+# Waiting for a file to be saved. On Linux an inotify watch on the file's
+# directory wakes us as soon as an editor writes or renames the file into
+# place; everywhere else (or if inotify isn't available) the file is
+# stat()ed every POLL_INTERVAL seconds.
+
+POLL_INTERVAL = float(os.environ.get("M5R_WATCH_INTERVAL", "0.25"))
+DEBOUNCE = 0.05  # editors often write a file in several steps
+
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+_EVENT = struct.Struct("iIII")
+
+def _libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+def signature(path):
+    """What a save changes: inode (editors that rename), mtime and size"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+class FileWatcher:
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.last = signature(self.path)
+        self.fd = None
+        libc = _libc() if os.name == "posix" else None
+        if libc is not None:
+            fd = libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+            if fd >= 0:
+                mask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+                directory = os.path.dirname(self.path).encode()
+                if libc.inotify_add_watch(fd, directory, mask) >= 0:
+                    self.fd = fd
+                else:
+                    os.close(fd)
+
+    @property
+    def mode(self):
+        return "inotify" if self.fd is not None else "polling"
+
+    def _drain(self):
+        """Read pending inotify events; True if any was about our file"""
+        name = os.path.basename(self.path).encode()
+        ours = False
+        while True:
+            try:
+                buf = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return ours
+            off = 0
+            while off < len(buf):
+                _, _, _, length = _EVENT.unpack_from(buf, off)
+                event_name = buf[off + _EVENT.size:off + _EVENT.size + length].rstrip(b"\0")
+                ours = ours or event_name == name
+                off += _EVENT.size + length
+
+    def wait(self):
+        """Block until the file has been saved with a new signature"""
+        while True:
+            if self.fd is not None:
+                # Keep polling too, as a slow safety net for filesystems
+                # that don't report changes (network mounts)
+                ready, _, _ = select.select([self.fd], [], [], 2.0)
+                if ready and not self._drain():
+                    continue
+            else:
+                time.sleep(POLL_INTERVAL)
+            current = signature(self.path)
+            if current is None or current == self.last:
+                continue
+            time.sleep(DEBOUNCE)
+            if self.fd is not None:
+                self._drain()
+            self.last = signature(self.path)
+            if self.last is not None:
+                return
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
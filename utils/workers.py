@@ -0,0 +1,381 @@
+import os
+import json
+import time
+import atexit
+import select
+import threading
+import subprocess
+
+from utils import trace
+from utils import supervisor
+from utils import channel
+
+# Warm, long-lived interpreters for Python, Node and PHP blocks. Each worker
+# reads one JSON job per line on stdin and answers with one JSON line
+# ({"stdout", "stderr", "rc"}) on a separate pipe whose fd number is passed
+# in M5R_WORKER_FD, so anything the block prints can't corrupt the protocol.
+# Every job gets a fresh global scope and the current run's data channel
+# (see utils/channel.py) in M5R_CHANNEL. Workers are recycled after
+# MAX_JOBS jobs or once their RSS passes MAX_RSS_MB.
+#
+# Turn it on with M5R_WORKERS=1 (POSIX only, it needs pass_fds).
+
+WORKERS_ENABLED = os.environ.get("M5R_WORKERS") == "1" and os.name == "posix"
+MAX_JOBS = int(os.environ.get("M5R_WORKER_MAX_JOBS", "100"))
+MAX_RSS_MB = int(os.environ.get("M5R_WORKER_MAX_RSS_MB", "256"))
+
+PY_WORKER = r'''
+import os, sys, json, tempfile, traceback
+fd = int(os.environ["M5R_WORKER_FD"])
+jobs = os.fdopen(os.dup(0), "r", encoding="utf-8")
+null = os.open(os.devnull, os.O_RDONLY)
+os.dup2(null, 0)
+saved_out, saved_err = os.dup(1), os.dup(2)
+home = os.getcwd()
+for line in jobs:
+    job = json.loads(line)
+    cap_out, cap_err = tempfile.TemporaryFile(), tempfile.TemporaryFile()
+    sys.stdout.flush(); sys.stderr.flush()
+    os.dup2(cap_out.fileno(), 1); os.dup2(cap_err.fileno(), 2)
+    rc = 0
+    try:
+        os.chdir(job.get("cwd") or home)
+        if job.get("channel"):
+            os.environ["M5R_CHANNEL"] = job["channel"]
+        else:
+            os.environ.pop("M5R_CHANNEL", None)
+        scope = {"__name__": "__main__", "__builtins__": __builtins__}
+        exec(compile(job["code"], "<m5r block>", "exec"), scope)
+    except SystemExit as e:
+        if isinstance(e.code, int):
+            rc = e.code
+        elif e.code is not None:
+            print(e.code, file=sys.stderr)
+            rc = 1
+    except BaseException:
+        # Drop the worker's own frame so tracebacks look like a normal run
+        etype, value, tb = sys.exc_info()
+        traceback.print_exception(etype, value, tb.tb_next)
+        rc = 1
+    sys.stdout.flush(); sys.stderr.flush()
+    os.dup2(saved_out, 1); os.dup2(saved_err, 2)
+    result = {"rc": rc}
+    for name, cap in (("stdout", cap_out), ("stderr", cap_err)):
+        cap.seek(0)
+        result[name] = cap.read().decode("utf-8", "replace")
+        cap.close()
+    os.write(fd, (json.dumps(result) + "\n").encode("utf-8"))
+'''
+
+JS_WORKER = r'''
+const fs = require('fs'), vm = require('vm'), util = require('util'), readline = require('readline');
+const fd = Number(process.env.M5R_WORKER_FD);
+const home = process.cwd();
+const realOut = process.stdout.write, realErr = process.stderr.write, realExit = process.exit;
+class BlockExit { constructor(code) { this.code = code; } }
+const queue = [];
+let job = null;
+// Timers, sockets, fs requests... pending in the worker ('Immediate' is
+// only ever the settle() check itself)
+const pending = () => process.getActiveResourcesInfo().filter((r) => r !== 'Immediate').length;
+function fail(e) {
+  if (e instanceof BlockExit) job.rc = e.code;
+  else { job.err += (e && e.stack ? e.stack : String(e)) + '\n'; job.rc = 1; }
+}
+function finish(recycle) {
+  process.stdout.write = realOut; process.stderr.write = realErr; process.exit = realExit;
+  fs.writeSync(fd, JSON.stringify({ stdout: job.out, stderr: job.err, rc: job.rc, recycle }) + '\n');
+  // Its leftover callbacks would run into the next job
+  if (recycle) realExit.call(process, 0);
+  job = null;
+  if (queue.length) start(queue.shift());
+}
+// A block is done once what it scheduled (timers, promises, I/O) has run,
+// like node would exit once there's nothing left to do
+function settle() {
+  if (!job) return;
+  if (pending() > job.baseline) setTimeout(() => setImmediate(settle), 1);
+  else finish(false);
+}
+// Thrown from a callback, after the block's own code returned: it would
+// have ended node, so it ends the job. Whatever else the block scheduled
+// is still around, so the worker goes too.
+process.on('uncaughtException', (e) => {
+  if (!job) throw e;
+  fail(e);
+  finish(true);
+});
+process.on('unhandledRejection', (e) => {
+  if (!job) throw e;
+  job.err += 'Uncaught (in promise) ' + (e && e.stack ? e.stack : String(e)) + '\n';
+  job.rc = 1;
+  finish(true);
+});
+function start(line) {
+  job = { out: '', err: '', rc: 0 };
+  const spec = JSON.parse(line);
+  process.stdout.write = (c) => { job.out += String(c); return true; };
+  process.stderr.write = (c) => { job.err += String(c); return true; };
+  process.exit = (code) => { throw new BlockExit(code || 0); };
+  const log = (...a) => { job.out += util.format(...a) + '\n'; };
+  const warn = (...a) => { job.err += util.format(...a) + '\n'; };
+  const sandbox = {
+    console: { log, info: log, debug: log, error: warn, warn },
+    require, process, Buffer, setTimeout, setInterval, clearTimeout, clearInterval,
+    setImmediate, clearImmediate, queueMicrotask,
+  };
+  job.baseline = pending();
+  try {
+    process.chdir(spec.cwd || home);
+    if (spec.channel) process.env.M5R_CHANNEL = spec.channel; else delete process.env.M5R_CHANNEL;
+    vm.runInNewContext(spec.code, sandbox, { filename: 'block.js' });
+  } catch (e) {
+    fail(e);
+    // exit() and errors end node there and then, callbacks never run
+    finish(pending() > job.baseline);
+    return;
+  }
+  setImmediate(settle);
+}
+readline.createInterface({ input: process.stdin }).on('line', (line) => {
+  if (job) queue.push(line); else start(line);
+});
+'''
+
+PHP_WORKER = r'''<?php
+$m5r_fd = fopen('php://fd/' . getenv('M5R_WORKER_FD'), 'w');
+$m5r_home = getcwd();
+$m5r_job = null;
+$m5r_err = '';
+function m5r_reply($out, $rc, $recycle) {
+    global $m5r_fd, $m5r_err;
+    fwrite($m5r_fd, json_encode(
+        ['stdout' => $out, 'stderr' => $m5r_err, 'rc' => $rc, 'recycle' => $recycle],
+        JSON_INVALID_UTF8_SUBSTITUTE
+    ) . "\n");
+    fflush($m5r_fd);
+}
+// How php itself labels each error level
+function m5r_error_label($no) {
+    switch ($no) {
+        case E_WARNING: case E_USER_WARNING: case E_CORE_WARNING: case E_COMPILE_WARNING:
+            return 'Warning';
+        case E_NOTICE: case E_USER_NOTICE:
+            return 'Notice';
+        case E_DEPRECATED: case E_USER_DEPRECATED:
+            return 'Deprecated';
+        case E_RECOVERABLE_ERROR:
+            return 'Recoverable fatal error';
+        default:
+            return 'Fatal error';
+    }
+}
+// exit() or a fatal error inside a block ends the worker, answer for it
+// before we go. A null rc tells the pool to take the worker's exit status.
+register_shutdown_function(function () {
+    global $m5r_job, $m5r_err;
+    if ($m5r_job !== null) {
+        $e = error_get_last();
+        if ($e !== null && ($e['type'] & (E_ERROR | E_PARSE | E_CORE_ERROR | E_COMPILE_ERROR))) {
+            $m5r_err .= "PHP Fatal error:  {$e['message']} on line {$e['line']}\n";
+        }
+        m5r_reply(ob_get_clean(), null, true);
+    }
+});
+while (($line = fgets(STDIN)) !== false) {
+    $m5r_job = json_decode($line, true);
+    $m5r_err = '';
+    $before = count(get_defined_functions()['user']) + count(get_declared_classes());
+    $m5r_failed = false;
+    error_clear_last();
+    set_error_handler(function ($no, $str, $file, $ln) {
+        global $m5r_err, $m5r_failed;
+        if (!(error_reporting() & $no)) {
+            return true;  // silenced with @
+        }
+        $m5r_err .= 'PHP ' . m5r_error_label($no) . ":  $str on line $ln\n";
+        if ($no & (E_USER_ERROR | E_RECOVERABLE_ERROR)) {
+            $m5r_failed = true;
+        }
+        return true;
+    });
+    chdir($m5r_job['cwd'] ?: $m5r_home);
+    putenv($m5r_job['channel'] ? 'M5R_CHANNEL=' . $m5r_job['channel'] : 'M5R_CHANNEL');
+    $rc = 0;
+    ob_start();
+    try {
+        (function ($code) { eval('?>' . "<?php\n" . $code . "\n?>"); })($m5r_job['code']);
+    } catch (Throwable $e) {
+        $m5r_err .= "PHP Fatal error:  Uncaught " . get_class($e) . ": " . $e->getMessage() . "\n";
+        $rc = 255;
+    }
+    if ($m5r_failed) {
+        $rc = 255;
+    }
+    $out = ob_get_clean();
+    restore_error_handler();
+    $m5r_job = null;
+    // Declared functions/classes outlive the job and would clash on the
+    // next run, so a worker that gained any is retired
+    $after = count(get_defined_functions()['user']) + count(get_declared_classes());
+    m5r_reply($out, $rc, $after != $before);
+}
+'''
+
+WORKER_COMMANDS = {
+    "py": ["python", "-c", PY_WORKER],
+    "js": ["node", "-e", JS_WORKER],
+    "php": ["php", "-r", "require_once %s;" % json.dumps(channel.PHP_HELPER) + PHP_WORKER[len("<?php"):]],
+}
+
+class WorkerError(Exception):
+    pass
+
+class Worker:
+    def __init__(self, lang):
+        self.lang = lang
+        self.jobs = 0
+        self.recycle = False
+        read_fd, write_fd = os.pipe()
+        env = dict(channel.child_env(), M5R_WORKER_FD=str(write_fd))
+        try:
+            self.proc = subprocess.Popen(
+                WORKER_COMMANDS[lang],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                pass_fds=(write_fd,),
+                env=env,
+                # Own process group, but no rlimits: RLIMIT_CPU would add
+                # up over every job the worker ever runs
+                **supervisor.popen_kwargs(limits=False),
+            )
+        except BaseException:
+            os.close(read_fd)
+            raise
+        finally:
+            os.close(write_fd)
+        self.reply_fd = read_fd
+        self._buffer = b""
+
+    def rss_mb(self):
+        try:
+            with open(f"/proc/{self.proc.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return 0
+
+    def _read_reply(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while b"\n" not in self._buffer:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError
+            ready, _, _ = select.select([self.reply_fd], [], [], remaining)
+            if not ready:
+                raise TimeoutError
+            chunk = os.read(self.reply_fd, 65536)
+            if not chunk:
+                raise WorkerError(f"{self.lang} worker exited")
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return json.loads(line)
+
+    def run(self, code, timeout, cwd=None):
+        self.jobs += 1
+        try:
+            self.proc.stdin.write((json.dumps({"code": code, "cwd": cwd, "channel": channel.current()}) + "\n").encode("utf-8"))
+            self.proc.stdin.flush()
+        except OSError:
+            raise WorkerError(f"{self.lang} worker exited")
+        reply = self._read_reply(timeout)
+        self.recycle = bool(reply.get("recycle"))
+        rc = reply["rc"]
+        if rc is None:
+            # The block ended the worker (PHP's exit() or a fatal error),
+            # whose exit status is then the block's
+            try:
+                rc = self.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                rc = 255
+        return reply["stdout"], reply["stderr"], rc
+
+    def worn_out(self):
+        return (
+            self.recycle
+            or self.proc.poll() is not None
+            or self.jobs >= MAX_JOBS
+            or self.rss_mb() > MAX_RSS_MB
+        )
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        os.close(self.reply_fd)
+
+class WorkerPool:
+    def __init__(self):
+        self._idle = {lang: [] for lang in WORKER_COMMANDS}
+        self._lock = threading.Lock()
+
+    def _checkout(self, lang):
+        with self._lock:
+            if self._idle[lang]:
+                return self._idle[lang].pop()
+        return Worker(lang)
+
+    def _checkin(self, worker):
+        if worker.worn_out():
+            worker.close()
+            return
+        with self._lock:
+            self._idle[worker.lang].append(worker)
+
+    def run(self, lang, code, timeout=8, cwd=None):
+        """Run one block on a warm worker; same (stdout, stderr, rc) shape as safe_run"""
+        try:
+            with trace.span("spawn", worker=lang):
+                worker = self._checkout(lang)
+        except FileNotFoundError:
+            return "", f"[ERROR: Not installed: {WORKER_COMMANDS[lang][0]}]", 1
+        try:
+            with supervisor.admission(), trace.span("run", worker=lang, worker_jobs=worker.jobs) as sp:
+                result = worker.run(code, timeout, cwd)
+                sp.set(stdout_bytes=len(result[0]), stderr_bytes=len(result[1]), rc=result[2])
+        except TimeoutError:
+            supervisor.kill_group(worker.proc)
+            worker.close()
+            return "", "[ERROR: timed out]", 1
+        except WorkerError as e:
+            supervisor.kill_group(worker.proc)
+            worker.close()
+            return "", f"[ERROR: {e}]", 1
+        self._checkin(worker)
+        return result
+
+    def close(self):
+        with self._lock:
+            workers = [w for idle in self._idle.values() for w in idle]
+            for idle in self._idle.values():
+                idle.clear()
+        for worker in workers:
+            worker.close()
+
+_pool = None
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = WorkerPool()
+        atexit.register(_pool.close)
+    return _pool
@@ -0,0 +1,311 @@
+import os
+import json
+import time
+import atexit
+import select
+import signal
+import socket
+import threading
+import subprocess
+
+from utils import supervisor
+from utils import channel
+
+# Fork server for Python blocks. One "zygote" interpreter is started per
+# process, imports PRELOAD and then fork()s a child for every <?py block.
+# The child starts with those modules already imported, shared copy-on-write
+# with the zygote and every other child, and runs the block on its own
+# stdio pipes, in its own session, under the usual rlimits. The rest of the
+# interpreter sees a child as a Popen (ZygoteProcess), so output capture,
+# streaming, timeouts and group kills work just like for a fresh python.
+#
+# Requests go over a Unix socket: one byte that carries the job's fds (a
+# reply socket and the write ends of its stdout/stderr pipes) as
+# SCM_RIGHTS, then the job as a JSON line on the reply socket. The zygote
+# answers there with {"pid"} once it has forked and {"rc"} once the child
+# has exited.
+#
+# Turn it on with M5R_ZYGOTE=1 (POSIX only). M5R_ZYGOTE_PRELOAD is the
+# comma separated list of modules to import up front. Modules that start
+# threads when imported don't survive fork() and don't belong in it.
+
+ZYGOTE_ENABLED = (
+    os.environ.get("M5R_ZYGOTE") == "1"
+    and hasattr(os, "fork")
+    and hasattr(socket, "send_fds")
+)
+DEFAULT_PRELOAD = "math,random,json,re,datetime,collections,itertools,functools,decimal,fractions,statistics"
+PRELOAD = [name.strip() for name in os.environ.get("M5R_ZYGOTE_PRELOAD", DEFAULT_PRELOAD).split(",") if name.strip()]
+START_TIMEOUT = 10
+
+ZYGOTE_SERVER = r'''
+import os, sys, json, signal, select, socket, resource, importlib, traceback
+control = socket.socket(fileno=int(os.environ.pop("M5R_ZYGOTE_FD")))
+for name in json.loads(os.environ.pop("M5R_ZYGOTE_PRELOAD")):
+    try:
+        importlib.import_module(name)
+    except Exception:
+        pass
+wake_r, wake_w = os.pipe()
+os.set_blocking(wake_w, False)
+signal.set_wakeup_fd(wake_w)
+signal.signal(signal.SIGCHLD, lambda *_: None)
+children = {}
+
+def send(sock, message):
+    try:
+        sock.sendall((json.dumps(message) + "\n").encode("utf-8"))
+    except OSError:
+        pass
+
+def read_job(sock):
+    data = b""
+    while not data.endswith(b"\n"):
+        chunk = sock.recv(65536)
+        if not chunk:
+            return None
+        data += chunk
+    return json.loads(data)
+
+def child(job, out_fd, err_fd):
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    os.setsid()
+    os.dup2(out_fd, 1)
+    os.dup2(err_fd, 2)
+    # Nothing of the zygote's (control socket, other jobs' sockets) stays open
+    os.closerange(3, resource.getrlimit(resource.RLIMIT_NOFILE)[0])
+    for res, soft, hard in job["limits"]:
+        resource.setrlimit(res, (soft, hard))
+    os.environ.clear()
+    os.environ.update(job["env"])
+    rc = 0
+    try:
+        if job["cwd"]:
+            os.chdir(job["cwd"])
+        exec(compile(job["code"], "<m5r block>", "exec"), {"__name__": "__main__", "__builtins__": __builtins__})
+    except SystemExit as e:
+        if isinstance(e.code, int):
+            rc = e.code
+        elif e.code is not None:
+            print(e.code, file=sys.stderr)
+            rc = 1
+    except BaseException:
+        etype, value, tb = sys.exc_info()
+        traceback.print_exception(etype, value, tb.tb_next)
+        rc = 1
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    except Exception:
+        pass
+    os._exit(rc)
+
+def reap():
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        reply = children.pop(pid, None)
+        if reply is not None:
+            send(reply, {"rc": os.waitstatus_to_exitcode(status)})
+            reply.close()
+
+while True:
+    ready, _, _ = select.select([control, wake_r], [], [])
+    if wake_r in ready:
+        os.read(wake_r, 4096)
+        reap()
+    if control not in ready:
+        continue
+    msg, fds, _, _ = socket.recv_fds(control, 1, 3)
+    if not msg:
+        break
+    reply = socket.socket(fileno=fds[0])
+    try:
+        job = read_job(reply)
+    except (OSError, ValueError):
+        job = None
+    if job is None:
+        reply.close()
+        os.close(fds[1])
+        os.close(fds[2])
+        continue
+    pid = os.fork()
+    if pid == 0:
+        child(job, fds[1], fds[2])
+    os.close(fds[1])
+    os.close(fds[2])
+    children[pid] = reply
+    send(reply, {"pid": pid})
+'''
+
+class ZygoteError(Exception):
+    pass
+
+class ZygoteProcess:
+    """A block running in a child of the zygote, with the parts of Popen
+    that safe_run, stream_run and the supervisor use"""
+
+    stdin = None
+
+    def __init__(self, args, reply, stdout, stderr):
+        self.args = args
+        self.reply = reply
+        self.stdout = stdout
+        self.stderr = stderr
+        self.pid = None
+        self.returncode = None
+        self._buffer = b""
+        self._lock = threading.Lock()
+
+    def _read(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while b"\n" not in self._buffer:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            ready, _, _ = select.select([self.reply], [], [], remaining)
+            if not ready:
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            chunk = self.reply.recv(65536)
+            if not chunk:
+                raise ZygoteError("zygote exited")
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return json.loads(line)
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.returncode is None:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            # The reaper thread may be waiting too, whoever reads the
+            # reply shares it
+            if not self._lock.acquire(timeout=-1 if remaining is None else remaining):
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            try:
+                if self.returncode is None:
+                    try:
+                        self.returncode = self._read(remaining)["rc"]
+                    except ZygoteError:
+                        # Its parent is gone, so its exit status is too
+                        self.returncode = -signal.SIGKILL
+                    # Nothing more comes on it; not everyone uses this as a
+                    # context manager (_stream_run doesn't)
+                    self.reply.close()
+            finally:
+                self._lock.release()
+        return self.returncode
+
+    def poll(self):
+        try:
+            return self.wait(0)
+        except subprocess.TimeoutExpired:
+            return None
+
+    def kill(self):
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stdout.close()
+        self.stderr.close()
+        try:
+            self.wait()
+        finally:
+            self.reply.close()
+        return False
+
+class Zygote:
+    def __init__(self):
+        mine, theirs = socket.socketpair()
+        env = dict(channel.child_env(), M5R_ZYGOTE_FD=str(theirs.fileno()), M5R_ZYGOTE_PRELOAD=json.dumps(PRELOAD))
+        try:
+            self.proc = subprocess.Popen(
+                ["python", "-c", ZYGOTE_SERVER],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                pass_fds=(theirs.fileno(),),
+                env=env,
+                # Its children get the rlimits, not the zygote itself
+                **supervisor.popen_kwargs(limits=False),
+            )
+        except BaseException:
+            mine.close()
+            raise
+        finally:
+            theirs.close()
+        self.control = mine
+        self._lock = threading.Lock()
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def spawn(self, code, args, env=None, cwd=None):
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        reply, theirs = socket.socketpair()
+        job = {
+            "code": code,
+            "env": env or channel.child_env(),
+            "cwd": cwd,
+            "limits": [[res, soft, hard] for res, (soft, hard) in supervisor.rlimits()],
+        }
+        try:
+            with self._lock:
+                socket.send_fds(self.control, [b"j"], [theirs.fileno(), out_w, err_w])
+            reply.sendall((json.dumps(job) + "\n").encode("utf-8"))
+        except OSError as e:
+            reply.close()
+            os.close(out_r)
+            os.close(err_r)
+            raise ZygoteError(f"zygote unavailable ({e})")
+        finally:
+            theirs.close()
+            os.close(out_w)
+            os.close(err_w)
+        proc = ZygoteProcess(args, reply, os.fdopen(out_r, "rb"), os.fdopen(err_r, "rb"))
+        try:
+            proc.pid = proc._read(START_TIMEOUT)["pid"]
+        except (subprocess.TimeoutExpired, ZygoteError):
+            proc.stdout.close()
+            proc.stderr.close()
+            reply.close()
+            raise ZygoteError("zygote did not start the block")
+        return proc
+
+    def close(self):
+        self.control.close()
+        try:
+            self.proc.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+
+_zygote = None
+_zygote_lock = threading.Lock()
+
+def get_zygote():
+    global _zygote
+    with _zygote_lock:
+        if _zygote is not None and not _zygote.alive():
+            _zygote.close()
+            _zygote = None
+        if _zygote is None:
+            _zygote = Zygote()
+            atexit.register(_zygote.close)
+        return _zygote
+
+def popen(code):
+    """Stand-in for subprocess.Popen that runs code in a zygote child, for
+    safe_run()/execute()'s popen="""
+    def start(args, env=None, cwd=None, **ignored):
+        return get_zygote().spawn(code, args, env, cwd)
+    return start